@@ -0,0 +1,225 @@
+"""Benchmark end-to-end: IMAP palsu -> EmailForwarderBot.process_new_emails -> mock Bot API.
+
+    python bench/bench_delivery.py --users 100 --emails 10 --latency 0.05 --retry-rate 0.02 --failure-rate 0.01
+    python bench/bench_delivery.py --output baseline.json
+    python bench/bench_delivery.py --compare baseline.json
+
+Bot dijalankan di direktori sementara (approved_users.json, bot_settings.json, database antrian)
+dengan N user palsu. Laporan: waktu sampai penerima pertama/terakhir per email (dihitung dari
+awal poll), tingkat retry (429 + error 5xx), dan OTP yang hilang atau terkirim ganda.
+OTP yang hilang selalu membuat benchmark gagal (exit 1).
+"""
+import os
+import sys
+import json
+import time
+import email
+import asyncio
+import imaplib
+import shutil
+import logging
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from rate_limit import RateLimiter, GLOBAL_RATE
+
+from corpus import build_corpus
+from fake_imap import FakeIMAPServer
+from mock_bot_api import MockBotAPI
+from report import summarize_ms, finish, add_report_arguments
+
+TOKEN = "123456:MOCK-TOKEN-FOR-BENCHMARK-ONLY-000000"
+OWNER_ID = 1
+FIRST_USER_ID = 100000
+
+# Arah metrik yang lebih baik, untuk --compare
+RULES = {
+    "time_to_first.p50_ms": "lower",
+    "time_to_last.p50_ms": "lower",
+    "time_to_last.p95_ms": "lower",
+    "delivery.retry_rate": "lower",
+    "delivery.lost": "lower",
+    "delivery.duplicates": "lower",
+}
+
+
+def otp_code(raw):
+    """Kode OTP corpus ada di akhir subjek ("Your one-time passcode is 123456")"""
+    return email.message_from_bytes(raw)["Subject"].split()[-1]
+
+
+def write_state(directory, imap_port, users, pinned):
+    approved = {}
+    for index, user_id in enumerate(users):
+        record = {"expires_at": None}
+        if index < pinned:
+            record["delivery_mode"] = "pinned"
+        approved[str(user_id)] = record
+    with open(os.path.join(directory, "approved_users.json"), 'w') as f:
+        json.dump(approved, f)
+
+    from settings_store import DEFAULT_SETTINGS
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update({
+        "email_host": "127.0.0.1",
+        "email_port": imap_port,
+        "email_username": "bench@example.com",
+        "email_password": "bench",
+        "coalesce_ms": 0,
+    })
+    with open(os.path.join(directory, "bot_settings.json"), 'w') as f:
+        json.dump(settings, f)
+
+
+def first_deliveries(api):
+    """{(chat_id, kode): waktu pertama} dan jumlah pesan ganda per pasangan"""
+    first = {}
+    duplicates = 0
+    for delivery in api.deliveries:
+        if delivery["method"] not in ("sendMessage", "editMessageText"):
+            continue
+        for code in delivery.get("codes", ()):
+            key = (delivery["chat_id"], code)
+            if key in first:
+                if delivery["method"] == "sendMessage":
+                    duplicates += 1
+            else:
+                first[key] = delivery["at"]
+    return first, duplicates
+
+
+def tag_codes(api, codes):
+    """Tandai kode OTP yang muncul di teks setiap pesan (sekali per pesan)"""
+    for delivery in api.deliveries:
+        if "codes" not in delivery:
+            delivery["codes"] = [code for code in codes if code in (delivery["text"] or "")]
+
+
+async def main(args):
+    logging.disable(logging.INFO)
+    imaplib.IMAP4_SSL = lambda host, port, *a, **kw: imaplib.IMAP4(host, port)
+
+    corpus = [raw for _, raw in build_corpus(otp=args.emails, newsletters=0, attachments=0, charsets=0,
+                                             seed=args.seed)]
+    codes = [otp_code(raw) for raw in corpus]
+    users = [FIRST_USER_ID + i for i in range(args.users)]
+    pinned = int(args.users * args.pinned)
+
+    api = MockBotAPI(latency=args.latency, jitter=args.jitter, retry_rate=args.retry_rate,
+                     retry_after=args.retry_after, failure_rate=args.failure_rate, seed=args.seed)
+    base_url = await api.start(port=args.port)
+    imap = FakeIMAPServer()
+    imap_port = imap.start_in_thread()
+
+    workdir = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="bench-delivery-")
+    os.chdir(directory)
+    write_state(directory, imap_port, users, pinned)
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_OWNER_ID": str(OWNER_ID),
+        "TELEGRAM_API_BASE_URL": base_url,
+    })
+
+    from telegram_bot import EmailForwarderBot
+    bot = EmailForwarderBot()
+    if args.global_rate != GLOBAL_RATE:
+        bot.dispatcher.limiter = RateLimiter(global_rate=args.global_rate)
+    await bot.application.initialize()
+    bot.dispatcher.start()
+
+    report = {
+        "users": args.users, "pinned_users": pinned, "emails": args.emails, "batch": args.batch,
+        "latency": args.latency, "retry_rate": args.retry_rate, "failure_rate": args.failure_rate,
+        "global_rate": args.global_rate,
+    }
+    polled_at = {}
+    started = time.perf_counter()
+    try:
+        for offset in range(0, len(corpus), args.batch):
+            for raw in corpus[offset:offset + args.batch]:
+                imap.mailbox.add(raw)
+            poll_started = time.perf_counter()
+            await bot.process_new_emails()
+            for code in codes[offset:offset + args.batch]:
+                polled_at[code] = poll_started
+            await asyncio.sleep(args.poll_interval)
+
+        # Pengguna pinned hanya dijamin menerima OTP terbaru (OTP lama di-edit/ditimpa)
+        expected = {(str(uid), code) for uid in users[pinned:] for code in codes}
+        expected |= {(str(uid), codes[-1]) for uid in users[:pinned]}
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline:
+            tag_codes(api, codes)
+            first, _ = first_deliveries(api)
+            if expected <= set(first):
+                break
+            await asyncio.sleep(0.1)
+        total_seconds = time.perf_counter() - started
+    finally:
+        await bot.dispatcher.stop()
+        await bot.persistence.flush()
+        bot.latency.flush()
+        await bot.application.shutdown()
+        bot.email_reader.disconnect()
+        imap.stop_thread()
+        await api.stop()
+        os.chdir(workdir)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    tag_codes(api, codes)
+    first, duplicates = first_deliveries(api)
+    lost = expected - set(first)
+    to_first, to_last = [], []
+    for code in codes:
+        times = [first[(str(uid), code)] for uid in users if (str(uid), code) in first]
+        if times and code in polled_at:
+            to_first.append(min(times) - polled_at[code])
+            to_last.append(max(times) - polled_at[code])
+
+    sends = api.stats["sendMessage"] + api.stats["editMessageText"] + api.stats["sendDocument"]
+    report["seconds"] = round(total_seconds, 3)
+    report["time_to_first"] = summarize_ms(to_first)
+    report["time_to_last"] = summarize_ms(to_last)
+    report["delivery"] = {
+        "expected": len(expected),
+        "delivered": len(expected) - len(lost),
+        "lost": len(lost),
+        "duplicates": duplicates,
+        "requests": sends,
+        "retry_after": api.stats["retry_after"],
+        "failures": api.stats["failures"],
+        "retry_rate": round((api.stats["retry_after"] + api.stats["failures"]) / sends, 4) if sends else 0.0,
+        "messages_per_sec": round(len(expected) / total_seconds, 2) if total_seconds else None,
+    }
+    report["dispatcher"] = dict(bot.dispatcher.stats)
+
+    failures = []
+    if lost:
+        sample = ", ".join(f"{chat}:{code}" for chat, code in sorted(lost)[:5])
+        failures.append(f"{len(lost)} OTP tidak sampai dalam {args.timeout} detik (contoh: {sample})")
+    finish(report, args, RULES, failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pengiriman end-to-end ke mock Bot API")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--emails', type=int, default=10, help="Jumlah email OTP")
+    parser.add_argument('--batch', type=int, default=1, help="Email baru per poll")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="Jeda antar poll (detik)")
+    parser.add_argument('--pinned', type=float, default=0.0, help="Porsi user dengan /pinmode on (0-1)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Latency mock Bot API (detik)")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--retry-rate', type=float, default=0.0, help="Peluang 429 per pesan")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Peluang 502 per pesan")
+    parser.add_argument('--global-rate', type=float, default=GLOBAL_RATE,
+                        help="Batas pesan/detik global (Telegram: ~30)")
+    parser.add_argument('--timeout', type=float, default=300, help="Batas tunggu semua OTP terkirim (detik)")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--seed', type=int, default=1)
+    add_report_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,195 @@
+"""Micro-benchmark ekstraksi OTP dari HTML terhadap golden corpus (bench/golden).
+
+    python bench/bench_extract.py
+    python bench/bench_extract.py --output baseline.json
+    python bench/bench_extract.py --compare baseline.json     # exit 1 jika lebih lambat > 20% atau ada OTP salah baru
+
+Setiap email di golden corpus (HTML anonim bergaya Airwallex, bank, Google, Microsoft) diberi label
+OTP yang benar di labels.json (null = email tanpa OTP). Backend yang diukur:
+    bs4    - EmailReader.extract_content_by_css (jalur yang dipakai bot sekarang)
+    lxml   - lxml.html + pencarian konteks tabel/div yang sama
+    regex  - buang tag dengan regex, tanpa parse DOM (konteks hanya 100 karakter di sekitar OTP)
+
+Waktu parse per email adalah waktu tercepat dari --repeat kali parse (seperti timeit, paling stabil
+antar run). Dengan --compare, email yang benar
+di baseline tetapi salah sekarang selalu membuat benchmark gagal (tanpa toleransi).
+"""
+import os
+import re
+import sys
+import json
+import html
+import time
+import logging
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import lxml.html
+from lxml import etree
+
+from email_reader import EmailReader
+from settings_store import SettingsStore
+
+from report import summarize_ms, finish, add_report_arguments
+
+GOLDEN_DIR = os.path.join(BENCH_DIR, "golden")
+BACKENDS = ("bs4", "lxml", "regex")
+
+# Pola OTP yang sama dengan EmailReader
+OTP_PATTERN = re.compile(r'\b\d{6}\b')
+STRIP_BLOCKS = re.compile(r'<(script|style|head)\b.*?</\1\s*>|<!--.*?-->', re.S | re.I)
+TAG = re.compile(r'<[^>]+>')
+
+# Arah metrik yang lebih baik, untuk --compare
+RULES = {}
+for _backend in BACKENDS:
+    RULES[f"backends.{_backend}.accuracy"] = "higher"
+    RULES[f"backends.{_backend}.parse.p50_ms"] = "lower"
+    RULES[f"backends.{_backend}.parse.p95_ms"] = "lower"
+
+
+def load_golden(directory=GOLDEN_DIR):
+    """Daftar label dari labels.json beserta isi HTML-nya"""
+    with open(os.path.join(directory, "labels.json")) as f:
+        labels = json.load(f)
+    for label in labels:
+        with open(os.path.join(directory, label["file"]), encoding='utf-8') as f:
+            label["html"] = f.read()
+    return labels
+
+
+def _result(full_text, otp_code, otp_context):
+    return {
+        "full_content": full_text,
+        "otp_found": otp_code is not None,
+        "otp_code": otp_code,
+        "otp_context": otp_context,
+    }
+
+
+def _window(full_text, otp_code):
+    otp_pos = full_text.find(otp_code)
+    return full_text[max(0, otp_pos - 100):otp_pos + len(otp_code) + 100]
+
+
+def _lxml_text(element):
+    return '\n'.join(text.strip() for text in element.itertext() if text.strip())
+
+
+def extract_lxml(html_content):
+    """Setara extract_content_by_css, tetapi parse dengan lxml.html"""
+    root = lxml.html.fromstring(html_content)
+    etree.strip_elements(root, etree.Comment, 'script', 'style', with_tail=False)
+    full_text = _lxml_text(root)
+    match = OTP_PATTERN.search(full_text)
+    if not match:
+        return _result(full_text, None, None)
+
+    otp_code = match.group(0)
+    otp_context = _window(full_text, otp_code)
+    for table in root.iter('table'):
+        table_text = _lxml_text(table)
+        if otp_code in table_text:
+            return _result(full_text, otp_code, table_text)
+    for div in root.iter('div'):
+        div_text = _lxml_text(div)
+        if otp_code in div_text and len(div_text) < 500:
+            return _result(full_text, otp_code, div_text)
+    return _result(full_text, otp_code, otp_context)
+
+
+def extract_regex(html_content):
+    """Tanpa parser HTML: buang script/style/komentar dan tag, lalu cari OTP"""
+    text = TAG.sub('\n', STRIP_BLOCKS.sub('', html_content))
+    full_text = '\n'.join(line.strip() for line in html.unescape(text).splitlines() if line.strip())
+    match = OTP_PATTERN.search(full_text)
+    if not match:
+        return _result(full_text, None, None)
+    return _result(full_text, match.group(0), _window(full_text, match.group(0)))
+
+
+def make_extractors(directory):
+    path = os.path.join(directory, "settings.json")
+    with open(path, 'w') as f:
+        json.dump({}, f)
+    reader = EmailReader(SettingsStore(path))
+    return {
+        "bs4": reader.extract_content_by_css,
+        "lxml": extract_lxml,
+        "regex": extract_regex,
+    }
+
+
+def measure(extract, html_content, repeat):
+    """Waktu parse tercepat (detik) dan hasil parse terakhir"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = extract(html_content)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def correctness_regressions(report, baseline, expected):
+    """Email yang benar di baseline tetapi salah sekarang (tanpa toleransi)"""
+    failures = []
+    for backend, results in report["results"].items():
+        previous = baseline.get("results", {}).get(backend, {})
+        for name, found in results.items():
+            if name in previous and previous[name] == expected.get(name) and found != expected.get(name):
+                failures.append(f"{backend} {name}: OTP {expected.get(name)} sekarang terbaca {found}")
+    return failures
+
+
+def main(args):
+    logging.disable(logging.INFO)
+    labels = load_golden(args.golden)
+    expected = {label["file"]: label["otp"] for label in labels}
+    providers = {}
+    for label in labels:
+        providers[label["provider"]] = providers.get(label["provider"], 0) + 1
+
+    report = {
+        "corpus": {"emails": len(labels), "providers": providers},
+        "repeat": args.repeat,
+        "backends": {},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        extractors = make_extractors(directory)
+        for backend in args.backends:
+            extract = extractors[backend]
+            extract(labels[0]["html"])  # pemanasan (import/cache regex)
+            timings = []
+            results = {}
+            for label in labels:
+                elapsed, result = measure(extract, label["html"], args.repeat)
+                timings.append(elapsed)
+                results[label["file"]] = result["otp_code"]
+            wrong = [name for name, found in results.items() if found != expected[name]]
+            report["backends"][backend] = {
+                "accuracy": round((len(labels) - len(wrong)) / len(labels), 4),
+                "correct": len(labels) - len(wrong),
+                "wrong": wrong,
+                "parse": summarize_ms(timings),
+            }
+            report["results"][backend] = results
+
+    failures = []
+    if args.compare:
+        with open(args.compare) as f:
+            failures = correctness_regressions(report, json.load(f), expected)
+    finish(report, args, RULES, failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ekstraksi OTP terhadap golden corpus")
+    parser.add_argument('--golden', default=GOLDEN_DIR, help="Direktori golden corpus (berisi labels.json)")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=50, help="Jumlah parse per email (diambil yang tercepat)")
+    add_report_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+"""Benchmark fan-out: waktu sampai penerima terakhir, loop sequential vs DeliveryDispatcher.
+
+    python bench/bench_fanout.py --users 300 --latency 0.1
+
+Jalur dispatcher sama dengan produksi: pesan masuk DeliveryQueue (SQLite sementara) lalu
+dikirim worker DeliveryDispatcher dengan RateLimiter.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+
+from rate_limit import RateLimiter, GLOBAL_RATE
+from delivery_queue import DeliveryQueue, DeliveryDispatcher, DELIVERY_WORKERS, PRIORITY_OTP
+from http_pool import PooledRequest
+from mock_bot_api import MockBotAPI
+
+TOKEN = "123456:MOCK-TOKEN-FOR-BENCHMARK-ONLY-000000"
+
+
+async def run_sequential(bot, chat_ids, text):
+    start = time.perf_counter()
+    for chat_id in chat_ids:
+        await bot.send_message(chat_id=chat_id, text=text)
+    return time.perf_counter() - start
+
+
+async def run_dispatcher(bot, chat_ids, text, workers, global_rate, directory):
+    queue = DeliveryQueue(os.path.join(directory, "outbox.db"))
+
+    async def send(item):
+        sent = await bot.send_message(chat_id=item["chat_id"], text=item["payload"]["text"])
+        return sent.message_id
+
+    dispatcher = DeliveryDispatcher(queue, RateLimiter(global_rate=global_rate), {"message": send},
+                                    workers=workers)
+    dispatcher.start()
+    start = time.perf_counter()
+    queue.enqueue_many([
+        {"idem_key": f"bench:{chat_id}", "chat_id": chat_id, "kind": "otp", "priority": PRIORITY_OTP,
+         "payload": {"type": "message", "text": text}}
+        for chat_id in chat_ids
+    ])
+    dispatcher.notify()
+    while dispatcher.stats["sent"] + dispatcher.stats["dead"] < len(chat_ids):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await dispatcher.stop()
+    queue.close()
+    return elapsed, dispatcher.stats["dead"], dict(dispatcher.stats)
+
+
+async def main(args):
+    api = MockBotAPI(latency=args.latency)
+    base_url = await api.start(port=args.port)
+    request = PooledRequest(pool_size=max(args.concurrency, 8), http2=args.http2)
+    bot = Bot(token=TOKEN, base_url=base_url, request=request)
+    chat_ids = [100000 + i for i in range(args.users)]
+    text = "🔑 OTP CODE: 123456"
+
+    report = {"users": args.users, "latency": args.latency,
+              "concurrency": args.concurrency, "global_rate": args.global_rate}
+    try:
+        async with bot:
+            if not args.skip_sequential:
+                report["sequential_seconds"] = round(await run_sequential(bot, chat_ids, text), 3)
+            with tempfile.TemporaryDirectory() as directory:
+                elapsed, failed, stats = await run_dispatcher(
+                    bot, chat_ids, text, args.concurrency, args.global_rate, directory
+                )
+            report["dispatcher_seconds"] = round(elapsed, 3)
+            report["dispatcher_failed"] = failed
+            report["dispatcher_stats"] = stats
+            report["http"] = request.snapshot()
+    finally:
+        await api.stop()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fan-out ke mock Bot API")
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--concurrency', type=int, default=DELIVERY_WORKERS, help="Jumlah worker dispatcher")
+    parser.add_argument('--global-rate', type=float, default=GLOBAL_RATE,
+                        help="Batas pesan/detik global (Telegram: ~30)")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--skip-sequential', action='store_true')
+    parser.add_argument('--http2', action='store_true', help="Pakai HTTP/2 (butuh httpx[http2])")
+    asyncio.run(main(parser.parse_args()))
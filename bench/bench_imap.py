@@ -0,0 +1,154 @@
+"""Benchmark EmailReader.get_new_emails terhadap server IMAP palsu dengan corpus sintetis.
+
+    python bench/bench_imap.py --otp 200 --newsletters 40 --attachments 10 --charsets 50 --batch 10
+    python bench/bench_imap.py --output baseline.json
+    python bench/bench_imap.py --compare baseline.json     # exit 1 jika ada regresi > 20%
+
+Mengukur throughput (email/detik, MB/detik), latensi per poll (poll berisi --batch email baru),
+latensi poll kosong (yang terjadi setiap check_interval), dan puncak memori (tracemalloc).
+Server palsu tidak memakai TLS, jadi IMAP4_SSL diganti IMAP4 biasa selama benchmark.
+"""
+import os
+import sys
+import json
+import time
+import imaplib
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_reader import EmailReader
+from settings_store import SettingsStore, DEFAULT_SETTINGS
+
+from corpus import build_corpus, NEWSLETTER_SIZE, ATTACHMENT_SIZE
+from fake_imap import FakeIMAPServer
+from report import summarize_ms, finish, add_report_arguments
+
+# Arah metrik yang lebih baik, untuk --compare
+RULES = {
+    "throughput.emails_per_sec": "higher",
+    "throughput.mb_per_sec": "higher",
+    "poll_latency.p50_ms": "lower",
+    "poll_latency.p95_ms": "lower",
+    "idle_poll.p95_ms": "lower",
+    "memory.peak_mb": "lower",
+}
+
+
+def make_reader(directory, port, keep_filter):
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update({
+        "email_host": "127.0.0.1",
+        "email_port": port,
+        "email_username": "bench@example.com",
+        "email_password": "bench",
+    })
+    if not keep_filter:
+        settings.update({"filter_sender": "", "filter_subject": ""})
+    path = os.path.join(directory, f"settings-{port}.json")
+    with open(path, 'w') as f:
+        json.dump(settings, f)
+    return EmailReader(SettingsStore(path))
+
+
+def run_polls(reader, server, corpus, batch):
+    """Masukkan corpus per batch ke mailbox, satu poll per batch"""
+    latencies = []
+    returned = 0
+    started = time.perf_counter()
+    for offset in range(0, len(corpus), batch):
+        for _, raw in corpus[offset:offset + batch]:
+            server.mailbox.add(raw)
+        poll_started = time.perf_counter()
+        returned += len(reader.get_new_emails())
+        latencies.append(time.perf_counter() - poll_started)
+    return time.perf_counter() - started, latencies, returned
+
+
+def main(args):
+    logging.disable(logging.INFO)
+    # Server palsu tanpa TLS
+    imaplib.IMAP4_SSL = lambda host, port, *a, **kw: imaplib.IMAP4(host, port)
+
+    corpus = build_corpus(otp=args.otp, newsletters=args.newsletters, attachments=args.attachments,
+                          charsets=args.charsets, seed=args.seed, newsletter_size=args.newsletter_size,
+                          attachment_size=args.attachment_size)
+    total_bytes = sum(len(raw) for _, raw in corpus)
+    kinds = {}
+    for kind, _ in corpus:
+        kinds[kind] = kinds.get(kind, 0) + 1
+
+    report = {
+        "corpus": {"emails": len(corpus), "bytes": total_bytes, "kinds": kinds, "seed": args.seed},
+        "batch": args.batch,
+        "latency": args.latency,
+        "filter": "default" if args.keep_filter else "none",
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Poll kosong: biaya dasar setiap check_interval (NOOP + SEARCH)
+        server = FakeIMAPServer(latency=args.latency)
+        port = server.start_in_thread()
+        reader = make_reader(directory, port, args.keep_filter)
+        reader.get_new_emails()
+        idle = []
+        for _ in range(args.idle_polls):
+            started = time.perf_counter()
+            reader.get_new_emails()
+            idle.append(time.perf_counter() - started)
+        report["idle_poll"] = summarize_ms(idle)
+
+        # Throughput dan latensi per poll
+        elapsed, latencies, returned = run_polls(reader, server, corpus, args.batch)
+        reader.disconnect()
+        report["throughput"] = {
+            "seconds": round(elapsed, 3),
+            "emails_returned": returned,
+            "emails_per_sec": round(len(corpus) / elapsed, 2) if elapsed else None,
+            "mb_per_sec": round(total_bytes / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        }
+        report["poll_latency"] = summarize_ms(latencies)
+        report["imap"] = dict(server.stats)
+        server.stop_thread()
+
+        # Memori: ulangi dengan mailbox baru di bawah tracemalloc (terpisah supaya tidak memengaruhi waktu)
+        if not args.skip_memory:
+            server = FakeIMAPServer(latency=args.latency)
+            port = server.start_in_thread()
+            reader = make_reader(directory, port, args.keep_filter)
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+            run_polls(reader, server, corpus, args.batch)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            reader.disconnect()
+            server.stop_thread()
+            report["memory"] = {
+                "peak_mb": round((peak - baseline) / 1024 / 1024, 2),
+                "retained_mb": round((current - baseline) / 1024 / 1024, 2),
+                "processed_emails": len(reader.processed_emails),
+            }
+
+    finish(report, args, RULES)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark EmailReader terhadap server IMAP palsu")
+    parser.add_argument('--otp', type=int, default=200)
+    parser.add_argument('--newsletters', type=int, default=40)
+    parser.add_argument('--attachments', type=int, default=10)
+    parser.add_argument('--charsets', type=int, default=50)
+    parser.add_argument('--newsletter-size', type=int, default=NEWSLETTER_SIZE, help="Ukuran HTML newsletter (byte)")
+    parser.add_argument('--attachment-size', type=int, default=ATTACHMENT_SIZE, help="Ukuran lampiran (byte)")
+    parser.add_argument('--batch', type=int, default=10, help="Email baru per poll")
+    parser.add_argument('--idle-polls', type=int, default=50, help="Jumlah poll kosong yang diukur")
+    parser.add_argument('--latency', type=float, default=0.0, help="Jeda per command IMAP (detik)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep-filter', action='store_true',
+                        help="Pakai filter sender/subject default (email non-OTP diparse lalu dibuang)")
+    parser.add_argument('--skip-memory', action='store_true')
+    add_report_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,138 @@
+"""Benchmark latensi update -> balasan: long polling vs webhook.
+
+    python bench/bench_webhook.py --updates 100 --latency 0.05
+
+Mode webhook diuji dengan mem-POST Update JSON palsu langsung ke server webhook PTB,
+sama seperti yang dilakukan Telegram.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from telegram.ext import Application, CommandHandler
+
+from mock_bot_api import MockBotAPI
+
+TOKEN = "123456:MOCK-TOKEN-FOR-BENCHMARK-ONLY-000000"
+SECRET = "bench-secret-token"
+REPLY_TIMEOUT = 10
+
+
+def build_application(base_url):
+    application = Application.builder().token(TOKEN).base_url(base_url).build()
+
+    async def ping(update, context):
+        await update.message.reply_text("pong")
+
+    application.add_handler(CommandHandler("ping", ping))
+    return application
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+async def wait_reply(api, chat_id, start):
+    """Tunggu sampai mock menerima sendMessage untuk chat_id"""
+    deadline = start + REPLY_TIMEOUT
+    while time.perf_counter() < deadline:
+        for sent_at, method, target in api.sent:
+            if target == str(chat_id):
+                return sent_at - start
+        await asyncio.sleep(0.001)
+    raise TimeoutError(f"Tidak ada balasan untuk chat {chat_id}")
+
+
+async def measure(api, deliver_update, count, interval):
+    latencies = []
+    for i in range(count):
+        chat_id = 200000 + i
+        start = time.perf_counter()
+        await deliver_update(api.make_update(chat_id, "/ping"))
+        latencies.append(await wait_reply(api, chat_id, start))
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run_polling(api, base_url, args):
+    application = build_application(base_url)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+
+    async def deliver(update):
+        api.push_update(update)
+
+    try:
+        return summarize(await measure(api, deliver, args.updates, args.interval))
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+
+async def run_webhook(api, base_url, args):
+    application = build_application(base_url)
+    url = f"http://127.0.0.1:{args.webhook_port}/telegram"
+    await application.initialize()
+    await application.start()
+    await application.updater.start_webhook(
+        listen='127.0.0.1', port=args.webhook_port, url_path='telegram',
+        webhook_url=url, secret_token=SECRET
+    )
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            # Request tanpa secret token harus ditolak
+            async with session.post(url, json=api.make_update(1, "/ping")) as resp:
+                rejected = resp.status == 403
+
+            async def deliver(update):
+                headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                async with session.post(url, json=update, headers=headers) as resp:
+                    resp.raise_for_status()
+
+            report = summarize(await measure(api, deliver, args.updates, args.interval))
+            report["rejects_missing_secret"] = rejected
+            return report
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+
+async def main(args):
+    api = MockBotAPI(latency=args.latency)
+    base_url = await api.start(port=args.port)
+    report = {"updates": args.updates, "latency": args.latency}
+    try:
+        report["polling"] = await run_polling(api, base_url, args)
+        api.sent.clear()
+        report["webhook"] = await run_webhook(api, base_url, args)
+    finally:
+        await api.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark latensi polling vs webhook")
+    parser.add_argument('--updates', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latency mock Bot API per request (detik)")
+    parser.add_argument('--interval', type=float, default=0.05, help="Jeda antar update (detik)")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--webhook-port', type=int, default=8443)
+    asyncio.run(main(parser.parse_args()))
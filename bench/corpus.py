@@ -0,0 +1,117 @@
+"""Generator corpus email sintetis untuk benchmark (deterministik per seed).
+
+Jenis email:
+    otp         - email OTP bergaya Airwallex (HTML kecil + teks), cocok dengan filter default
+    newsletter  - HTML berat (tabel bersarang, inline CSS, banyak link/gambar)
+    attachment  - email dengan lampiran biner besar (base64)
+    charset     - subjek RFC 2047 dan body non-UTF-8 (latin-1, cp1252, shift_jis, koi8-r, utf-8 + emoji)
+"""
+import random
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.application import MIMEApplication
+from email.utils import format_datetime, make_msgid
+from datetime import datetime, timezone
+
+OTP_SENDER = "Airwallex <support@info.airwallex.com>"
+OTP_SUBJECT = "Your one-time passcode is {code}"
+# Ukuran default HTML newsletter dan lampiran (byte)
+NEWSLETTER_SIZE = 150 * 1024
+ATTACHMENT_SIZE = 1024 * 1024
+
+CHARSET_SAMPLES = [
+    ("iso-8859-1", "Código de verificação", "Olá! O seu código é {code}. Válido por 10 minutos."),
+    ("windows-1252", "Bestätigungscode – Ihr Konto", "Grüße! Ihr Code lautet {code} – gültig für 10 Minuten."),
+    ("shift_jis", "確認コードのお知らせ", "確認コードは {code} です。10分間有効です。"),
+    ("koi8-r", "Код подтверждения", "Ваш код подтверждения: {code}. Никому его не сообщайте."),
+    ("utf-8", "🔐 Kode verifikasi Anda", "Kode OTP Anda adalah {code} 🔑 jangan bagikan ke siapa pun."),
+]
+
+
+def _code(rng):
+    return f"{rng.randrange(0, 1000000):06d}"
+
+
+def _headers(message, sender, subject, rng):
+    message["From"] = sender
+    message["To"] = "bench@example.com"
+    message["Subject"] = subject
+    message["Date"] = format_datetime(datetime.now(timezone.utc))
+    message["Message-ID"] = make_msgid(idstring=str(rng.randrange(10 ** 9)), domain="bench.local")
+
+
+def otp_email(rng):
+    code = _code(rng)
+    message = MIMEMultipart("alternative")
+    _headers(message, OTP_SENDER, OTP_SUBJECT.format(code=code), rng)
+    message.attach(MIMEText(f"Your one-time passcode is {code}. It expires in 10 minutes.", "plain", "utf-8"))
+    html = (
+        "<html><body style=\"font-family:Arial\"><div class=\"header\"><img src=\"https://example.com/logo.png\">"
+        "</div><table role=\"presentation\" width=\"100%\"><tr><td><p>Hi there,</p>"
+        "<p>Use the following one-time passcode to continue:</p>"
+        f"<p style=\"font-size:32px;letter-spacing:6px\"><strong>{code}</strong></p>"
+        "<p>This code expires in 10 minutes. If you didn't request it, ignore this email.</p>"
+        "</td></tr></table><div class=\"footer\">Airwallex Pty Ltd · Melbourne</div></body></html>"
+    )
+    message.attach(MIMEText(html, "html", "utf-8"))
+    return message.as_bytes()
+
+
+def newsletter_email(rng, size=NEWSLETTER_SIZE):
+    message = MIMEMultipart("alternative")
+    _headers(message, "Weekly Deals <news@shop.example.com>", f"Promo minggu ini #{rng.randrange(1000)}", rng)
+    blocks = []
+    total = 0
+    while total < size:
+        price = rng.randrange(10, 999)
+        block = (
+            "<table width=\"600\" cellpadding=\"0\" cellspacing=\"0\" style=\"border:1px solid #eee;margin:8px 0\">"
+            "<tr><td style=\"padding:12px;font-family:Helvetica,Arial,sans-serif;color:#333\">"
+            f"<div style=\"font-size:18px;font-weight:bold\">Produk {rng.randrange(10 ** 5)}</div>"
+            f"<img src=\"https://cdn.example.com/img/{rng.randrange(10 ** 8)}.jpg\" width=\"560\" alt=\"\">"
+            f"<p style=\"line-height:1.5\">{'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4}</p>"
+            f"<a href=\"https://shop.example.com/p/{rng.randrange(10 ** 8)}?utm_source=newsletter\" "
+            f"style=\"background:#f60;color:#fff;padding:8px 16px\">Beli ${price}</a>"
+            "</td></tr></table>"
+        )
+        blocks.append(block)
+        total += len(block)
+    html = "<html><head><style>td{font-size:14px}</style></head><body><center>" + "".join(blocks) + \
+           "</center><div>Unsubscribe</div></body></html>"
+    message.attach(MIMEText("Lihat versi HTML email ini.", "plain", "utf-8"))
+    message.attach(MIMEText(html, "html", "utf-8"))
+    return message.as_bytes()
+
+
+def attachment_email(rng, size=ATTACHMENT_SIZE):
+    message = MIMEMultipart()
+    _headers(message, "Billing <billing@example.com>", f"Invoice {rng.randrange(10 ** 6)}", rng)
+    message.attach(MIMEText("Terlampir invoice bulan ini.", "plain", "utf-8"))
+    data = rng.randbytes(size)
+    attachment = MIMEApplication(data, _subtype="pdf")
+    attachment.add_header("Content-Disposition", "attachment", filename=f"invoice-{rng.randrange(10 ** 6)}.pdf")
+    message.attach(attachment)
+    return message.as_bytes()
+
+
+def charset_email(rng, index):
+    charset, subject, body = CHARSET_SAMPLES[index % len(CHARSET_SAMPLES)]
+    code = _code(rng)
+    message = MIMEMultipart("alternative")
+    _headers(message, "Verifikasi <no-reply@verify.example.com>", Header(subject, charset).encode(), rng)
+    message.attach(MIMEText(body.format(code=code), "plain", charset))
+    message.attach(MIMEText(f"<html><body><p>{body.format(code=code)}</p></body></html>", "html", charset))
+    return message.as_bytes()
+
+
+def build_corpus(otp=100, newsletters=20, attachments=5, charsets=25, seed=1,
+                 newsletter_size=NEWSLETTER_SIZE, attachment_size=ATTACHMENT_SIZE):
+    """Daftar (jenis, raw bytes) diacak dengan urutan yang sama untuk seed yang sama"""
+    rng = random.Random(seed)
+    corpus = [("otp", otp_email(rng)) for _ in range(otp)]
+    corpus += [("newsletter", newsletter_email(rng, newsletter_size)) for _ in range(newsletters)]
+    corpus += [("attachment", attachment_email(rng, attachment_size)) for _ in range(attachments)]
+    corpus += [("charset", charset_email(rng, i)) for i in range(charsets)]
+    rng.shuffle(corpus)
+    return corpus
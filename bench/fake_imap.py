@@ -0,0 +1,241 @@
+"""Server IMAP palsu (asyncio, in-process) untuk benchmark EmailReader.
+
+Hanya subset IMAP4rev1 yang dipakai bot: CAPABILITY, LOGIN, SELECT, SEARCH, FETCH,
+STORE, NOOP, CLOSE, LOGOUT. FETCH RFC822/BODY[] menandai pesan sebagai \\Seen
+seperti server sungguhan.
+
+Jalankan mandiri (misal untuk dicoba dengan bot asli):
+    python bench/fake_imap.py --port 1143 --otp 20
+"""
+import re
+import json
+import time
+import asyncio
+import argparse
+import threading
+import imaplib
+
+CAPABILITIES = b"IMAP4rev1 AUTH=PLAIN"
+
+
+class Mailbox:
+    """Kumpulan pesan (seq mulai dari 1) dengan flag \\Seen"""
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def add(self, raw, internaldate=None):
+        with self._lock:
+            self.messages.append({
+                "raw": raw,
+                "internaldate": internaldate or time.time(),
+                "seen": False,
+            })
+            return len(self.messages)
+
+    def unseen(self):
+        with self._lock:
+            return [seq for seq, message in enumerate(self.messages, 1) if not message["seen"]]
+
+    def all(self):
+        with self._lock:
+            return list(range(1, len(self.messages) + 1))
+
+    def get(self, seq):
+        with self._lock:
+            if 1 <= seq <= len(self.messages):
+                return self.messages[seq - 1]
+        return None
+
+
+def _parse_sequence_set(text, last):
+    seqs = []
+    for part in text.split(','):
+        if ':' in part:
+            start, end = part.split(':', 1)
+            start = last if start == '*' else int(start)
+            end = last if end == '*' else int(end)
+            seqs.extend(range(min(start, end), max(start, end) + 1))
+        else:
+            seqs.append(last if part == '*' else int(part))
+    return seqs
+
+
+class FakeIMAPServer:
+    """Satu mailbox untuk semua user; kredensial apa pun diterima"""
+
+    def __init__(self, mailbox=None, latency=0.0):
+        self.mailbox = mailbox or Mailbox()
+        # Jeda per command, untuk mensimulasikan RTT ke server
+        self.latency = latency
+        self.stats = {"connections": 0, "logins": 0, "commands": 0, "bytes_sent": 0}
+        self._server = None
+        self._clients = {}
+        self._loop = None
+        self._thread = None
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Koneksi yang masih terbuka (misal sesi IMAP bot) ditutup paksa
+            for writer in list(self._clients.values()):
+                writer.close()
+            await asyncio.gather(*self._clients, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_in_thread(self, host='127.0.0.1', port=0):
+        """Jalankan server di event loop thread terpisah (EmailReader bersifat blocking)"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start(host, port))
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-imap", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def stop_thread(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    async def _send(self, writer, data):
+        self.stats["bytes_sent"] += len(data)
+        writer.write(data)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        self.stats["connections"] += 1
+        await self._send(writer, b"* OK [CAPABILITY " + CAPABILITIES + b"] fake-imap ready\r\n")
+        selected = False
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode('utf-8', 'replace').rstrip('\r\n').split(' ', 2)
+                if len(parts) < 2:
+                    await self._send(writer, b"* BAD invalid command\r\n")
+                    continue
+                tag, command = parts[0], parts[1].upper()
+                args = parts[2] if len(parts) > 2 else ''
+                tag_bytes = tag.encode()
+                self.stats["commands"] += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if command == 'UID':
+                    await self._send(writer, tag_bytes + b" NO UID not supported\r\n")
+                elif command == 'CAPABILITY':
+                    await self._send(writer, b"* CAPABILITY " + CAPABILITIES + b"\r\n" + tag_bytes + b" OK done\r\n")
+                elif command == 'LOGIN':
+                    self.stats["logins"] += 1
+                    await self._send(writer, tag_bytes + b" OK LOGIN completed\r\n")
+                elif command in ('SELECT', 'EXAMINE'):
+                    selected = True
+                    total = len(self.mailbox.all())
+                    await self._send(
+                        writer,
+                        f"* {total} EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen)\r\n"
+                        f"{tag} OK [READ-WRITE] {command} completed\r\n".encode()
+                    )
+                elif command == 'SEARCH' and selected:
+                    criteria = args.upper()
+                    seqs = self.mailbox.unseen() if 'UNSEEN' in criteria else self.mailbox.all()
+                    body = ' '.join(str(seq) for seq in seqs)
+                    await self._send(writer, f"* SEARCH {body}".rstrip().encode() + b"\r\n" +
+                                     tag_bytes + b" OK SEARCH completed\r\n")
+                elif command == 'FETCH' and selected:
+                    await self._fetch(writer, tag_bytes, args)
+                elif command == 'STORE' and selected:
+                    seq_text, _, flags = args.partition(' ')
+                    for seq in _parse_sequence_set(seq_text, len(self.mailbox.all())):
+                        message = self.mailbox.get(seq)
+                        if message is not None and '\\SEEN' in flags.upper():
+                            message["seen"] = not flags.startswith('-')
+                    await self._send(writer, tag_bytes + b" OK STORE completed\r\n")
+                elif command == 'NOOP':
+                    await self._send(writer, tag_bytes + b" OK NOOP completed\r\n")
+                elif command == 'CLOSE':
+                    selected = False
+                    await self._send(writer, tag_bytes + b" OK CLOSE completed\r\n")
+                elif command == 'LOGOUT':
+                    await self._send(writer, b"* BYE logging out\r\n" + tag_bytes + b" OK LOGOUT completed\r\n")
+                    break
+                else:
+                    await self._send(writer, tag_bytes + b" BAD unsupported command\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.pop(task, None)
+            writer.close()
+
+    async def _fetch(self, writer, tag_bytes, args):
+        seq_text, _, items = args.partition(' ')
+        items = items.strip().strip('()').upper()
+        for seq in _parse_sequence_set(seq_text, len(self.mailbox.all())):
+            message = self.mailbox.get(seq)
+            if message is None:
+                continue
+            fields = []
+            if 'INTERNALDATE' in items:
+                date = imaplib.Time2Internaldate(message["internaldate"])
+                fields.append(b"INTERNALDATE " + date.encode())
+            if 'FLAGS' in items:
+                fields.append(b"FLAGS (\\Seen)" if message["seen"] else b"FLAGS ()")
+            literal = None
+            match = re.search(r'RFC822(?!\.)|BODY(?:\.PEEK)?\[\]', items)
+            if match:
+                name = b"RFC822" if match.group(0) == 'RFC822' else b"BODY[]"
+                literal = message["raw"]
+                fields.append(name + b" {" + str(len(literal)).encode() + b"}")
+                if 'PEEK' not in match.group(0):
+                    message["seen"] = True
+            head = f"* {seq} FETCH (".encode() + b" ".join(fields)
+            if literal is not None:
+                await self._send(writer, head + b"\r\n" + literal + b")\r\n")
+            else:
+                await self._send(writer, head + b")\r\n")
+        await self._send(writer, tag_bytes + b" OK FETCH completed\r\n")
+
+
+async def _serve(args):
+    from corpus import build_corpus
+
+    server = FakeIMAPServer(latency=args.latency)
+    for _, raw in build_corpus(otp=args.otp, newsletters=args.newsletters, attachments=args.attachments,
+                            charsets=args.charsets, seed=args.seed):
+        server.mailbox.add(raw)
+    port = await server.start(args.host, args.port)
+    print(json.dumps({"host": args.host, "port": port, "messages": len(server.mailbox.all())}))
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server IMAP palsu")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1143)
+    parser.add_argument('--latency', type=float, default=0.0, help="Jeda per command (detik)")
+    parser.add_argument('--otp', type=int, default=20)
+    parser.add_argument('--newsletters', type=int, default=5)
+    parser.add_argument('--attachments', type=int, default=2)
+    parser.add_argument('--charsets', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(_serve(parser.parse_args()))
@@ -0,0 +1,199 @@
+"""Mock Telegram Bot API lokal (aiohttp) untuk benchmark pengiriman.
+
+Jalankan mandiri:
+    python bench/mock_bot_api.py --port 8081 --latency 0.1 --retry-rate 0.02 --failure-rate 0.01
+
+Method: getMe, sendMessage, sendDocument, editMessageText, deleteMessage, pinChatMessage,
+getUpdates, setWebhook, deleteWebhook, getWebhookInfo. Latency, 429 retry_after, dan error
+5xx acak bisa diatur untuk menguji retry dan kehilangan pesan.
+
+Lalu arahkan bot ke mock dengan TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot
+"""
+import time
+import json
+import random
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+
+class MockBotAPI:
+    """Server Bot API palsu yang mencatat semua pesan yang diterima"""
+
+    def __init__(self, latency=0.1, jitter=0.0, retry_rate=0.0, retry_after=1, failure_rate=0.0, seed=None):
+        self.latency = latency
+        # Variasi latency acak (+/- detik)
+        self.jitter = jitter
+        # Peluang balasan 429 (retry_after detik) dan error 5xx per request kirim/edit
+        self.retry_rate = retry_rate
+        self.retry_after = retry_after
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.sent = []
+        # Detail setiap pesan yang diterima (termasuk edit dan dokumen) untuk cek kebenaran
+        self.deliveries = []
+        self.deleted = []
+        self.stats = Counter()
+        # Antrian update untuk getUpdates (mode polling)
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self._update_event = asyncio.Event()
+        self.webhook_url = ""
+        self.app = web.Application()
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+        self.app.router.add_get('/bot{token}/{method}', self.handle)
+        self.runner = None
+
+    async def _params(self, request):
+        if request.content_type == 'application/json':
+            return await request.json()
+        form = await request.post()
+        return {key: value for key, value in form.items()}
+
+    def _message(self, chat_id, **extra):
+        message = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"}
+        }
+        message.update(extra)
+        return message
+
+    def make_update(self, chat_id, text):
+        """Update JSON palsu berisi pesan teks (command jika diawali '/')"""
+        update_id = next(self.update_ids)
+        message = self._message(chat_id, text=text)
+        message["from"] = {"id": int(chat_id), "is_bot": False, "first_name": "Bench"}
+        if text.startswith('/'):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def push_update(self, update):
+        """Masukkan update ke antrian getUpdates"""
+        self.updates.append(update)
+        self._update_event.set()
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self._update_event.clear()
+            try:
+                await asyncio.wait_for(self._update_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return [u for u in self.updates if u["update_id"] >= offset]
+
+    def _record(self, method, chat_id, message_id, text):
+        self.sent.append((time.perf_counter(), method, str(chat_id)))
+        self.deliveries.append({
+            "at": time.perf_counter(), "method": method, "chat_id": str(chat_id),
+            "message_id": message_id, "text": text
+        })
+
+    def _injected_error(self, method):
+        """429 atau 5xx acak untuk method yang mengirim/mengubah pesan"""
+        if method not in ('sendMessage', 'sendDocument', 'editMessageText'):
+            return None
+        roll = self.random.random()
+        if roll < self.retry_rate:
+            self.stats["retry_after"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }, status=429)
+        if roll < self.retry_rate + self.failure_rate:
+            self.stats["failures"] += 1
+            return web.json_response(
+                {"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502
+            )
+        return None
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.stats["requests"] += 1
+        self.stats[method] += 1
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        await asyncio.sleep(max(0.0, delay))
+
+        error = self._injected_error(method)
+        if error is not None:
+            return error
+
+        if method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Mock", "username": "mock_bot"}
+        elif method == 'sendMessage':
+            result = self._message(params['chat_id'], text=params.get('text', ''))
+            self._record(method, params['chat_id'], result["message_id"], params.get('text', ''))
+        elif method == 'sendDocument':
+            file_id = f"mock-file-{next(self.file_ids)}"
+            document = params.get('document')
+            # Upload (multipart) menghasilkan file_id baru; kirim ulang memakai file_id yang sama
+            if isinstance(document, str):
+                file_id = document
+            result = self._message(
+                params['chat_id'], caption=params.get('caption', ''),
+                document={"file_id": file_id, "file_unique_id": file_id, "file_name": getattr(document, 'filename', None)}
+            )
+            self._record(method, params['chat_id'], result["message_id"], params.get('caption', ''))
+        elif method == 'editMessageText':
+            result = self._message(params['chat_id'], text=params.get('text', ''))
+            result["message_id"] = int(params['message_id'])
+            result["edit_date"] = int(time.time())
+            self._record(method, params['chat_id'], result["message_id"], params.get('text', ''))
+        elif method == 'deleteMessage':
+            self.deleted.append((str(params['chat_id']), int(params['message_id'])))
+            result = True
+        elif method == 'pinChatMessage':
+            result = True
+        elif method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method in ('setWebhook', 'deleteWebhook'):
+            self.webhook_url = params.get('url', '') if method == 'setWebhook' else ""
+            result = True
+        elif method == 'getWebhookInfo':
+            result = {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+        else:
+            return web.json_response({"ok": False, "error_code": 404, "description": f"Not Found: {method}"})
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host='127.0.0.1', port=8081):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        return f"http://{host}:{port}/bot"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+async def _serve(args):
+    api = MockBotAPI(latency=args.latency, jitter=args.jitter, retry_rate=args.retry_rate,
+                     retry_after=args.retry_after, failure_rate=args.failure_rate, seed=args.seed)
+    base_url = await api.start(args.host, args.port)
+    print(json.dumps({"base_url": base_url}))
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.1, help="Latency per request (detik)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Variasi latency acak (detik)")
+    parser.add_argument('--retry-rate', type=float, default=0.0, help="Peluang balasan 429 per pesan")
+    parser.add_argument('--retry-after', type=int, default=1, help="Nilai retry_after pada 429 (detik)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Peluang error 502 per pesan")
+    parser.add_argument('--seed', type=int)
+    asyncio.run(_serve(parser.parse_args()))
@@ -0,0 +1,115 @@
+"""Helper laporan JSON benchmark: ringkasan latensi, info commit, dan perbandingan dengan baseline.
+
+Laporan disimpan dengan --output lalu dibandingkan di commit berikutnya dengan --compare;
+benchmark keluar dengan kode 1 jika ada metrik yang memburuk melebihi toleransi.
+"""
+import os
+import sys
+import json
+import math
+import platform
+import subprocess
+
+# Toleransi default perbandingan dengan baseline (20%)
+DEFAULT_TOLERANCE = 0.2
+
+
+def percentile(sorted_values, pct):
+    """Persentil nearest-rank dari list yang sudah diurutkan"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_ms(seconds):
+    """Ringkasan latensi (input detik, output milidetik)"""
+    values = sorted(seconds)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def environment():
+    """Commit dan versi Python supaya laporan dari mesin/commit berbeda bisa dibedakan"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine()}
+
+
+def lookup(report, path):
+    """Ambil nilai bertingkat dengan path 'a.b.c'"""
+    value = report
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(report, baseline, rules, tolerance=DEFAULT_TOLERANCE):
+    """Bandingkan metrik dengan baseline
+
+    rules = {path: "higher" | "lower"} - arah yang lebih baik. Kembalikan daftar regresi.
+    """
+    regressions = []
+    for path, better in rules.items():
+        current, previous = lookup(report, path), lookup(baseline, path)
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)):
+            continue
+        if better == "higher":
+            worse = current < previous * (1 - tolerance)
+        else:
+            # Nilai sangat kecil (mis. 0 ms) tidak dibandingkan secara relatif
+            worse = current > previous * (1 + tolerance) and current - previous > 1e-3
+        if worse:
+            regressions.append({"metric": path, "baseline": previous, "current": current, "better": better})
+    return regressions
+
+
+def finish(report, args, rules, failures=None):
+    """Cetak/simpan laporan, bandingkan dengan --compare, dan keluar 1 jika ada regresi
+
+    failures = daftar pesan kegagalan mutlak (misal OTP hilang) yang gagal tanpa perlu baseline.
+    """
+    report["env"] = environment()
+    failures = list(failures or [])
+    if failures:
+        report["failures"] = failures
+    regressions = []
+    if getattr(args, 'compare', None):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, rules, args.tolerance)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if getattr(args, 'output', None):
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+
+    for regression in regressions:
+        print(f"REGRESI {regression['metric']}: {regression['baseline']} -> {regression['current']}", file=sys.stderr)
+    for failure in failures:
+        print(f"GAGAL {failure}", file=sys.stderr)
+    if regressions or failures:
+        sys.exit(1)
+
+
+def add_report_arguments(parser):
+    parser.add_argument('--output', help="Simpan laporan JSON ke file (baseline untuk --compare)")
+    parser.add_argument('--compare', help="Laporan JSON baseline; keluar dengan kode 1 jika ada regresi")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Toleransi relatif sebelum dianggap regresi (default 0.2 = 20%%)")
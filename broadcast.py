@@ -0,0 +1,218 @@
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from delivery_queue import DELIVERY_DB, PRIORITY_ATTACHMENT, STATE_PENDING, STATE_INFLIGHT, STATE_SENT, STATE_DEAD
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_CANCELLED = 'cancelled'
+
+# Penerima yang dimasukkan ke antrian per chunk
+BROADCAST_CHUNK = 50
+# Laju maksimal broadcast (pesan/detik) - di bawah batas global 30 supaya OTP tetap punya ruang
+BROADCAST_RATE = 20
+# Laporan progres ke owner setiap N penerima
+BROADCAST_REPORT_EVERY = 500
+# Jeda saat menunggu antrian OTP kosong / chunk sebelumnya terkirim
+BROADCAST_IDLE = 1.0
+
+
+class BroadcastStore:
+    """Tabel job broadcast (satu baris per job, cursor disimpan setiap chunk)"""
+
+    def __init__(self, path=DELIVERY_DB):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS broadcast_jobs ("
+            "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "  owner_chat TEXT NOT NULL,"
+            "  text TEXT NOT NULL,"
+            "  recipients TEXT NOT NULL,"
+            "  total INTEGER NOT NULL,"
+            "  cursor INTEGER NOT NULL DEFAULT 0,"
+            "  reported INTEGER NOT NULL DEFAULT 0,"
+            "  state TEXT NOT NULL,"
+            "  sent INTEGER NOT NULL DEFAULT 0,"
+            "  failed INTEGER NOT NULL DEFAULT 0,"
+            "  created_at REAL NOT NULL,"
+            "  updated_at REAL NOT NULL"
+            ");"
+        )
+        self.conn.commit()
+
+    def _job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["recipients"] = json.loads(job["recipients"])
+        return job
+
+    def create(self, owner_chat, text, recipients):
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO broadcast_jobs (owner_chat, text, recipients, total, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(owner_chat), text, json.dumps(list(recipients)), len(recipients), JOB_RUNNING, now, now)
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row)
+
+    def running(self):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM broadcast_jobs WHERE state = ? ORDER BY id", (JOB_RUNNING,)
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def recent(self, limit=5):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self.conn.execute(f"UPDATE broadcast_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class BroadcastRunner:
+    """Menjalankan job broadcast di latar belakang: chunk demi chunk ke antrian pengiriman
+
+    Chunk berikutnya baru dimasukkan setelah chunk sebelumnya terkirim dan tidak ada OTP/lampiran
+    yang menunggu, sehingga broadcast tidak pernah menyalip forwarding email.
+    """
+
+    def __init__(self, store, queue, enqueue_fn, notify_fn, chunk_size=BROADCAST_CHUNK,
+                 rate=BROADCAST_RATE, report_every=BROADCAST_REPORT_EVERY):
+        self.store = store
+        self.queue = queue
+        # enqueue_fn(chat_ids, text, key, group_key) dan notify_fn(chat_id, text, key)
+        self.enqueue_fn = enqueue_fn
+        self.notify_fn = notify_fn
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.report_every = report_every
+        self._wakeup = asyncio.Event()
+
+    @staticmethod
+    def group_key(job_id):
+        return f"broadcast:{job_id}"
+
+    def start_job(self, owner_chat, text, recipients):
+        job_id = self.store.create(owner_chat, text, recipients)
+        self._wakeup.set()
+        return job_id
+
+    def cancel(self, job_id):
+        """Hentikan job dan batalkan pesan yang belum terkirim"""
+        job = self.store.get(job_id)
+        if job is None or job["state"] != JOB_RUNNING:
+            return None
+        self.store.update(job_id, state=JOB_CANCELLED)
+        cancelled = self.queue.cancel_group(self.group_key(job_id))
+        return job["total"] - job["cursor"] + cancelled
+
+    def progress(self, job):
+        """Ringkasan progres job: terkirim, gagal, menunggu"""
+        if job["state"] != JOB_RUNNING:
+            return {"sent": job["sent"], "failed": job["failed"], "waiting": 0}
+        counts = self.queue.group_counts(self.group_key(job["id"]))
+        waiting = counts.get(STATE_PENDING, 0) + counts.get(STATE_INFLIGHT, 0) + job["total"] - job["cursor"]
+        return {"sent": counts.get(STATE_SENT, 0), "failed": counts.get(STATE_DEAD, 0), "waiting": waiting}
+
+    async def run(self):
+        """Loop latar belakang; job yang berjalan saat crash dilanjutkan dari cursor-nya"""
+        while True:
+            jobs = await asyncio.to_thread(self.store.running)
+            if not jobs:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=60)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for job in jobs:
+                try:
+                    await self._step(job)
+                except Exception as e:
+                    logger.error(f"Broadcast job {job['id']} error: {str(e)}")
+            await asyncio.sleep(BROADCAST_IDLE)
+
+    async def _step(self, job):
+        group_key = self.group_key(job["id"])
+
+        # Backpressure: tunggu chunk sebelumnya terkirim dan antrian OTP/lampiran kosong
+        in_queue = await asyncio.to_thread(self.queue.pending_count, None, group_key)
+        urgent = await asyncio.to_thread(self.queue.pending_count, PRIORITY_ATTACHMENT)
+        if urgent or in_queue >= self.chunk_size:
+            return
+
+        if job["cursor"] < job["total"]:
+            chunk = job["recipients"][job["cursor"]:job["cursor"] + self.chunk_size]
+            # Idempotensi per penerima membuat chunk aman diulang jika crash sebelum cursor tersimpan
+            self.enqueue_fn(chunk, job["text"], group_key, group_key)
+            job["cursor"] += len(chunk)
+            await asyncio.to_thread(self.store.update, job["id"], cursor=job["cursor"])
+            # Batasi laju: chunk berikutnya paling cepat setelah chunk ini habis terkirim pada BROADCAST_RATE
+            await asyncio.sleep(len(chunk) / self.rate)
+            in_queue += len(chunk)
+            # Job bisa dibatalkan selama jeda di atas
+            current = await asyncio.to_thread(self.store.get, job["id"])
+            if current["state"] != JOB_RUNNING:
+                return
+
+        progress = await asyncio.to_thread(self.progress, job)
+        done = progress["sent"] + progress["failed"]
+
+        if job["cursor"] >= job["total"] and in_queue == 0:
+            await asyncio.to_thread(
+                self.store.update, job["id"], state=JOB_DONE, sent=progress["sent"], failed=progress["failed"]
+            )
+            self.notify_fn(
+                job["owner_chat"],
+                f"✅ <b>Broadcast #{job['id']} selesai</b>\n\n"
+                f"Terkirim: {progress['sent']}/{job['total']}\nGagal: {progress['failed']}",
+                f"{group_key}:done"
+            )
+            logger.info(f"Broadcast job {job['id']} selesai: {progress}")
+            return
+
+        if done < job["total"] and done - job["reported"] >= self.report_every:
+            job["reported"] = done - done % self.report_every
+            await asyncio.to_thread(self.store.update, job["id"], reported=job["reported"])
+            self.notify_fn(
+                job["owner_chat"],
+                f"📤 Broadcast #{job['id']}: {done}/{job['total']} diproses "
+                f"({progress['failed']} gagal)",
+                f"{group_key}:progress:{job['reported']}"
+            )
@@ -0,0 +1,500 @@
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from telegram.error import RetryAfter, Forbidden, BadRequest
+
+from rate_limit import retry_after_seconds
+import metrics
+from log_setup import correlation
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Database antrian pengiriman keluar
+DELIVERY_DB = 'delivery_queue.db'
+
+# Kelas prioritas (angka kecil dikirim lebih dulu)
+PRIORITY_OTP = 0
+PRIORITY_ATTACHMENT = 1
+PRIORITY_BROADCAST = 2
+PRIORITY_NOTICE = 3
+
+STATE_PENDING = 'pending'
+STATE_INFLIGHT = 'inflight'
+STATE_SENT = 'sent'
+STATE_DEAD = 'dead'
+STATE_CANCELLED = 'cancelled'
+
+# Retry eksponensial: 2, 4, 8, ... detik sampai maksimal 5 menit, lalu dead-letter
+# (RetryAfter dari Telegram hanya menunda dan tidak menghabiskan jatah percobaan)
+MAX_ATTEMPTS = 8
+RETRY_BASE = 2
+RETRY_MAX = 300
+# Record sent/dead/cancelled disimpan sehari untuk audit dan idempotensi
+FINISHED_RETENTION = 86400
+# Jumlah worker pengiriman
+DELIVERY_WORKERS = 20
+# Batas tidur claimer saat tidak ada pesan jatuh tempo (enqueue dan retry membangunkan lebih cepat)
+IDLE_WAIT = 60
+
+
+class DeliveryQueue:
+    """Antrian keluar berbasis SQLite dengan state per pesan dan kunci idempotensi"""
+
+    def __init__(self, path=DELIVERY_DB, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "  idem_key TEXT NOT NULL UNIQUE,"
+            "  chat_id TEXT NOT NULL,"
+            "  kind TEXT NOT NULL,"
+            "  priority INTEGER NOT NULL,"
+            "  payload TEXT NOT NULL,"
+            "  blob_key TEXT,"
+            "  group_key TEXT,"
+            "  state TEXT NOT NULL DEFAULT 'pending',"
+            "  attempts INTEGER NOT NULL DEFAULT 0,"
+            "  next_attempt_at REAL NOT NULL,"
+            "  created_at REAL NOT NULL,"
+            "  updated_at REAL NOT NULL,"
+            "  last_error TEXT,"
+            "  message_id TEXT"
+            ");"
+            "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(state, priority, next_attempt_at);"
+            "CREATE INDEX IF NOT EXISTS idx_outbox_group ON outbox(group_key, state);"
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "  blob_key TEXT PRIMARY KEY,"
+            "  data BLOB NOT NULL,"
+            "  file_id TEXT,"
+            "  created_at REAL NOT NULL"
+            ");"
+        )
+        self.conn.commit()
+
+    def _row(self, row):
+        item = dict(row)
+        item["payload"] = json.loads(item["payload"])
+        return item
+
+    # ==================== ENQUEUE ====================
+
+    def put_blob(self, blob_key, data):
+        """Simpan data lampiran sekali untuk semua penerima"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (blob_key, data, created_at) VALUES (?, ?, ?)",
+                (blob_key, sqlite3.Binary(data), time.time())
+            )
+            self.conn.commit()
+
+    def enqueue_many(self, items):
+        """Masukkan banyak pesan; pesan dengan idem_key yang sudah ada diabaikan
+
+        items: dict dengan idem_key, chat_id, kind, priority, payload, dan opsional
+        blob_key, group_key, delay.
+        """
+        now = time.time()
+        rows = [
+            (
+                item["idem_key"], str(item["chat_id"]), item["kind"], item["priority"],
+                json.dumps(item["payload"]), item.get("blob_key"), item.get("group_key"),
+                now + item.get("delay", 0), now, now
+            )
+            for item in items
+        ]
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO outbox (idem_key, chat_id, kind, priority, payload, blob_key, "
+                "group_key, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    # ==================== WORKER ====================
+
+    def claim(self, limit=1):
+        """Ambil pesan jatuh tempo dengan prioritas tertinggi dan tandai inflight"""
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM outbox WHERE state = ? AND next_attempt_at <= ? "
+                "ORDER BY priority, next_attempt_at, id LIMIT ?",
+                (STATE_PENDING, now, limit)
+            ).fetchall()
+            if not rows:
+                return []
+            self.conn.executemany(
+                "UPDATE outbox SET state = ?, updated_at = ? WHERE id = ?",
+                [(STATE_INFLIGHT, now, row["id"]) for row in rows]
+            )
+            self.conn.commit()
+        return [self._row(row) for row in rows]
+
+    def release(self, item_ids):
+        """Kembalikan pesan yang sudah di-claim tetapi belum dikirim ke pending (saat shutdown)"""
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE outbox SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                [(STATE_PENDING, time.time(), item_id, STATE_INFLIGHT) for item_id in item_ids]
+            )
+            self.conn.commit()
+
+    def next_due(self):
+        """Waktu jatuh tempo pesan pending berikutnya (None jika antrian kosong)"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE state = ?", (STATE_PENDING,)
+            ).fetchone()[0]
+
+    def mark_sent(self, item_id, message_id=None):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE outbox SET state = ?, message_id = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (STATE_SENT, str(message_id) if message_id is not None else None, time.time(), item_id)
+            )
+            self.conn.commit()
+
+    def mark_retry(self, item_id, error, delay=None):
+        """Jadwalkan ulang dengan backoff eksponensial; dead-letter jika percobaan habis"""
+        with self._lock:
+            row = self.conn.execute("SELECT attempts FROM outbox WHERE id = ?", (item_id,)).fetchone()
+            if row is None:
+                return None
+            attempts = row["attempts"] + 1
+            if attempts >= self.max_attempts:
+                state = STATE_DEAD
+                next_attempt = time.time()
+            else:
+                state = STATE_PENDING
+                if delay is None:
+                    delay = min(RETRY_MAX, RETRY_BASE * (2 ** (attempts - 1))) * random.uniform(0.8, 1.2)
+                next_attempt = time.time() + delay
+            self.conn.execute(
+                "UPDATE outbox SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (state, attempts, next_attempt, str(error)[:500], time.time(), item_id)
+            )
+            self.conn.commit()
+            return state
+
+    def reschedule(self, item_id, delay, error=None):
+        """Tunda pengiriman tanpa menghitung percobaan (RetryAfter bukan kegagalan, tidak pernah dead-letter)"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "UPDATE outbox SET state = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (STATE_PENDING, now + delay, str(error)[:500] if error is not None else None, now, item_id)
+            )
+            self.conn.commit()
+
+    def mark_dead(self, item_id, error):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE outbox SET state = ?, attempts = attempts + 1, last_error = ?, updated_at = ? WHERE id = ?",
+                (STATE_DEAD, str(error)[:500], time.time(), item_id)
+            )
+            self.conn.commit()
+
+    def cancel_group(self, group_key):
+        """Batalkan semua pesan pending dalam satu grup (misal satu broadcast)"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE outbox SET state = ?, updated_at = ? WHERE group_key = ? AND state = ?",
+                (STATE_CANCELLED, time.time(), group_key, STATE_PENDING)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def cancel_group_payloads(self, group_key):
+        """Seperti cancel_group, tetapi kembalikan payload pesan yang dibatalkan (misal update pinned yang diganti)"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, payload FROM outbox WHERE group_key = ? AND state = ?", (group_key, STATE_PENDING)
+            ).fetchall()
+            if not rows:
+                return []
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE outbox SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                [(STATE_CANCELLED, now, row["id"], STATE_PENDING) for row in rows]
+            )
+            self.conn.commit()
+            return [json.loads(row["payload"]) for row in rows]
+
+    def recover(self):
+        """Saat startup: pesan inflight dari proses sebelumnya dikembalikan ke pending"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE outbox SET state = ?, updated_at = ? WHERE state = ?",
+                (STATE_PENDING, time.time(), STATE_INFLIGHT)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def purge(self, older_than=FINISHED_RETENTION):
+        """Hapus record selesai yang sudah lama dan blob yang tidak dipakai lagi"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM outbox WHERE state IN (?, ?, ?) AND updated_at < ?",
+                (STATE_SENT, STATE_DEAD, STATE_CANCELLED, cutoff)
+            )
+            self.conn.execute(
+                "DELETE FROM blobs WHERE blob_key NOT IN ("
+                "  SELECT blob_key FROM outbox WHERE blob_key IS NOT NULL AND state IN (?, ?))",
+                (STATE_PENDING, STATE_INFLIGHT)
+            )
+            self.conn.commit()
+
+    # ==================== BLOB / FILE_ID ====================
+
+    def get_blob(self, blob_key):
+        with self._lock:
+            row = self.conn.execute("SELECT data, file_id FROM blobs WHERE blob_key = ?", (blob_key,)).fetchone()
+        if row is None:
+            return None, None
+        return bytes(row["data"]), row["file_id"]
+
+    def set_file_id(self, blob_key, file_id):
+        with self._lock:
+            self.conn.execute("UPDATE blobs SET file_id = ? WHERE blob_key = ?", (file_id, blob_key))
+            self.conn.commit()
+
+    # ==================== STATISTIK ====================
+
+    def depth(self):
+        """Jumlah pesan per state"""
+        with self._lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) AS n FROM outbox GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    def pending_count(self, max_priority=None, group_key=None):
+        query = "SELECT COUNT(*) FROM outbox WHERE state IN (?, ?)"
+        params = [STATE_PENDING, STATE_INFLIGHT]
+        if max_priority is not None:
+            query += " AND priority <= ?"
+            params.append(max_priority)
+        if group_key is not None:
+            query += " AND group_key = ?"
+            params.append(group_key)
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    def overdue_count(self, age):
+        """Jumlah pesan pending yang sudah jatuh tempo lebih dari age detik tetapi belum diambil worker"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE state = ? AND next_attempt_at <= ?",
+                (STATE_PENDING, time.time() - age)
+            ).fetchone()[0]
+
+    def group_counts(self, group_key):
+        """Jumlah pesan per state dalam satu grup (progres broadcast)"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) AS n FROM outbox WHERE group_key = ? GROUP BY state", (group_key,)
+            ).fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class DeliveryDispatcher:
+    """Satu claimer mengambil batch dari antrian, worker mengirim sesuai prioritas dan rate limit
+
+    Claimer hanya menyentuh SQLite saat dibangunkan (enqueue, retry, buffer habis) atau saat
+    pesan berikutnya jatuh tempo - antrian kosong tidak di-poll terus-menerus.
+    """
+
+    def __init__(self, queue, limiter, handlers, on_sent=None, on_failed=None, workers=DELIVERY_WORKERS):
+        self.queue = queue
+        self.limiter = limiter
+        self.handlers = handlers
+        self.on_sent = on_sent
+        # Dipanggil untuk error jaringan/server (bukan RetryAfter atau penolakan per chat)
+        self.on_failed = on_failed
+        self.workers = workers
+        self.in_flight = 0
+        self.stats = {"sent": 0, "retried": 0, "dead": 0, "claims": 0}
+        self._wakeup = asyncio.Event()
+        # Pesan yang sudah di-claim (inflight di database) menunggu worker, urut prioritas
+        self._ready = asyncio.PriorityQueue()
+        # Pesan OTP/lampiran di buffer + yang sedang dikirim (untuk busy())
+        self._urgent = 0
+        self._claimer = None
+        self._tasks = []
+        self._stopping = False
+
+    def notify(self):
+        """Bangunkan claimer setelah ada pesan baru"""
+        self._wakeup.set()
+
+    def start(self):
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"{recovered} pesan inflight dari sesi sebelumnya dikembalikan ke antrian")
+        self._stopping = False
+        self._claimer = asyncio.create_task(self._claim_loop())
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self.notify()
+
+    async def stop(self, timeout=10):
+        """Berhenti mengambil pesan baru dan tunggu pengiriman yang sedang berjalan"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._claimer is not None:
+            await asyncio.gather(self._claimer, return_exceptions=True)
+            self._claimer = None
+
+        # Pesan yang belum sempat dikirim kembali ke pending untuk start berikutnya
+        leftover = []
+        while not self._ready.empty():
+            leftover.append(self._ready.get_nowait()[-1])
+        if leftover:
+            self._urgent -= sum(1 for item in leftover if item["priority"] <= PRIORITY_ATTACHMENT)
+            await asyncio.to_thread(self.queue.release, [item["id"] for item in leftover])
+
+        for _ in self._tasks:
+            self._ready.put_nowait((float('inf'), 0, 0, None))
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout) if self._tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+
+    async def _claim_loop(self):
+        while not self._stopping:
+            # Clear sebelum claim supaya notify() di antaranya tidak terlewat
+            self._wakeup.clear()
+            room = max(1, self.workers - self._ready.qsize())
+            try:
+                items = await asyncio.to_thread(self.queue.claim, room)
+                self.stats["claims"] += 1
+            except Exception as e:
+                logger.error(f"Gagal mengambil antrian: {str(e)}")
+                items = []
+
+            if self._stopping:
+                if items:
+                    await asyncio.to_thread(self.queue.release, [item["id"] for item in items])
+                return
+            for item in items:
+                if item["priority"] <= PRIORITY_ATTACHMENT:
+                    self._urgent += 1
+                self._ready.put_nowait((item["priority"], item["next_attempt_at"], item["id"], item))
+
+            # Batch penuh: worker membangunkan claimer lagi saat buffer habis.
+            # Selain itu tidur sampai pesan berikutnya jatuh tempo.
+            timeout = IDLE_WAIT
+            if len(items) < room:
+                try:
+                    due = await asyncio.to_thread(self.queue.next_due)
+                    if due is not None:
+                        timeout = min(IDLE_WAIT, max(0.0, due - time.time()))
+                except Exception as e:
+                    logger.error(f"Gagal membaca jadwal antrian: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, index):
+        while True:
+            item = (await self._ready.get())[-1]
+            if item is None:
+                return
+            if self._ready.empty():
+                self._wakeup.set()
+            try:
+                await self._deliver(item)
+            finally:
+                if item["priority"] <= PRIORITY_ATTACHMENT:
+                    self._urgent -= 1
+
+    async def _deliver(self, item):
+        # Log pengiriman membawa correlation id email asalnya
+        with correlation(item["payload"].get("cid")):
+            await self._deliver_item(item)
+
+    async def _deliver_item(self, item):
+        handler = self.handlers.get(item["payload"].get("type"))
+        if handler is None:
+            await asyncio.to_thread(self.queue.mark_dead, item["id"], "handler tidak dikenal")
+            return
+
+        await self.limiter.acquire(item["chat_id"])
+        kind = item["payload"]["type"]
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            message_id = await handler(item)
+            metrics.TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, type=kind)
+        except RetryAfter as e:
+            metrics.TELEGRAM_RATE_LIMITED.inc()
+            metrics.TELEGRAM_SEND_RESULTS.inc(type=kind, result="retry_after")
+            delay = retry_after_seconds(e)
+            self.limiter.penalize(item["chat_id"], delay)
+            self.stats["retried"] += 1
+            await asyncio.to_thread(self.queue.reschedule, item["id"], delay, e)
+            self._schedule_wakeup(delay)
+            return
+        except (Forbidden, BadRequest) as e:
+            # Bot diblokir / pesan tidak valid - retry tidak akan membantu
+            metrics.TELEGRAM_SEND_RESULTS.inc(type=kind, result="rejected")
+            self.stats["dead"] += 1
+            logger.error(f"Pesan {item['idem_key']} ke {item['chat_id']} gagal permanen: {str(e)}")
+            await asyncio.to_thread(self.queue.mark_dead, item["id"], e)
+            return
+        except Exception as e:
+            metrics.TELEGRAM_SEND_RESULTS.inc(type=kind, result="error")
+            if self.on_failed is not None:
+                self.on_failed(item, e)
+            state = await asyncio.to_thread(self.queue.mark_retry, item["id"], e)
+            if state == STATE_DEAD:
+                self.stats["dead"] += 1
+                logger.error(f"Pesan {item['idem_key']} ke {item['chat_id']} masuk dead-letter: {str(e)}")
+            else:
+                self.stats["retried"] += 1
+                logger.warning(f"Pengiriman ke {item['chat_id']} gagal, dicoba ulang nanti: {str(e)}")
+                self._schedule_wakeup(RETRY_BASE)
+            return
+        finally:
+            self.in_flight -= 1
+
+        self.stats["sent"] += 1
+        metrics.TELEGRAM_SEND_RESULTS.inc(type=kind, result="sent")
+        await asyncio.to_thread(self.queue.mark_sent, item["id"], message_id)
+        if self.on_sent is not None:
+            try:
+                self.on_sent(item, message_id)
+            except Exception as e:
+                logger.error(f"Error pada callback on_sent: {str(e)}")
+
+    def _schedule_wakeup(self, delay):
+        asyncio.get_running_loop().call_later(delay, self._wakeup.set)
+
+    async def busy(self):
+        """True jika ada pengiriman berjalan atau OTP/lampiran menunggu"""
+        if self.in_flight > 0 or self._urgent > 0:
+            return True
+        count = await asyncio.to_thread(self.queue.pending_count, max_priority=PRIORITY_ATTACHMENT)
+        return count > 0
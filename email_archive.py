@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstd opsional, fallback ke zlib/gzip
+    zstandard = None
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Direktori untuk menyimpan segment arsip email
+ARCHIVE_DIR = 'email_archive'
+# Ukuran maksimal satu segment sebelum pindah ke segment baru
+SEGMENT_MAX_BYTES = 1024 * 1024
+# Batas total ukuran arsip dan umur record
+ARCHIVE_MAX_BYTES = 20 * 1024 * 1024
+ARCHIVE_MAX_DAYS = 30
+# Panjang maksimal teks email yang diarsipkan
+ARCHIVE_TEXT_CHARS = 1000
+
+SEGMENT_MAGIC = b'EAR1'
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+RECORD_HEADER = struct.Struct('>I')
+
+
+class ArchiveEntry:
+    """Entry index di memori - hanya metadata, isi record tetap di disk"""
+    __slots__ = ('seq', 'ts', 'sender', 'otp', 'segment', 'offset', 'length')
+
+    def __init__(self, seq, ts, sender, otp, segment, offset, length):
+        self.seq = seq
+        self.ts = ts
+        self.sender = sender
+        self.otp = otp
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+
+
+class EmailArchive:
+    """Arsip email append-only dalam segment terkompresi dengan index di memori"""
+
+    def __init__(self, directory=ARCHIVE_DIR, segment_max_bytes=SEGMENT_MAX_BYTES,
+                 max_bytes=ARCHIVE_MAX_BYTES, max_days=ARCHIVE_MAX_DAYS):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_bytes = max_bytes
+        self.max_days = max_days
+        self.codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+        self.entries = []
+        self.by_sender = {}
+        self.by_otp = {}
+        self.next_seq = 1
+        self._segments = {}
+        self._current = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    # ==================== KOMPRESI ====================
+
+    def _compress(self, codec, data):
+        if codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return zlib.compress(data, 6)
+
+    def _decompress(self, codec, data):
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Segment zstd membutuhkan paket zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    # ==================== SEGMENT ====================
+
+    def _segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segment_codec(self, name):
+        return self._segments[name]["codec"]
+
+    def _load(self):
+        """Bangun ulang index di memori dengan memindai semua segment"""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith('.seg'))
+        for name in names:
+            try:
+                self._scan_segment(name)
+            except Exception as e:
+                logger.error(f"Gagal membaca segment arsip {name}: {str(e)}")
+
+        if self.entries:
+            self.next_seq = self.entries[-1].seq + 1
+        if self._segments:
+            self._current = max(self._segments)
+        self._enforce_retention()
+        logger.info(f"Arsip email dimuat: {len(self.entries)} email di {len(self._segments)} segment")
+
+    def _scan_segment(self, name):
+        path = self._segment_path(name)
+        with open(path, 'rb') as f:
+            header = f.read(len(SEGMENT_MAGIC) + 1)
+            if len(header) < len(SEGMENT_MAGIC) + 1 or header[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                raise ValueError("header segment tidak valid")
+            codec = header[len(SEGMENT_MAGIC):]
+            self._segments[name] = {"codec": codec, "size": len(header), "last_ts": 0}
+
+            offset = len(header)
+            while True:
+                raw_len = f.read(RECORD_HEADER.size)
+                if not raw_len:
+                    break
+                if len(raw_len) < RECORD_HEADER.size:
+                    break
+                length = RECORD_HEADER.unpack(raw_len)[0]
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                try:
+                    record = json.loads(self._decompress(codec, payload))
+                except Exception:
+                    break
+                self._index(record, name, offset + RECORD_HEADER.size, length)
+                offset += RECORD_HEADER.size + length
+
+        # Potong record terakhir yang tidak lengkap (crash saat menulis)
+        if os.path.getsize(path) != offset:
+            logger.warning(f"Memotong record tidak lengkap di segment {name}")
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        self._segments[name]["size"] = offset
+
+    def _new_segment(self):
+        name = f"{self.next_seq:010d}.seg"
+        with open(self._segment_path(name), 'wb') as f:
+            f.write(SEGMENT_MAGIC + self.codec)
+        self._segments[name] = {"codec": self.codec, "size": len(SEGMENT_MAGIC) + 1, "last_ts": 0}
+        self._current = name
+        return name
+
+    def _index(self, record, segment, offset, length):
+        entry = ArchiveEntry(
+            record["seq"], record["archived_at"], (record.get("from") or "").lower(),
+            record.get("otp"), segment, offset, length
+        )
+        self.entries.append(entry)
+        self.by_sender.setdefault(entry.sender, []).append(entry)
+        if entry.otp:
+            self.by_otp.setdefault(entry.otp, []).append(entry)
+        self._segments[segment]["last_ts"] = entry.ts
+
+    def _rebuild_lookup(self):
+        self.by_sender = {}
+        self.by_otp = {}
+        for entry in self.entries:
+            self.by_sender.setdefault(entry.sender, []).append(entry)
+            if entry.otp:
+                self.by_otp.setdefault(entry.otp, []).append(entry)
+
+    def _enforce_retention(self):
+        """Hapus segment tertua jika arsip melebihi batas ukuran atau umur"""
+        cutoff = time.time() - self.max_days * 86400 if self.max_days else None
+        removed = []
+        for name in sorted(self._segments):
+            if name == self._current:
+                break
+            total = sum(info["size"] for info in self._segments.values())
+            too_big = self.max_bytes and total > self.max_bytes
+            too_old = cutoff is not None and self._segments[name]["last_ts"] < cutoff
+            if not (too_big or too_old):
+                break
+            try:
+                os.unlink(self._segment_path(name))
+            except OSError as e:
+                logger.error(f"Gagal menghapus segment arsip {name}: {str(e)}")
+                break
+            del self._segments[name]
+            removed.append(name)
+
+        if removed:
+            removed_set = set(removed)
+            self.entries = [e for e in self.entries if e.segment not in removed_set]
+            self._rebuild_lookup()
+            logger.info(f"Retensi arsip: {len(removed)} segment dihapus")
+        return removed
+
+    # ==================== API PUBLIK ====================
+
+    def enforce_retention(self):
+        """Terapkan batas umur/ukuran arsip sekarang (dipanggil periodik), return jumlah segment dihapus"""
+        with self._lock:
+            return len(self._enforce_retention())
+
+    def append(self, email_obj):
+        """Menambahkan email yang sudah diparse ke arsip, return seq"""
+        text = email_obj.get('full_content') or email_obj.get('body_text') or ''
+        date = email_obj.get('date')
+        with self._lock:
+            seq = self.next_seq
+            record = {
+                "seq": seq,
+                "archived_at": time.time(),
+                "date": date.isoformat() if hasattr(date, 'isoformat') else str(date or ''),
+                "from": email_obj.get('from') or '',
+                "subject": email_obj.get('subject') or '',
+                "otp": email_obj.get('otp_code'),
+                "attachments": [a.get('filename') for a in email_obj.get('attachments', [])],
+                "text": text[:ARCHIVE_TEXT_CHARS]
+            }
+
+            if self._current is None or self._segments[self._current]["size"] >= self.segment_max_bytes:
+                self._new_segment()
+                self._enforce_retention()
+
+            payload = self._compress(self.codec, json.dumps(record).encode('utf-8'))
+            segment = self._current
+            offset = self._segments[segment]["size"]
+            with open(self._segment_path(segment), 'ab') as f:
+                f.write(RECORD_HEADER.pack(len(payload)) + payload)
+
+            self._segments[segment]["size"] = offset + RECORD_HEADER.size + len(payload)
+            self._index(record, segment, offset + RECORD_HEADER.size, len(payload))
+            self.next_seq = seq + 1
+            return seq
+
+    def read(self, entry):
+        """Membaca satu record lengkap dari disk berdasarkan entry index"""
+        with open(self._segment_path(entry.segment), 'rb') as f:
+            f.seek(entry.offset)
+            payload = f.read(entry.length)
+        return json.loads(self._decompress(self._segment_codec(entry.segment), payload))
+
+    def _read_many(self, entries):
+        records = []
+        for entry in entries:
+            try:
+                records.append(self.read(entry))
+            except Exception as e:
+                logger.error(f"Gagal membaca arsip seq {entry.seq}: {str(e)}")
+        return records
+
+    def latest(self, n=1, otp_only=False):
+        """Mendapatkan n email terbaru (terbaru lebih dulu)"""
+        with self._lock:
+            entries = self.entries if not otp_only else [e for e in self.entries if e.otp]
+            selected = list(reversed(entries[-n:])) if n > 0 else []
+        return self._read_many(selected)
+
+    def find_by_otp(self, otp_code):
+        """Mencari email berdasarkan kode OTP"""
+        with self._lock:
+            selected = list(reversed(self.by_otp.get(otp_code, [])))
+        return self._read_many(selected)
+
+    def find_by_sender(self, sender, n=10):
+        """Mencari email terbaru dari pengirim tertentu (substring, case-insensitive)"""
+        sender = sender.lower()
+        with self._lock:
+            matches = [e for key, items in self.by_sender.items() if sender in key for e in items]
+        matches.sort(key=lambda e: e.seq, reverse=True)
+        return self._read_many(matches[:n])
+
+    def get(self, seq):
+        """Membaca record berdasarkan seq (None jika sudah terhapus retensi)"""
+        with self._lock:
+            if not self.entries or seq < self.entries[0].seq:
+                return None
+            lo, hi = 0, len(self.entries)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.entries[mid].seq < seq:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo >= len(self.entries) or self.entries[lo].seq != seq:
+                return None
+            entry = self.entries[lo]
+        return self.read(entry)
+
+    def stats(self):
+        """Ringkasan ukuran arsip"""
+        with self._lock:
+            return {
+                "emails": len(self.entries),
+                "segments": len(self._segments),
+                "bytes": sum(info["size"] for info in self._segments.values())
+            }
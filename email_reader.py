@@ -1,7 +1,7 @@
 import imaplib
 import email
-import os
-import json
+import time
+import threading
 from email.header import decode_header
 from dotenv import load_dotenv
 import logging
@@ -9,6 +9,9 @@ import datetime
 from bs4 import BeautifulSoup
 from lxml import etree
 import re
+from settings_store import SettingsStore, CONNECTION_KEYS
+import metrics
+from log_setup import new_correlation_id, set_correlation_id
 
 # Konfigurasi logging
 logging.basicConfig(
@@ -17,59 +20,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# File untuk menyimpan settings
-SETTINGS_FILE = 'bot_settings.json'
-
-def load_settings():
-    """Memuat settings dari file JSON"""
-    default_settings = {
-        "email_host": "imap.gmail.com",
-        "email_port": 993,
-        "email_username": "",
-        "email_password": "",
-        "email_folder": "INBOX",
-        "filter_sender": "support@info.airwallex.com",
-        "filter_subject": "Your one-time passcode is",
-        "check_interval": 2
-    }
-    
-    try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r') as f:
-                saved = json.load(f)
-                # Merge dengan default untuk field yang mungkin belum ada
-                default_settings.update(saved)
-        else:
-            # Buat file settings baru
-            save_settings(default_settings)
-    except Exception as e:
-        logger.error(f"Error loading settings: {str(e)}")
-    
-    return default_settings
-
-def save_settings(settings):
-    """Menyimpan settings ke file JSON"""
-    try:
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings, f, indent=2)
-        logger.info("Settings saved successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error saving settings: {str(e)}")
-        return False
-
 class EmailReader:
-    def __init__(self):
-        # Memuat settings dari file JSON
-        self.settings = load_settings()
-        self.reload_settings()
+    def __init__(self, settings_store=None):
+        # Memuat settings dari cache (file hanya dibaca ulang jika berubah)
+        self.settings_store = settings_store or SettingsStore()
+        self.mail = None
+        self._needs_reconnect = False
+        # Settings yang berubah selama poll berjalan di thread lain diterapkan setelah poll selesai
+        self._settings_lock = threading.Lock()
+        self._polling = False
+        self._pending_settings = None
+        self._pending_reconnect = False
+        # Error poll terakhir (None = poll terakhir sukses); get_new_emails sendiri tidak raise
+        self.last_error = None
+        self._apply_settings(self.settings_store.get())
+        self.settings_store.subscribe(self._on_settings_changed)
         
         # Menyimpan ID email yang sudah diproses
         self.processed_emails = set()
     
-    def reload_settings(self):
-        """Reload settings dari file"""
-        self.settings = load_settings()
+    def _apply_settings(self, settings):
+        """Terapkan nilai settings ke atribut reader"""
+        self.settings = settings
         
         self.host = self.settings.get('email_host', 'imap.gmail.com')
         self.port = int(self.settings.get('email_port', 993))
@@ -80,12 +52,36 @@ class EmailReader:
         # Filter email dari settings
         self.filter_sender = self.settings.get('filter_sender', 'support@info.airwallex.com')
         self.filter_subject = self.settings.get('filter_subject', 'Your one-time passcode is')
-        
-        logger.info(f"Settings reloaded - Host: {self.host}, Username: {self.username}")
+    
+    def _on_settings_changed(self, changed, settings):
+        """Event dari SettingsStore - reconnect hanya jika kredensial/folder berubah"""
+        with self._settings_lock:
+            self._pending_settings = settings
+            self._pending_reconnect = self._pending_reconnect or bool(changed & CONNECTION_KEYS)
+            # Event loop tidak boleh mengubah kredensial/koneksi di tengah get_new_emails
+            if not self._polling:
+                self._apply_pending()
+    
+    def _apply_pending(self):
+        """Terapkan settings yang tertunda (dipanggil dengan _settings_lock dipegang)"""
+        if self._pending_settings is None:
+            return
+        self._apply_settings(self._pending_settings)
+        if self._pending_reconnect:
+            self._needs_reconnect = True
+            logger.info(f"Settings koneksi berubah - Host: {self.host}, Username: {self.username}")
+        self._pending_settings = None
+        self._pending_reconnect = False
+    
+    def reload_settings(self):
+        """Reload settings dari file (murah: hanya stat jika file tidak berubah)"""
+        self.settings_store.refresh()
     
     def is_configured(self):
-        """Memeriksa apakah email sudah dikonfigurasi"""
-        return bool(self.username and self.password and self.host)
+        """Memeriksa apakah email sudah dikonfigurasi (termasuk settings yang masih tertunda)"""
+        settings = self._pending_settings or self.settings
+        return bool(settings.get('email_username') and settings.get('email_password')
+                    and settings.get('email_host', 'imap.gmail.com'))
         
     def connect(self):
         """Menghubungkan ke server email"""
@@ -93,24 +89,47 @@ class EmailReader:
             logger.warning("Email belum dikonfigurasi. Gunakan /set email di Telegram.")
             return False
             
+        started = time.perf_counter()
         try:
             self.mail = imaplib.IMAP4_SSL(self.host, self.port)
             self.mail.login(self.username, self.password)
+            metrics.IMAP_CONNECT_SECONDS.observe(time.perf_counter() - started, result="ok")
             self.mail.select(self.folder)
+            self._needs_reconnect = False
             logger.info(f"Berhasil terhubung ke {self.host}")
             return True
         except Exception as e:
-            logger.error(f"Gagal terhubung ke server email: {str(e)}")
+            metrics.IMAP_CONNECT_SECONDS.observe(time.perf_counter() - started, result="error")
+            self.mail = None
+            self.last_error = f"Gagal terhubung ke server email: {str(e)}"
+            logger.error(self.last_error)
             return False
     
     def disconnect(self):
         """Memutuskan koneksi dari server email"""
+        if self.mail is None:
+            return
         try:
             self.mail.close()
             self.mail.logout()
             logger.info("Koneksi email terputus")
         except Exception as e:
             logger.error(f"Gagal memutuskan koneksi: {str(e)}")
+        finally:
+            self.mail = None
+    
+    def ensure_connected(self):
+        """Memakai ulang sesi IMAP yang ada, reconnect jika settings koneksi berubah atau sesi mati"""
+        if self.mail is not None and not self._needs_reconnect:
+            try:
+                status, _ = self.mail.noop()
+                if status == 'OK':
+                    return True
+            except Exception as e:
+                logger.warning(f"Sesi IMAP terputus, menghubungkan ulang: {str(e)}")
+        
+        self.disconnect()
+        return self.connect()
     
     def get_clean_text(self, part):
         """Mengekstrak teks dari bagian email"""
@@ -125,6 +144,13 @@ class EmailReader:
     
     def extract_content_by_css(self, html_content, css_selector=None):
         """Mengekstrak konten dari HTML menggunakan CSS selector atau mencari OTP langsung"""
+        started = time.perf_counter()
+        try:
+            return self._extract_content_by_css(html_content, css_selector)
+        finally:
+            metrics.PARSE_SECONDS.observe(time.perf_counter() - started, extractor="html")
+
+    def _extract_content_by_css(self, html_content, css_selector=None):
         try:
             # Parse HTML dengan BeautifulSoup
             soup = BeautifulSoup(html_content, 'html.parser')
@@ -232,8 +258,21 @@ class EmailReader:
         """Mengambil email baru yang belum diproses"""
         # Reload settings sebelum cek email
         self.reload_settings()
+        with self._settings_lock:
+            self._polling = True
+            self._apply_pending()
+        try:
+            return self._fetch_new_emails()
+        finally:
+            with self._settings_lock:
+                self._polling = False
+                self._apply_pending()
+    
+    def _fetch_new_emails(self):
+        poll_start = time.time()
+        self.last_error = None
         
-        if not self.connect():
+        if not self.ensure_connected():
             return []
         
         try:
@@ -241,7 +280,8 @@ class EmailReader:
             status, messages = self.mail.search(None, 'UNSEEN')
             
             if status != 'OK':
-                logger.error("Gagal mencari email baru")
+                self.last_error = "Gagal mencari email baru"
+                logger.error(self.last_error)
                 self.disconnect()
                 return []
             
@@ -259,15 +299,25 @@ class EmailReader:
                 # Tandai email sebagai sudah diproses
                 self.processed_emails.add(email_id_str)
                 
-                # Ambil email
-                status, msg_data = self.mail.fetch(e_id, '(RFC822)')
+                # Correlation id dibawa sampai fan-out dan pengiriman (lihat log_setup)
+                cid = new_correlation_id()
+                set_correlation_id(cid)
+                
+                # Ambil email beserta INTERNALDATE (waktu email diterima server)
+                status, msg_data = self.mail.fetch(e_id, '(INTERNALDATE RFC822)')
                 
                 if status != 'OK':
-                    logger.error(f"Gagal mengambil email dengan ID {email_id_str}")
+                    logger.error("Gagal mengambil email", extra={"imap_id": email_id_str})
                     continue
                 
+                fetched_at = time.time()
+                internaldate = imaplib.Internaldate2tuple(msg_data[0][0])
                 raw_email = msg_data[0][1]
+                metrics.IMAP_MESSAGES_FETCHED.inc()
+                metrics.IMAP_BYTES_DOWNLOADED.inc(len(raw_email))
+                parse_started = time.perf_counter()
                 msg = email.message_from_bytes(raw_email)
+                metrics.PARSE_SECONDS.observe(time.perf_counter() - parse_started, extractor="mime")
                 
                 # Ekstrak informasi email
                 subject = decode_header(msg["Subject"])[0][0]
@@ -321,13 +371,23 @@ class EmailReader:
                     # Buat objek email
                     email_obj = {
                         "id": email_id_str,
+                        "cid": cid,
+                        "message_id": msg.get("Message-ID"),
                         "subject": subject,
                         "from": from_,
                         "date": date,
                         "body_text": body_text,
                         "body_html": body_html,
                         "extracted_content": extracted_content,
-                        "attachments": attachments
+                        "attachments": attachments,
+                        # Timestamp tahap pipeline untuk pengukuran latensi
+                        "timings": {
+                            "internaldate": time.mktime(internaldate) if internaldate else None,
+                            "date_header": date.timestamp() if date.tzinfo else None,
+                            "poll_start": poll_start,
+                            "fetched": fetched_at,
+                            "parsed": None
+                        }
                     }
                     
                     # Jika extracted_content adalah dictionary (hasil dari extract_content_by_css)
@@ -342,16 +402,26 @@ class EmailReader:
                         else:
                             email_obj["extracted_content"] = "Tidak dapat menemukan kode OTP dalam email."
                     
-                    logger.info(f"Email dari {from_} dengan subjek '{subject}' sesuai dengan filter")
+                    email_obj["timings"]["parsed"] = time.time()
+                    metrics.IMAP_MESSAGES_FILTERED.inc(result="matched")
+                    metrics.OTP_LOOKUPS.inc(result="hit" if email_obj.get("otp_found") else "miss")
+                    logger.info("Email sesuai filter", extra={
+                        "imap_id": email_id_str, "sender": from_, "subject": subject,
+                        "bytes": len(raw_email), "otp_found": email_obj.get("otp_found", False)
+                    })
                     new_emails.append(email_obj)
                 else:
-                    logger.info(f"Email dari {from_} dengan subjek '{subject}' tidak sesuai dengan filter, diabaikan")
+                    metrics.IMAP_MESSAGES_FILTERED.inc(result="skipped")
+                    logger.info("Email tidak sesuai filter, diabaikan", extra={
+                        "imap_id": email_id_str, "sender": from_, "subject": subject
+                    })
             
-            self.disconnect()
+            set_correlation_id(None)
             return new_emails
             
         except Exception as e:
-            logger.error(f"Error saat memproses email: {str(e)}")
+            self.last_error = f"Error saat memproses email: {str(e)}"
+            logger.error(self.last_error)
             self.disconnect()
             return []
 
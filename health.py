@@ -0,0 +1,112 @@
+import time
+import logging
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+HEALTH_PATH = '/health'
+READY_PATH = '/ready'
+# Gagal beruntun sebelum komponen dianggap bermasalah (dan owner diberi alert)
+FAILURE_THRESHOLD = 5
+# Poll dianggap macet jika tidak ada poll sukses selama N kali interval, minimal STALE_MIN detik
+STALE_POLL_INTERVALS = 10
+STALE_MIN = 300
+# Interval pengecekan kesehatan (alert owner dan file status)
+HEALTH_CHECK_INTERVAL = 30
+
+COMPONENT_POLL = 'poll'
+COMPONENT_SEND = 'send'
+COMPONENT_LABELS = {COMPONENT_POLL: 'Poll email (IMAP)', COMPONENT_SEND: 'Pengiriman Telegram'}
+
+
+class HealthMonitor:
+    """Mencatat poll IMAP dan pengiriman Telegram terakhir yang sukses serta kegagalan beruntun
+
+    Loop yang menelan semua exception tetap terlihat hidup bagi PM2; monitor ini yang
+    membedakan bot yang sehat dari bot yang berputar tanpa meneruskan apa pun.
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.started_at = time.time()
+        self.ready = False
+        self.components = {
+            name: {"last_ok": None, "failures": 0, "last_error": None, "last_error_at": None}
+            for name in (COMPONENT_POLL, COMPONENT_SEND)
+        }
+        # Komponen yang sudah dilaporkan ke owner (alert hanya sekali sampai pulih)
+        self.alerted = set()
+
+    def succeeded(self, component):
+        state = self.components[component]
+        state["last_ok"] = time.time()
+        state["failures"] = 0
+
+    def failed(self, component, error):
+        state = self.components[component]
+        state["failures"] += 1
+        state["last_error"] = str(error)[:200]
+        state["last_error_at"] = time.time()
+
+    def problems(self, poll_interval=None, overdue=0, now=None):
+        """{komponen: alasan} untuk komponen yang sedang bermasalah
+
+        poll_interval None = email belum dikonfigurasi (poll tidak diharapkan berjalan).
+        overdue = pesan yang sudah jatuh tempo lebih dari STALE_MIN detik tetapi belum terkirim.
+        """
+        now = now or time.time()
+        problems = {}
+        for name, state in self.components.items():
+            if state["failures"] >= self.threshold:
+                problems[name] = f"{state['failures']} kali gagal beruntun: {state['last_error']}"
+
+        poll = self.components[COMPONENT_POLL]
+        idle = now - (poll["last_ok"] or self.started_at)
+        if COMPONENT_POLL not in problems and poll_interval is not None and \
+                idle > max(STALE_MIN, poll_interval * STALE_POLL_INTERVALS):
+            problems[COMPONENT_POLL] = f"tidak ada poll sukses selama {idle:.0f} detik"
+
+        # Pesan jatuh tempo menumpuk tetapi tidak ada satu pun yang terkirim = pengiriman macet
+        send = self.components[COMPONENT_SEND]
+        idle = now - (send["last_ok"] or self.started_at)
+        if COMPONENT_SEND not in problems and overdue and idle > STALE_MIN:
+            problems[COMPONENT_SEND] = f"{overdue} pesan tertahan, tidak ada yang terkirim selama {idle:.0f} detik"
+        return problems
+
+    def transitions(self, problems):
+        """Komponen yang baru bermasalah dan yang baru pulih sejak pengecekan sebelumnya"""
+        new = {name: reason for name, reason in problems.items() if name not in self.alerted}
+        recovered = [name for name in self.alerted if name not in problems]
+        self.alerted = set(problems)
+        return new, recovered
+
+    def snapshot(self, problems, queue_depth, email_configured=True, now=None):
+        """Status dalam bentuk JSON (endpoint /health dan file status)
+
+        email_configured False = kredensial email belum diisi lewat /set (setup pertama): poll tidak
+        diharapkan berjalan, jadi tidak menahan status siap.
+        """
+        now = now or time.time()
+        components = {}
+        for name, state in self.components.items():
+            components[name] = dict(
+                state,
+                age=round(now - state["last_ok"], 1) if state["last_ok"] else None,
+                ok=name not in problems,
+            )
+        components[COMPONENT_POLL]["configured"] = email_configured
+        polled = self.components[COMPONENT_POLL]["last_ok"] is not None
+        return {
+            "status": "unhealthy" if problems else "ok",
+            # Siap = bot sudah start dan minimal satu poll sukses (atau email belum dikonfigurasi)
+            "ready": self.ready and (polled or not email_configured),
+            "uptime": round(now - self.started_at, 1),
+            "components": components,
+            "problems": problems,
+            "queue": queue_depth,
+            "time": now,
+        }
@@ -0,0 +1,94 @@
+import time
+import logging
+
+import httpx
+from telegram.request import HTTPXRequest
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Pool bersama untuk handler command + worker antrian pengiriman (20 worker + cadangan)
+POOL_SIZE = 32
+# Berapa lama koneksi idle dipertahankan (detik) supaya jarang TLS handshake ulang
+KEEPALIVE_EXPIRY = 60.0
+POOL_TIMEOUT = 5.0
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest dengan pool yang bisa diatur dan statistik pemakaian koneksi"""
+
+    def __init__(self, pool_size=POOL_SIZE, http2=False, keepalive_expiry=KEEPALIVE_EXPIRY,
+                 pool_timeout=POOL_TIMEOUT, **kwargs):
+        if http2 and not http2_available():
+            logger.warning("HTTP/2 diminta tapi paket h2 belum terpasang (pip install httpx[http2]), pakai HTTP/1.1")
+            http2 = False
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.stats = {"requests": 0, "in_flight": 0, "peak_in_flight": 0,
+                      "connections_opened": 0, "errors": 0, "total_latency": 0.0}
+        self._seen_connections = set()
+        super().__init__(
+            connection_pool_size=pool_size,
+            pool_timeout=pool_timeout,
+            http_version="2" if http2 else "1.1",
+            **kwargs
+        )
+
+    def _build_client(self):
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        self._client_kwargs["event_hooks"] = {"response": [self._on_response]}
+        return httpx.AsyncClient(**self._client_kwargs)
+
+    async def do_request(self, *args, **kwargs):
+        started = time.perf_counter()
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        try:
+            return await super().do_request(*args, **kwargs)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+            self.stats["total_latency"] += time.perf_counter() - started
+
+    async def _on_response(self, response):
+        self._count_connections()
+
+    def _count_connections(self):
+        """Hitung koneksi baru di pool httpcore (koneksi baru = TCP/TLS handshake baru)"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        for connection in getattr(pool, "connections", []):
+            key = id(connection)
+            if key not in self._seen_connections:
+                self._seen_connections.add(key)
+                self.stats["connections_opened"] += 1
+        # Lupakan koneksi yang sudah ditutup supaya id yang dipakai ulang tetap terhitung
+        self._seen_connections &= {id(c) for c in getattr(pool, "connections", [])}
+
+    def open_connections(self):
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        return len(getattr(pool, "connections", []))
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["open_connections"] = self.open_connections()
+        stats["avg_latency"] = stats["total_latency"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
@@ -0,0 +1,201 @@
+import math
+import time
+import sqlite3
+import logging
+import threading
+
+from delivery_queue import DELIVERY_DB
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Email yang belum terkirim ke semua penerima dalam waktu ini dicatat apa adanya
+TRACE_TIMEOUT = 600
+# Jumlah email terakhir yang dipakai untuk menghitung persentil
+STATS_WINDOW = 1000
+# Batas bucket histogram (detik)
+HISTOGRAM_BUCKETS = (2, 5, 10, 30, 60, 300)
+
+# Tahap pipeline yang dicatat per email, berurutan
+STAGES = ("arrived", "poll_start", "fetched", "parsed", "queued", "first_sent", "last_sent")
+
+
+def percentile(sorted_values, pct):
+    """Persentil nearest-rank dari list yang sudah diurutkan"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def histogram(values, buckets=HISTOGRAM_BUCKETS):
+    """Jumlah nilai per bucket: [(batas, jumlah), ...] dengan batas None untuk sisa"""
+    counts = [0] * (len(buckets) + 1)
+    for value in values:
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+    return list(zip(list(buckets) + [None], counts))
+
+
+class LatencyTracker:
+    """Timestamp setiap tahap pipeline per email, dari INTERNALDATE server sampai terkirim ke Telegram"""
+
+    def __init__(self, path=DELIVERY_DB, window=STATS_WINDOW):
+        self.window = window
+        self.pending = {}
+        # Trace selesai yang belum ditulis ke database (ditulis per batch oleh write_finished)
+        self._finished = []
+        self._finished_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS email_latency ("
+            "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "  email_key TEXT NOT NULL,"
+            "  arrived REAL,"
+            "  poll_start REAL,"
+            "  fetched REAL,"
+            "  parsed REAL,"
+            "  queued REAL,"
+            "  first_sent REAL,"
+            "  last_sent REAL,"
+            "  recipients INTEGER NOT NULL,"
+            "  delivered INTEGER NOT NULL"
+            ");"
+        )
+        self.conn.commit()
+
+    def start(self, key, timings, recipients, queued=None):
+        """Mulai trace email setelah dimasukkan ke antrian untuk sejumlah penerima"""
+        timings = timings or {}
+        trace = {stage: None for stage in STAGES}
+        # Waktu tiba: INTERNALDATE server, atau header Date jika server tidak mengirimkannya
+        trace["arrived"] = timings.get("internaldate") or timings.get("date_header")
+        for stage in ("poll_start", "fetched", "parsed"):
+            trace[stage] = timings.get(stage)
+        trace["queued"] = queued or time.time()
+        trace["recipients"] = recipients
+        trace["delivered"] = 0
+        if recipients <= 0:
+            return
+        self.pending[key] = trace
+
+    def delivered(self, key, at=None):
+        """Satu penerima menerima email ini"""
+        trace = self.pending.get(key)
+        if trace is None:
+            return
+        at = at or time.time()
+        if trace["first_sent"] is None:
+            trace["first_sent"] = at
+        trace["last_sent"] = at
+        trace["delivered"] += 1
+        if trace["delivered"] >= trace["recipients"]:
+            self._finish(key)
+
+    def dropped(self, key):
+        """Satu penerima tidak akan menerima email ini (update pinned diganti versi yang lebih baru)"""
+        trace = self.pending.get(key)
+        if trace is None:
+            return
+        trace["recipients"] -= 1
+        if trace["recipients"] <= 0 and not trace["delivered"]:
+            # Tidak ada yang terkirim sama sekali - tidak ada latensi untuk dicatat
+            del self.pending[key]
+        elif trace["delivered"] >= trace["recipients"]:
+            self._finish(key)
+
+    def expire(self, max_age=TRACE_TIMEOUT):
+        """Catat trace yang tidak pernah lengkap (penerima gagal/dibatalkan)"""
+        cutoff = time.time() - max_age
+        for key in [k for k, t in self.pending.items() if t["queued"] < cutoff]:
+            self._finish(key)
+
+    def flush(self):
+        """Selesaikan semua trace (saat shutdown) dan tulis ke database"""
+        for key in list(self.pending):
+            self._finish(key)
+        self.write_finished()
+
+    def _finish(self, key):
+        trace = self.pending.pop(key, None)
+        if trace is None:
+            return
+        # Hanya di memori - dipanggil dari callback pengiriman di event loop
+        with self._finished_lock:
+            self._finished.append(
+                (key, *(trace[stage] for stage in STAGES), trace["recipients"], trace["delivered"])
+            )
+
+    def write_finished(self):
+        """Tulis trace selesai ke database dalam satu transaksi (jalankan di thread), return jumlah baris"""
+        with self._finished_lock:
+            rows, self._finished = self._finished, []
+        if not rows:
+            return 0
+        try:
+            with self._lock:
+                self.conn.executemany(
+                    "INSERT INTO email_latency (email_key, arrived, poll_start, fetched, parsed, queued, "
+                    "first_sent, last_sent, recipients, delivered) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Gagal mencatat latensi {len(rows)} email: {str(e)}")
+            return 0
+        return len(rows)
+
+    def _recent(self):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT arrived, poll_start, fetched, parsed, queued, first_sent, last_sent "
+                "FROM email_latency ORDER BY id DESC LIMIT ?", (self.window,)
+            ).fetchall()
+
+    def summary(self):
+        """Persentil per metrik (detik) atas email terakhir dalam window"""
+        self.write_finished()
+        metrics = {
+            "arrival_to_first": ("arrived", "first_sent"),
+            "arrival_to_last": ("arrived", "last_sent"),
+            "arrival_to_poll": ("arrived", "poll_start"),
+            "poll_to_fetch": ("poll_start", "fetched"),
+            "fetch_to_parse": ("fetched", "parsed"),
+            "parse_to_queue": ("parsed", "queued"),
+            "queue_to_first": ("queued", "first_sent"),
+        }
+        rows = self._recent()
+        result = {}
+        for name, (start, end) in metrics.items():
+            start_index, end_index = STAGES.index(start), STAGES.index(end)
+            # INTERNALDATE beresolusi 1 detik dan jam server bisa sedikit berbeda - nilai negatif jadi 0
+            values = sorted(
+                max(0.0, row[end_index] - row[start_index])
+                for row in rows
+                if row[start_index] is not None and row[end_index] is not None
+            )
+            result[name] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else None,
+                "histogram": histogram(values),
+            }
+        return result
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
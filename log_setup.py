@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Format log: json (satu objek per baris) atau text (format lama, dengan field tambahan key=value)
+DEFAULT_LOG_FORMAT = 'json'
+DEFAULT_LOG_LEVEL = 'INFO'
+# Pesan identik dalam jendela ini diringkas menjadi satu baris dengan jumlah pengulangan
+REPEAT_WINDOW = 300
+# Batas jumlah pesan berbeda yang dilacak RepeatFilter
+REPEAT_MAX_KEYS = 1000
+# Kapasitas antrian log; jika disk terlalu lambat, log dibuang daripada menahan event loop
+QUEUE_SIZE = 10000
+# Logger library yang mencatat setiap request di level INFO
+NOISY_LOGGERS = ('httpx', 'httpcore', 'apscheduler')
+
+# Atribut bawaan LogRecord - sisanya dianggap field terstruktur dari extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'cid', 'repeated'}
+
+_correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+
+def new_correlation_id():
+    """Id pendek per email, dibawa dari fetch sampai fan-out dan pengiriman"""
+    return secrets.token_hex(4)
+
+
+def current_correlation_id():
+    return _correlation_id.get()
+
+
+def set_correlation_id(cid):
+    """Set id untuk konteks saat ini (misal satu iterasi loop di thread IMAP)"""
+    _correlation_id.set(cid)
+
+
+@contextmanager
+def correlation(cid):
+    token = _correlation_id.set(cid)
+    try:
+        yield
+    finally:
+        _correlation_id.reset(token)
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class ContextFilter(logging.Filter):
+    """Menempelkan correlation id ke record di thread pemanggil (sebelum masuk antrian)"""
+
+    def filter(self, record):
+        record.cid = _correlation_id.get()
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """Meringkas pesan yang sama persis: dicatat sekali per jendela, sisanya dihitung
+
+    Baris berikutnya setelah jendela lewat membawa field repeated = jumlah yang disembunyikan.
+    Jika pesan tidak muncul lagi, flush() mengeluarkan ringkasan dari pengulangan terakhir.
+    """
+
+    def __init__(self, window=REPEAT_WINDOW, max_keys=REPEAT_MAX_KEYS):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [waktu dicatat, jumlah disembunyikan, record terakhir yang disembunyikan]
+        self.seen = {}
+        # Ringkasan dari key yang dibuang saat seen penuh, menunggu flush()
+        self._evicted = []
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, getattr(record, 'cid', None), record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                entry[2] = record
+                return False
+            if len(self.seen) >= self.max_keys:
+                keep = {}
+                for k, v in self.seen.items():
+                    if now - v[0] < self.window:
+                        keep[k] = v
+                    elif v[1] and k != key:
+                        self._evicted.append(self._summary(v))
+                self.seen = keep
+            self.seen[key] = [now, 0, None]
+        if entry is not None and entry[1]:
+            record.repeated = entry[1]
+        return True
+
+    @staticmethod
+    def _summary(entry):
+        record = logging.makeLogRecord(vars(entry[2]))
+        record.repeated = entry[1]
+        return record
+
+    def flush(self, force=False):
+        """Ringkasan pengulangan yang jendelanya sudah lewat (semua jika force) sebagai list record"""
+        now = time.monotonic()
+        with self._lock:
+            records, self._evicted = self._evicted, []
+            for entry in self.seen.values():
+                if entry[1] and (force or now - entry[0] >= self.window):
+                    records.append(self._summary(entry))
+                    # Jendela baru: kemunculan berikutnya dicatat seperti biasa
+                    entry[0] = now - self.window
+                    entry[1] = 0
+                    entry[2] = None
+        return records
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'cid', None):
+            entry['cid'] = record.cid
+        if getattr(record, 'repeated', None):
+            entry['repeated'] = record.repeated
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if getattr(record, 'cid', None):
+            fields = dict(cid=record.cid, **fields)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if getattr(record, 'repeated', None):
+            line += f' (diulang {record.repeated}x)'
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler dengan antrian terbatas: jika penuh, record dibuang dan dihitung"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Field extra dan exc_info dipertahankan untuk formatter di thread listener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_queue_handler = None
+_repeat_filter = None
+
+
+def configure_logging(fmt=None, level=None):
+    """Ganti handler basicConfig dengan handler antrian non-blocking (dipanggil sekali di main)"""
+    global _listener, _queue_handler, _repeat_filter
+    if _listener is not None:
+        return _queue_handler
+
+    fmt = (fmt or os.getenv('LOG_FORMAT') or DEFAULT_LOG_FORMAT).lower()
+    level = (level or os.getenv('LOG_LEVEL') or DEFAULT_LOG_LEVEL).upper()
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+    _queue_handler.addFilter(ContextFilter())
+    _repeat_filter = RepeatFilter()
+    _queue_handler.addFilter(_repeat_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = QueueListener(_queue_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _queue_handler
+
+
+def flush_repeats(force=False):
+    """Tulis ringkasan pesan berulang yang tidak muncul lagi setelah jendelanya lewat (dipanggil periodik)"""
+    if _repeat_filter is None:
+        return 0
+    records = _repeat_filter.flush(force)
+    for record in records:
+        # Langsung ke antrian: lewat handle() akan disaring lagi oleh RepeatFilter
+        _queue_handler.enqueue(_queue_handler.prepare(record))
+    return len(records)
+
+
+def stop_logging():
+    """Tulis sisa antrian log ke disk"""
+    global _listener
+    if _listener is not None:
+        flush_repeats(force=True)
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
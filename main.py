@@ -1,6 +1,9 @@
 import logging
 import os
 import json
+import argparse
+
+from log_setup import configure_logging
 
 # Konfigurasi logging
 logging.basicConfig(
@@ -94,22 +97,45 @@ def setup_config():
     
     return config
 
+def parse_args():
+    """Argumen command line: mode polling (default) atau webhook"""
+    parser = argparse.ArgumentParser(description="Bot Email Forwarder")
+    parser.add_argument('--webhook', action='store_true',
+                        help="Terima update lewat webhook, bukan long polling")
+    parser.add_argument('--listen', help="Alamat listen server webhook (default WEBHOOK_LISTEN atau 0.0.0.0)")
+    parser.add_argument('--port', type=int, help="Port server webhook (default WEBHOOK_PORT atau 8443)")
+    return parser.parse_args()
+
 def main():
     """Fungsi utama untuk menjalankan bot"""
+    args = parse_args()
+    
     # Setup konfigurasi dulu
     config = setup_config()
     
+    # Log JSON lewat antrian non-blocking (LOG_FORMAT=text untuk format lama)
+    configure_logging(config.get('LOG_FORMAT'), config.get('LOG_LEVEL'))
+    
     if not config.get('TELEGRAM_BOT_TOKEN') or not config.get('TELEGRAM_OWNER_ID'):
         logger.error("Konfigurasi tidak lengkap! Jalankan ulang script.")
         return
     
+    # Tanpa URL publik PTB mendaftarkan https://<listen>:<port>/..., yang ditolak Telegram
+    webhook_url = config.get('WEBHOOK_URL') or os.getenv('WEBHOOK_URL')
+    if args.webhook and not (webhook_url or '').startswith('https://'):
+        logger.error("Mode --webhook membutuhkan WEBHOOK_URL (URL publik https://) di config.env")
+        return
+    
     # Import dan jalankan bot
     from telegram_bot import EmailForwarderBot
     
     logger.info("Memulai Bot Email Forwarder")
     try:
         bot = EmailForwarderBot()
-        bot.start_polling()
+        if args.webhook:
+            bot.start_webhook(listen=args.listen, port=args.port)
+        else:
+            bot.start_polling()
     except KeyboardInterrupt:
         logger.info("Bot dihentikan oleh pengguna")
     except Exception as e:
@@ -0,0 +1,261 @@
+import time
+import asyncio
+import logging
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Endpoint hanya untuk scraper lokal secara default
+METRICS_LISTEN = '127.0.0.1'
+METRICS_PATH = '/metrics'
+# Bucket histogram durasi (detik) - dari parse HTML (ms) sampai login IMAP yang lambat
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """Dasar metrik: nilai disimpan per tuple label di dict biasa (tanpa lock - hanya += di hot path)"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames) if self.labelnames else ()
+
+    def _samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, None, value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, key, extra, value in self._samples():
+            lines.append(f'{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in self.values.items():
+            yield f'{self.name}_total', key, None, value
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def set_total(self, value, **labels):
+        """Untuk counter yang sudah dihitung di tempat lain dan hanya disalin saat scrape"""
+        self.values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self.values.get(key)
+        if series is None:
+            # [jumlah per bucket..., +Inf], sum
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        series[1] += value
+
+    def _samples(self):
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', key, ('le', _format_value(float(bound))), cumulative
+            yield f'{self.name}_sum', key, None, total
+            yield f'{self.name}_count', key, None, cumulative
+
+
+class Registry:
+    """Kumpulan metrik; collector dipanggil saat scrape untuk gauge yang mahal dihitung di hot path"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, fn):
+        self.collectors.append(fn)
+
+    def render(self):
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Collector metrik error: {str(e)}")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# IMAP
+IMAP_CONNECT_SECONDS = REGISTRY.histogram(
+    'inbox_buddy_imap_connect_seconds', 'Durasi connect + login IMAP', ('result',))
+IMAP_MESSAGES_FETCHED = REGISTRY.counter(
+    'inbox_buddy_imap_messages_fetched', 'Email yang diambil dari server IMAP')
+IMAP_MESSAGES_FILTERED = REGISTRY.counter(
+    'inbox_buddy_imap_messages_filtered', 'Email setelah filter pengirim/subjek', ('result',))
+IMAP_BYTES_DOWNLOADED = REGISTRY.counter(
+    'inbox_buddy_imap_bytes_downloaded', 'Byte RFC822 yang diunduh dari server IMAP')
+
+# Parsing
+PARSE_SECONDS = REGISTRY.histogram(
+    'inbox_buddy_parse_seconds', 'Durasi parsing per extractor', ('extractor',))
+OTP_LOOKUPS = REGISTRY.counter(
+    'inbox_buddy_otp_lookups', 'Email yang lolos filter, per hasil pencarian OTP', ('result',))
+
+# Telegram
+TELEGRAM_SEND_SECONDS = REGISTRY.histogram(
+    'inbox_buddy_telegram_send_seconds', 'Durasi panggilan Bot API per jenis pesan', ('type',))
+TELEGRAM_SEND_RESULTS = REGISTRY.counter(
+    'inbox_buddy_telegram_sends', 'Hasil pengiriman ke Telegram', ('type', 'result'))
+TELEGRAM_RATE_LIMITED = REGISTRY.counter(
+    'inbox_buddy_telegram_rate_limited', 'RetryAfter (flood control) dari Telegram')
+
+# Penyimpanan
+# Counter dan gauge di bawah diisi collector saat scrape (tanpa biaya di hot path)
+JSON_WRITES = REGISTRY.counter(
+    'inbox_buddy_json_writes', 'File JSON yang ditulis ke disk')
+DB_ROWS_WRITTEN = REGISTRY.counter(
+    'inbox_buddy_db_rows_written', 'Baris database yang diubah sejak start', ('store',))
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    'inbox_buddy_log_records_dropped', 'Baris log yang dibuang karena antrian log penuh')
+QUEUE_DEPTH = REGISTRY.gauge(
+    'inbox_buddy_delivery_queue_depth', 'Isi antrian pengiriman per state', ('state',))
+ACTIVE_USERS = REGISTRY.gauge(
+    'inbox_buddy_active_users', 'User yang disetujui')
+UPTIME_SECONDS = REGISTRY.gauge(
+    'inbox_buddy_uptime_seconds', 'Detik sejak proses mulai')
+
+_STARTED = time.monotonic()
+REGISTRY.add_collector(lambda: UPTIME_SECONDS.set(round(time.monotonic() - _STARTED, 3)))
+
+
+class MetricsServer:
+    """HTTP server minimal (asyncio, tanpa dependency) untuk scrape Prometheus di GET /metrics"""
+
+    def __init__(self, port, listen=METRICS_LISTEN, registry=REGISTRY):
+        self.port = port
+        self.listen = listen
+        self.registry = registry
+        # path -> fungsi tanpa argumen yang mengembalikan (status, content type, body bytes)
+        self.routes = {METRICS_PATH: self._metrics}
+        self._server = None
+
+    def add_route(self, path, handler):
+        """Tambah endpoint GET lain di port yang sama (misal /health)"""
+        self.routes[path] = handler
+
+    def _metrics(self):
+        return '200 OK', CONTENT_TYPE, self.registry.render().encode('utf-8')
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        logger.info(f"Endpoint metrik aktif di http://{self.listen}:{self.port}{METRICS_PATH}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Buang header request
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+            content_type = CONTENT_TYPE
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                status, body = '405 Method Not Allowed', b''
+            elif path not in self.routes:
+                status, body = '404 Not Found', b''
+            else:
+                status, content_type, body = self.routes[path]()
+
+            head = (
+                f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+            ).encode('latin-1')
+            writer.write(head if parts and parts[0] == 'HEAD' else head + body)
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Request metrik gagal: {str(e)}")
+        finally:
+            writer.close()
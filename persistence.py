@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Jeda default untuk menggabungkan beberapa perubahan menjadi satu penulisan
+DEFAULT_DEBOUNCE = 0.5
+
+
+def atomic_write_bytes(path, payload):
+    """Menulis file secara atomik: tulis ke file sementara lalu rename"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # fsync direktori agar rename tetap ada setelah crash (tidak tersedia di semua OS)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+def atomic_write_json(path, data):
+    """Menyimpan data sebagai JSON secara atomik"""
+    atomic_write_bytes(path, json.dumps(data, indent=2).encode('utf-8'))
+
+
+class JsonPersistence:
+    """Penyimpanan JSON write-behind: atomik, debounce, dan ditulis di luar event loop"""
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE):
+        self.debounce = debounce
+        self._pending = {}
+        self._timers = {}
+        self._locks = {}
+        self._tasks = set()
+        self.metrics = {
+            "writes": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "last_latency": 0.0,
+            "max_latency": 0.0,
+            "total_latency": 0.0
+        }
+
+    def _write(self, path, payload):
+        """Tulis payload ke disk dan catat metrik"""
+        start = time.perf_counter()
+        try:
+            atomic_write_bytes(path, payload)
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"Error saving {path}: {str(e)}")
+            return False
+        latency = time.perf_counter() - start
+        self.metrics["writes"] += 1
+        self.metrics["last_latency"] = latency
+        self.metrics["total_latency"] += latency
+        self.metrics["max_latency"] = max(self.metrics["max_latency"], latency)
+        return True
+
+    def _snapshot(self, data_fn):
+        """Serialisasi data di event loop agar tidak bersaing dengan perubahan dict"""
+        return json.dumps(data_fn(), indent=2).encode('utf-8')
+
+    def save(self, path, data_fn):
+        """Jadwalkan penyimpanan; data_fn dipanggil saat flush untuk mengambil data terbaru"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Tidak ada event loop (startup/migrasi) - tulis langsung
+            return self._write(path, self._snapshot(data_fn))
+
+        if path in self._pending:
+            self.metrics["coalesced"] += 1
+        self._pending[path] = data_fn
+
+        if path not in self._timers:
+            self._timers[path] = loop.call_later(self.debounce, self._start_flush, path)
+        return True
+
+    def _start_flush(self, path):
+        self._timers.pop(path, None)
+        task = asyncio.get_running_loop().create_task(self._flush_path(path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_path(self, path):
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            data_fn = self._pending.pop(path, None)
+            if data_fn is None:
+                return
+            try:
+                payload = self._snapshot(data_fn)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logger.error(f"Error serializing {path}: {str(e)}")
+                return
+            await asyncio.to_thread(self._write, path, payload)
+
+    async def flush(self):
+        """Tulis semua perubahan yang tertunda sekarang (dipanggil saat shutdown)"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+        await asyncio.gather(*(self._flush_path(path) for path in list(self._pending)))
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def flush_sync(self):
+        """Flush tanpa event loop (fallback jika loop sudah berhenti)"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+        for path, data_fn in list(self._pending.items()):
+            self._pending.pop(path, None)
+            self._write(path, self._snapshot(data_fn))
+
+    def stats(self):
+        """Ringkasan metrik penulisan"""
+        writes = self.metrics["writes"]
+        avg = self.metrics["total_latency"] / writes if writes else 0.0
+        return dict(self.metrics, avg_latency=avg, pending=len(self._pending))
@@ -0,0 +1,83 @@
+import time
+import logging
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Setelah email cocok masuk, tetap poll cepat selama ini (OTP sering dikirim ulang beruntun)
+HOT_WINDOW = 120
+# Faktor backoff saat idle
+BACKOFF_FACTOR = 2.0
+# Batas atas interval default (detik)
+DEFAULT_MAX_INTERVAL = 60
+
+
+class AdaptivePollScheduler:
+    """Interval polling adaptif: cepat setelah ada email/permintaan OTP, melambat saat sepi
+
+    min_interval adalah batas bawah per server (check_interval); max_interval = 0 berarti
+    interval tetap seperti sebelumnya.
+    """
+
+    def __init__(self, min_interval, max_interval=DEFAULT_MAX_INTERVAL,
+                 hot_window=HOT_WINDOW, backoff=BACKOFF_FACTOR):
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.hot_window = hot_window
+        self.backoff = backoff
+        self.interval = self.min_interval
+        self.hot_until = 0.0
+        self.accounts = {}
+
+    def configure(self, min_interval, max_interval):
+        self.min_interval = max(1.0, float(min_interval))
+        self.max_interval = float(max_interval)
+        self.interval = min(max(self.interval, self.min_interval), self.ceiling())
+
+    def ceiling(self):
+        return max(self.min_interval, self.max_interval) if self.max_interval > 0 else self.min_interval
+
+    def is_hot(self):
+        return time.monotonic() < self.hot_until
+
+    def kick(self, reason="demand"):
+        """Ada sinyal OTP akan datang (email cocok / user meminta OTP): kembali ke interval minimum"""
+        self.hot_until = time.monotonic() + self.hot_window
+        self.interval = self.min_interval
+        logger.info(f"Polling dipercepat ({reason}), interval {self.interval:.0f} detik")
+
+    def record(self, account, found, duration):
+        """Catat hasil satu poll dan kembalikan jeda sampai poll berikutnya"""
+        stats = self.accounts.setdefault(account, {
+            "polls": 0, "found": 0, "empty_streak": 0, "total_duration": 0.0,
+            "last_found_at": None, "interval": self.interval
+        })
+        stats["polls"] += 1
+        stats["total_duration"] += duration
+
+        if found:
+            stats["found"] += found
+            stats["empty_streak"] = 0
+            stats["last_found_at"] = time.time()
+            self.kick("email masuk")
+        else:
+            stats["empty_streak"] += 1
+            if not self.is_hot():
+                self.interval = min(self.interval * self.backoff, self.ceiling())
+
+        stats["interval"] = self.interval
+        return self.interval
+
+    def stats(self):
+        return {
+            account: dict(
+                stats,
+                avg_duration=stats["total_duration"] / stats["polls"] if stats["polls"] else 0.0,
+                hot=self.is_hot()
+            )
+            for account, stats in self.accounts.items()
+        }
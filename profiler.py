@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Jeda antar sampel stack (detik) - 100 Hz cukup untuk hotspot tanpa membebani bot
+SAMPLE_INTERVAL = 0.01
+# Lama profil default dan maksimal (detik)
+DEFAULT_WINDOW = 60
+MAX_WINDOW = 600
+# Jumlah baris hotspot di laporan
+TOP_N = 25
+# Kedalaman stack yang disimpan tracemalloc per alokasi
+TRACEMALLOC_FRAMES = 1
+
+# Frame Python tempat thread menunggu tanpa bekerja (event loop di select, worker thread menunggu job)
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _format_function(key):
+    filename, lineno, name = key
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+class SamplingProfiler:
+    """Sampling profiler untuk semua thread (event loop + thread polling IMAP) dengan diff tracemalloc opsional
+
+    cProfile hanya melihat thread yang mengaktifkannya, sedangkan fetch/parse email berjalan di
+    asyncio.to_thread - karena itu stack semua thread diambil berkala lewat sys._current_frames().
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, sizes_fn=None):
+        self.interval = interval
+        # sizes_fn() -> {nama: jumlah item} untuk container yang bisa tumbuh tanpa batas
+        self.sizes_fn = sizes_fn
+        self._thread = None
+        self._stop = threading.Event()
+        # /profile stop dan timer otomatis bisa memanggil stop() bersamaan dari thread berbeda
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.started_at = None
+        self.stopped_at = None
+        self.ticks = 0
+        self.busy = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.thread_counts = Counter()
+        self.trace_memory = False
+        self._snapshot = None
+        self._started_tracemalloc = False
+        self._sizes = {}
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or time.monotonic()) - self.started_at
+
+    def start(self, trace_memory=False):
+        with self._lock:
+            return self._start(trace_memory)
+
+    def _start(self, trace_memory):
+        if self.running:
+            return False
+        self._reset()
+        self.trace_memory = trace_memory
+        self._sizes = self._container_sizes()
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._snapshot = self._take_snapshot()
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Profiler aktif (memori: {'ya' if trace_memory else 'tidak'})")
+        return True
+
+    def stop(self, top=TOP_N):
+        """Hentikan profil dan kembalikan laporan teks (None jika profiler sudah berhenti)"""
+        with self._lock:
+            return self._stop_locked(top)
+
+    def _stop_locked(self, top):
+        if not self.running:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped_at = time.monotonic()
+        report = self.report(top)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self._snapshot = None
+        logger.info(f"Profiler berhenti setelah {self.elapsed():.1f} detik, {self.ticks} sampel")
+        return report
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_key(frame))
+                    frame = frame.f_back
+                self.self_counts[stack[0]] += 1
+                # Fungsi rekursif cukup dihitung sekali per sampel
+                self.total_counts.update(set(stack))
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.thread_counts[names.get(thread_id, str(thread_id))] += 1
+                self.busy += 1
+            self.ticks += 1
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def _container_sizes(self):
+        if self.sizes_fn is None:
+            return {}
+        try:
+            return dict(self.sizes_fn())
+        except Exception as e:
+            logger.error(f"Gagal membaca ukuran container: {str(e)}")
+            return {}
+
+    def report(self, top=TOP_N):
+        elapsed = self.elapsed()
+        lines = [
+            f"Profil {elapsed:.1f} detik, {self.ticks} tick x {self.interval * 1000:.0f} ms, "
+            f"{self.busy} sampel thread sibuk",
+            "",
+        ]
+
+        if self.thread_counts:
+            lines.append("Thread sibuk:")
+            for name, count in self.thread_counts.most_common():
+                lines.append(f"  {count:>7}  {name}")
+            lines.append("")
+
+        for title, counts in (("Top self (fungsi yang sedang berjalan)", self.self_counts),
+                              ("Top kumulatif (termasuk fungsi yang dipanggil)", self.total_counts)):
+            lines.append(f"{title}:")
+            lines.append(f"  {'%':>6} {'sampel':>7}  fungsi")
+            for key, count in counts.most_common(top):
+                pct = count / self.busy * 100 if self.busy else 0.0
+                lines.append(f"  {pct:>6.1f} {count:>7}  {_format_function(key)}")
+            if not counts:
+                lines.append("  (tidak ada sampel - bot idle selama profil)")
+            lines.append("")
+
+        sizes = self._container_sizes()
+        if sizes:
+            lines.append("Ukuran container (awal -> akhir):")
+            for name, size in sizes.items():
+                lines.append(f"  {name}: {self._sizes.get(name, '-')} -> {size}")
+            lines.append("")
+
+        if self.trace_memory and self._snapshot is not None:
+            snapshot = self._take_snapshot()
+            stats = snapshot.compare_to(self._snapshot, 'lineno')
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"Memori (tracemalloc): sekarang {current / 1024:.0f} KiB, puncak {peak / 1024:.0f} KiB")
+            lines.append(f"Top {top} pertumbuhan per baris:")
+            for stat in stats[:top]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"  {stat.size_diff / 1024:>+9.1f} KiB {stat.count_diff:>+7} blok  "
+                    f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                )
+            lines.append("")
+
+        return "\n".join(lines)
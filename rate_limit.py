@@ -0,0 +1,110 @@
+import time
+import asyncio
+import logging
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Batas Telegram: ~30 pesan/detik global, ~1 pesan/detik per chat (dengan sedikit burst)
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+PER_CHAT_BURST = 3
+# Token yang disisakan untuk pengiriman live saat task latar belakang meminta jatah
+BACKGROUND_RESERVE = 10
+
+
+def retry_after_seconds(error):
+    """Durasi RetryAfter dalam detik (int di PTB lama, timedelta di PTB baru)"""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+class TokenBucket:
+    """Token bucket sederhana untuk asyncio"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def delay(self):
+        """Berapa detik sampai satu token tersedia (0 jika sudah tersedia)"""
+        now = self._refill()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def try_acquire(self, reserve=0):
+        """Ambil token tanpa menunggu, hanya jika masih tersisa lebih dari reserve"""
+        if self.delay() == 0 and self.tokens >= 1 + reserve:
+            self.take()
+            return True
+        return False
+
+    def block(self, seconds):
+        """Tahan bucket selama beberapa detik (setelah RetryAfter)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class RateLimiter:
+    """Gabungan bucket global dan bucket per chat"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE, per_chat_burst=PER_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.chat_buckets = {}
+        self._lock = asyncio.Lock()
+
+    def _chat_bucket(self, chat_id):
+        key = str(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            bucket = self.chat_buckets[key] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id):
+        """Tunggu sampai boleh mengirim ke chat_id"""
+        chat_bucket = self._chat_bucket(chat_id)
+        while True:
+            async with self._lock:
+                wait = max(self.global_bucket.delay(), chat_bucket.delay())
+                if wait == 0:
+                    self.global_bucket.take()
+                    chat_bucket.take()
+                    return
+            await asyncio.sleep(wait)
+
+    def try_acquire_background(self, chat_id, reserve=BACKGROUND_RESERVE):
+        """Jatah untuk task latar belakang (sweeper) - tidak pernah memakai token cadangan live"""
+        chat_bucket = self._chat_bucket(chat_id)
+        if chat_bucket.delay() > 0:
+            return False
+        if not self.global_bucket.try_acquire(reserve=reserve):
+            return False
+        chat_bucket.take()
+        return True
+
+    def penalize(self, chat_id, seconds, global_flood=False):
+        """Tahan pengiriman ke chat (atau semua chat) setelah RetryAfter"""
+        self._chat_bucket(chat_id).block(seconds)
+        if global_flood:
+            self.global_bucket.block(seconds)
@@ -0,0 +1,147 @@
+from collections import namedtuple
+
+# Batas Telegram dihitung dalam UTF-16 code unit setelah entity HTML diparse
+TELEGRAM_MAX_LENGTH = 4096
+TELEGRAM_MAX_CAPTION = 1024
+
+TRUNCATED_MARKER = "...\n[Pesan terpotong karena terlalu panjang]"
+
+RenderedMessage = namedtuple('RenderedMessage', ['html', 'plain'])
+
+
+def escape_html(text):
+    """Escape karakter HTML khusus dalam teks"""
+    if not text:
+        return ""
+    return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def utf16_len(text):
+    """Panjang teks seperti yang dihitung Telegram (UTF-16 code unit)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def truncate_utf16(text, limit):
+    """Potong teks agar panjang UTF-16-nya <= limit tanpa memecah surrogate pair"""
+    if utf16_len(text) <= limit:
+        return text
+    encoded = text.encode('utf-16-le')[:max(0, limit) * 2]
+    return encoded.decode('utf-16-le', errors='ignore')
+
+
+def cap_text(text, limit, marker=TRUNCATED_MARKER):
+    """Batasi teks biasa ke limit, tambahkan marker jika dipotong"""
+    text = text or ""
+    if utf16_len(text) <= limit:
+        return text
+    return truncate_utf16(text, limit - utf16_len(marker)) + marker
+
+
+class MessageBuilder:
+    """Menyusun pesan sebagai segmen (tag, teks) lalu merender HTML dan plain sekaligus"""
+
+    def __init__(self):
+        self.segments = []
+
+    def text(self, value):
+        self.segments.append((None, str(value)))
+        return self
+
+    def bold(self, value):
+        self.segments.append(('b', str(value)))
+        return self
+
+    def code(self, value):
+        self.segments.append(('code', str(value)))
+        return self
+
+    def visible_length(self):
+        """Panjang teks yang terlihat (sama untuk HTML dan plain)"""
+        return sum(utf16_len(value) for _, value in self.segments)
+
+    def render(self):
+        html_parts = []
+        plain_parts = []
+        for tag, value in self.segments:
+            escaped = escape_html(value)
+            html_parts.append(f"<{tag}>{escaped}</{tag}>" if tag else escaped)
+            plain_parts.append(value)
+        return RenderedMessage(''.join(html_parts), ''.join(plain_parts))
+
+
+def render_email(email, limit=TELEGRAM_MAX_LENGTH):
+    """Render email sekali menjadi varian HTML dan plain, keduanya <= limit"""
+    header = MessageBuilder()
+    header.bold("📧 Email Baru").text("\n\n")
+    header.bold("Dari:").text(f" {email.get('from') or ''}\n")
+    header.bold("Subjek:").text(f" {email.get('subject') or ''}\n")
+    date = email.get('date')
+    date_display = date.strftime('%Y-%m-%d %H:%M:%S') if hasattr(date, 'strftime') else str(date or '')
+    header.bold("Tanggal:").text(f" {date_display}\n\n")
+
+    if email.get('otp_code'):
+        header.bold("🔑 OTP CODE:").text(" ").code(email['otp_code']).text("\n\n")
+
+    if email.get('full_content'):
+        body_title, body = "Isi Email Lengkap:", email['full_content']
+    elif email.get('body_text'):
+        body_title, body = "Isi Email:", email['body_text']
+    else:
+        body_title, body = None, ""
+
+    footer = MessageBuilder()
+    if email.get('attachments'):
+        footer.bold("Lampiran:").text(f" {len(email['attachments'])} file\n")
+
+    if body_title:
+        header.bold(body_title).text("\n\n")
+        # Sisa kuota untuk isi email setelah header, footer, dan pemisah
+        budget = limit - header.visible_length() - footer.visible_length() - utf16_len("\n\n")
+        header.text(cap_text(body, max(0, budget)) + "\n\n")
+
+    header.segments.extend(footer.segments)
+    rendered = header.render()
+
+    # Jaga-jaga jika header saja sudah melebihi batas (subjek sangat panjang)
+    if utf16_len(rendered.plain) > limit:
+        plain = cap_text(rendered.plain, limit)
+        return RenderedMessage(escape_html(plain), plain)
+    return rendered
+
+
+def render_caption(text, limit=TELEGRAM_MAX_CAPTION):
+    """Caption dokumen (HTML di-escape) yang dibatasi panjangnya"""
+    return escape_html(cap_text(text, limit, marker="..."))
+
+
+def render_email_batch(emails, limit=TELEGRAM_MAX_LENGTH):
+    """Render beberapa email (burst OTP) menjadi satu pesan dengan semua OTP di bagian atas"""
+    if len(emails) == 1:
+        return render_email(emails[0], limit)
+
+    message = MessageBuilder()
+    message.bold(f"📧 {len(emails)} Email Baru").text("\n\n")
+
+    otp_emails = [email for email in emails if email.get('otp_code')]
+    if otp_emails:
+        message.bold("🔑 OTP CODE:").text("\n")
+        for email in otp_emails:
+            message.text("• ").code(email['otp_code']).text(f" - {email.get('subject') or ''}\n")
+        message.text("\n")
+
+    for index, email in enumerate(emails, 1):
+        date = email.get('date')
+        date_display = date.strftime('%H:%M:%S') if hasattr(date, 'strftime') else str(date or '')
+        message.bold(f"{index}. {email.get('subject') or ''}").text("\n")
+        message.text(f"Dari: {email.get('from') or ''}\nTanggal: {date_display}\n")
+        if email.get('otp_code'):
+            message.text("OTP: ").code(email['otp_code']).text("\n")
+        if email.get('attachments'):
+            message.text(f"Lampiran: {len(email['attachments'])} file\n")
+        message.text("\n")
+
+    rendered = message.render()
+    if utf16_len(rendered.plain) > limit:
+        plain = cap_text(rendered.plain, limit)
+        return RenderedMessage(escape_html(plain), plain)
+    return rendered
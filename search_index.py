@@ -0,0 +1,284 @@
+import os
+import re
+import mmap
+import struct
+import logging
+import threading
+
+from persistence import atomic_write_bytes
+from email_archive import ARCHIVE_TEXT_CHARS
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# File index pencarian (base yang di-mmap)
+SEARCH_INDEX_FILE = 'email_archive/search_index.bin'
+# Jumlah posting di memori sebelum digabung ke file base
+MERGE_THRESHOLD = 2000
+
+INDEX_MAGIC = b'SIX1'
+# magic, max_seq, jumlah term, offset blok string, offset blok posting
+INDEX_HEADER = struct.Struct('>4sQIQQ')
+# offset term, panjang term, offset posting, panjang posting (dalam byte)
+DICT_ENTRY = struct.Struct('>IHQI')
+
+TOKEN_RE = re.compile(r'[0-9a-zà-ÿ]{2,32}')
+
+
+def tokenize(text):
+    """Memecah teks menjadi token unik (lowercase, 2-32 karakter)"""
+    if not text:
+        return set()
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def encode_postings(seqs):
+    """Encode daftar seq terurut sebagai delta varint"""
+    out = bytearray()
+    previous = 0
+    for seq in seqs:
+        delta = seq - previous
+        previous = seq
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_postings(data):
+    """Decode delta varint menjadi daftar seq"""
+    seqs = []
+    value = 0
+    shift = 0
+    current = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        current += value
+        seqs.append(current)
+        value = 0
+        shift = 0
+    return seqs
+
+
+class _BaseIndex:
+    """File index base yang dibaca langsung lewat mmap (tanpa memuat ke memori)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.max_seq = 0
+        self.term_count = 0
+        self._file = None
+        self._mmap = None
+
+        if not os.path.exists(path) or os.path.getsize(path) < INDEX_HEADER.size:
+            return
+        try:
+            self._file = open(path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.max_seq, self.term_count, self._strings_at, self._postings_at = \
+                INDEX_HEADER.unpack_from(self._mmap, 0)
+            if magic != INDEX_MAGIC:
+                raise ValueError("magic index tidak valid")
+        except Exception as e:
+            logger.error(f"Gagal membuka index pencarian {path}: {str(e)}")
+            self.close()
+            self.max_seq = 0
+            self.term_count = 0
+
+    def _entry(self, i):
+        return DICT_ENTRY.unpack_from(self._mmap, INDEX_HEADER.size + i * DICT_ENTRY.size)
+
+    def _term(self, entry):
+        start = self._strings_at + entry[0]
+        return self._mmap[start:start + entry[1]]
+
+    def lookup(self, token):
+        """Binary search term di dictionary, return daftar seq"""
+        if self._mmap is None:
+            return []
+        key = token.encode('utf-8')
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term = self._term(self._entry(mid))
+            if term < key:
+                lo = mid + 1
+            elif term > key:
+                hi = mid
+            else:
+                entry = self._entry(mid)
+                start = self._postings_at + entry[2]
+                return decode_postings(self._mmap[start:start + entry[3]])
+        return []
+
+    def items(self):
+        """Iterasi semua (term, seqs) - dipakai saat merge"""
+        for i in range(self.term_count):
+            entry = self._entry(i)
+            start = self._postings_at + entry[2]
+            yield self._term(entry).decode('utf-8'), decode_postings(self._mmap[start:start + entry[3]])
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def write_index(path, postings, max_seq):
+    """Tulis index base: header | dictionary | string term | posting"""
+    terms = sorted(postings)
+    strings = bytearray()
+    blobs = bytearray()
+    dictionary = bytearray()
+    for term in terms:
+        encoded_term = term.encode('utf-8')
+        encoded_postings = encode_postings(postings[term])
+        dictionary += DICT_ENTRY.pack(len(strings), len(encoded_term), len(blobs), len(encoded_postings))
+        strings += encoded_term
+        blobs += encoded_postings
+
+    strings_at = INDEX_HEADER.size + len(dictionary)
+    postings_at = strings_at + len(strings)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, max_seq, len(terms), strings_at, postings_at)
+    atomic_write_bytes(path, header + bytes(dictionary) + bytes(strings) + bytes(blobs))
+
+
+class SearchIndex:
+    """Inverted index token -> seq arsip; base di-mmap, tambahan baru di memori"""
+
+    def __init__(self, path=SEARCH_INDEX_FILE, merge_threshold=MERGE_THRESHOLD):
+        self.path = path
+        self.merge_threshold = merge_threshold
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._delta = {}
+        self._frozen = {}
+        self._delta_postings = 0
+        self._delta_max_seq = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._base = _BaseIndex(path)
+
+    @property
+    def max_seq(self):
+        with self._lock:
+            return max(self._base.max_seq, self._delta_max_seq)
+
+    def add(self, seq, *texts):
+        """Menambahkan dokumen ke index di memori (murah, dipanggil di pipeline parsing)"""
+        tokens = set()
+        for text in texts:
+            tokens |= tokenize(text)
+        with self._lock:
+            for token in tokens:
+                self._delta.setdefault(token, []).append(seq)
+            self._delta_postings += len(tokens)
+            self._delta_max_seq = max(self._delta_max_seq, seq)
+            return self._delta_postings >= self.merge_threshold
+
+    def add_email(self, seq, email_obj):
+        """Index satu email (subjek, pengirim, OTP, dan isi)"""
+        text = email_obj.get('full_content') or email_obj.get('body_text') or email_obj.get('text') or ''
+        return self.add(
+            seq,
+            email_obj.get('subject'),
+            email_obj.get('from'),
+            email_obj.get('otp_code') or email_obj.get('otp'),
+            # Sepanjang teks yang disimpan arsip, supaya hasil /search sama sebelum dan sesudah restart
+            text[:ARCHIVE_TEXT_CHARS]
+        )
+
+    def _postings_for(self, token):
+        with self._lock:
+            base = self._base
+            extra = self._frozen.get(token, []) + self._delta.get(token, [])
+        return base.lookup(token) + extra
+
+    def search(self, query, limit=10):
+        """Mencari seq yang mengandung semua token query (terbaru lebih dulu)"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        result = None
+        # Mulai dari posting terpendek supaya intersection cepat
+        for postings in sorted((self._postings_for(t) for t in tokens), key=len):
+            current = set(postings)
+            result = current if result is None else result & current
+            if not result:
+                return []
+        return sorted(result, reverse=True)[:limit]
+
+    def merge(self, min_seq=0):
+        """Gabungkan posting di memori ke file base baru (jalankan di thread terpisah)"""
+        with self._merge_lock:
+            with self._lock:
+                if not self._delta:
+                    return False
+                self._frozen = self._delta
+                self._delta = {}
+                self._delta_postings = 0
+                base = self._base
+                frozen = self._frozen
+                max_seq = max(base.max_seq, self._delta_max_seq)
+
+            merged = {}
+            for term, seqs in base.items():
+                kept = [seq for seq in seqs if seq >= min_seq]
+                if kept:
+                    merged[term] = kept
+            for term, seqs in frozen.items():
+                kept = [seq for seq in seqs if seq >= min_seq]
+                if kept:
+                    merged.setdefault(term, []).extend(kept)
+
+            try:
+                write_index(self.path, merged, max_seq)
+            except Exception as e:
+                logger.error(f"Gagal menulis index pencarian: {str(e)}")
+                with self._lock:
+                    # Kembalikan posting ke delta supaya tidak hilang
+                    for term, seqs in self._frozen.items():
+                        self._delta[term] = seqs + self._delta.get(term, [])
+                        self._delta_postings += len(seqs)
+                    self._frozen = {}
+                return False
+
+            new_base = _BaseIndex(self.path)
+            with self._lock:
+                self._base = new_base
+                self._frozen = {}
+            # Base lama ditutup oleh GC setelah query yang sedang berjalan selesai
+            logger.info(f"Index pencarian digabung: {len(merged)} term, seq maks {max_seq}")
+            return True
+
+    def rebuild_from_archive(self, archive):
+        """Index ulang record arsip yang belum masuk ke file base (setelah restart)"""
+        start = self._base.max_seq
+        count = 0
+        for entry in list(archive.entries):
+            if entry.seq <= start:
+                continue
+            try:
+                self.add_email(entry.seq, archive.read(entry))
+                count += 1
+            except Exception as e:
+                logger.error(f"Gagal index ulang seq {entry.seq}: {str(e)}")
+        if count:
+            logger.info(f"Index pencarian: {count} email dari arsip di-index ulang")
+        return count
+
+    def close(self):
+        with self._lock:
+            self._base.close()
@@ -0,0 +1,164 @@
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Database lokal pengganti tabel Supabase sent_messages
+SENT_MESSAGES_DB = 'sent_messages.db'
+
+# Jenis pesan yang dicatat
+KIND_OTP = 'otp'
+KIND_ATTACHMENT = 'attachment'
+KIND_NOTICE = 'notice'
+KIND_BROADCAST = 'broadcast'
+
+# Skema DATABASE_URL untuk backend Postgres (butuh psycopg atau psycopg2, lihat requirements.txt)
+POSTGRES_SCHEMES = ('postgres', 'postgresql')
+
+
+class SentMessageStore:
+    """Basis penyimpanan id pesan Telegram yang terkirim (tabel sent_messages)"""
+
+    placeholder = '?'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.conn = None
+
+    def _execute(self, sql, params=(), many=False, fetch=False):
+        sql = sql.replace('?', self.placeholder)
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                if many:
+                    cursor.executemany(sql, params)
+                else:
+                    cursor.execute(sql, params)
+                rows = cursor.fetchall() if fetch else None
+                self.conn.commit()
+                return rows
+            finally:
+                cursor.close()
+
+    def record_many(self, rows, kind=KIND_OTP):
+        """Mencatat banyak pesan sekaligus: rows = [(chat_id, message_id), ...]"""
+        sent_at = datetime.now(timezone.utc)
+        self.record_batch([(chat_id, message_id, kind, sent_at) for chat_id, message_id in rows])
+
+    def record_batch(self, rows):
+        """Mencatat pesan dengan jenis dan waktu kirim masing-masing: rows = [(chat_id, message_id, kind, sent_at), ...]"""
+        if not rows:
+            return
+        self._execute(
+            "INSERT INTO sent_messages (telegram_message_id, chat_id, sent_at, kind) VALUES (?, ?, ?, ?)",
+            [(str(message_id), str(chat_id), self._timestamp(sent_at), kind)
+             for chat_id, message_id, kind, sent_at in rows],
+            many=True
+        )
+
+    def record(self, chat_id, message_id, kind=KIND_OTP):
+        """Mencatat satu pesan yang terkirim"""
+        self.record_many([(chat_id, message_id)], kind)
+
+    def expired(self, cutoff, kind=KIND_OTP, limit=50):
+        """Pesan tertua yang lebih lama dari cutoff (memakai index sent_at)"""
+        return self._execute(
+            "SELECT id, chat_id, telegram_message_id FROM sent_messages "
+            "WHERE sent_at < ? AND kind = ? ORDER BY sent_at LIMIT ?",
+            (self._timestamp(cutoff), kind, limit),
+            fetch=True
+        )
+
+    def delete(self, ids):
+        """Menghapus record setelah pesan dihapus dari Telegram"""
+        if not ids:
+            return
+        self._execute("DELETE FROM sent_messages WHERE id = ?", [(i,) for i in ids], many=True)
+
+    def count(self, kind=None):
+        if kind is None:
+            rows = self._execute("SELECT COUNT(*) FROM sent_messages", fetch=True)
+        else:
+            rows = self._execute("SELECT COUNT(*) FROM sent_messages WHERE kind = ?", (kind,), fetch=True)
+        return rows[0][0]
+
+    def _timestamp(self, value):
+        return value
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class SqliteSentMessageStore(SentMessageStore):
+    """Backend SQLite lokal dengan skema yang sama seperti migrasi Supabase"""
+
+    def __init__(self, path=SENT_MESSAGES_DB):
+        super().__init__()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sent_messages ("
+            "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "  telegram_message_id TEXT NOT NULL,"
+            "  chat_id TEXT NOT NULL,"
+            "  sent_at TEXT NOT NULL,"
+            "  kind TEXT NOT NULL DEFAULT 'otp'"
+            ");"
+            "CREATE INDEX IF NOT EXISTS idx_sent_messages_sent_at ON sent_messages(sent_at);"
+            "CREATE INDEX IF NOT EXISTS idx_sent_messages_kind_sent_at ON sent_messages(kind, sent_at);"
+        )
+        self.conn.commit()
+
+    def _timestamp(self, value):
+        # ISO-8601 UTC dengan lebar tetap supaya urutan string = urutan waktu
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class PostgresSentMessageStore(SentMessageStore):
+    """Backend Postgres (misal Supabase) memakai tabel public.sent_messages"""
+
+    placeholder = '%s'
+
+    def __init__(self, dsn):
+        super().__init__()
+        try:
+            import psycopg
+            self.conn = psycopg.connect(dsn)
+        except ImportError:
+            try:
+                import psycopg2
+            except ImportError:
+                raise RuntimeError("Backend Postgres membutuhkan paket psycopg atau psycopg2")
+            self.conn = psycopg2.connect(dsn)
+
+
+def create_sent_message_store(database_url=None):
+    """Pilih backend: Postgres jika DATABASE_URL diatur, selain itu SQLite lokal"""
+    if not database_url:
+        return SqliteSentMessageStore(SENT_MESSAGES_DB)
+    scheme, sep, rest = database_url.partition('://')
+    if not sep:
+        # Tanpa skema = path file SQLite
+        return SqliteSentMessageStore(database_url)
+    scheme = scheme.lower()
+    if scheme in POSTGRES_SCHEMES:
+        logger.info("Menggunakan Postgres untuk sent_messages")
+        return PostgresSentMessageStore(database_url)
+    if scheme == 'sqlite':
+        # sqlite:///path/relatif.db atau sqlite:////path/absolut.db
+        return SqliteSentMessageStore(rest[1:] if rest.startswith('/') else rest)
+    raise ValueError(
+        f"Skema DATABASE_URL tidak didukung: {scheme}:// "
+        f"(gunakan postgresql://, sqlite:/// atau path file SQLite)"
+    )
@@ -0,0 +1,127 @@
+import os
+import json
+import logging
+from persistence import atomic_write_json
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# File untuk menyimpan settings
+SETTINGS_FILE = 'bot_settings.json'
+
+DEFAULT_SETTINGS = {
+    "email_host": "imap.gmail.com",
+    "email_port": 993,
+    "email_username": "",
+    "email_password": "",
+    "email_folder": "INBOX",
+    "filter_sender": "support@info.airwallex.com",
+    "filter_subject": "Your one-time passcode is",
+    "check_interval": 2,
+    "otp_ttl_minutes": 0,
+    "coalesce_ms": 0,
+    "poll_max_interval": 60
+}
+
+# Field yang membutuhkan koneksi IMAP baru jika berubah
+CONNECTION_KEYS = {"email_host", "email_port", "email_username", "email_password", "email_folder"}
+
+
+def load_settings(path=SETTINGS_FILE):
+    """Memuat settings dari file JSON"""
+    default_settings = dict(DEFAULT_SETTINGS)
+
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                saved = json.load(f)
+                # Merge dengan default untuk field yang mungkin belum ada
+                default_settings.update(saved)
+        else:
+            # Buat file settings baru
+            save_settings(default_settings, path)
+    except Exception as e:
+        logger.error(f"Error loading settings: {str(e)}")
+
+    return default_settings
+
+
+def save_settings(settings, path=SETTINGS_FILE):
+    """Menyimpan settings ke file JSON"""
+    try:
+        atomic_write_json(path, settings)
+        logger.info("Settings saved successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving settings: {str(e)}")
+        return False
+
+
+class SettingsStore:
+    """Cache settings yang hanya membaca ulang file jika mtime/inode berubah"""
+
+    def __init__(self, path=SETTINGS_FILE):
+        self.path = path
+        self._listeners = []
+        self._signature = None
+        self._settings = load_settings(self.path)
+        self._signature = self._file_signature()
+
+    def _file_signature(self):
+        """Tanda tangan file (inode, mtime, size) untuk mendeteksi perubahan"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def subscribe(self, callback):
+        """Daftarkan callback(changed_keys, settings) yang dipanggil saat settings berubah"""
+        self._listeners.append(callback)
+
+    def _apply(self, new_settings):
+        """Ganti cache dan kirim event hanya untuk field yang benar-benar berubah"""
+        old_settings = self._settings
+        self._settings = new_settings
+        changed = {
+            key for key in set(old_settings) | set(new_settings)
+            if old_settings.get(key) != new_settings.get(key)
+        }
+        if not changed:
+            return changed
+
+        logger.info(f"Settings berubah: {', '.join(sorted(changed))}")
+        for callback in list(self._listeners):
+            try:
+                callback(changed, new_settings)
+            except Exception as e:
+                logger.error(f"Error pada listener settings: {str(e)}")
+        return changed
+
+    def refresh(self):
+        """Reload dari file hanya jika file berubah sejak terakhir dibaca"""
+        signature = self._file_signature()
+        if signature is not None and signature == self._signature:
+            return set()
+
+        self._signature = signature
+        return self._apply(load_settings(self.path))
+
+    def get(self):
+        """Mendapatkan settings terbaru (dari cache jika file tidak berubah)"""
+        self.refresh()
+        return self._settings
+
+    def update(self, **changes):
+        """Mengubah satu atau beberapa field, menyimpan ke file dan mengirim event"""
+        new_settings = dict(self._settings)
+        new_settings.update(changes)
+        if not save_settings(new_settings, self.path):
+            return False
+        self._signature = self._file_signature()
+        self._apply(new_settings)
+        return True
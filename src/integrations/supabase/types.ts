@@ -81,18 +81,21 @@ export type Database = {
         Row: {
           chat_id: string
           id: string
+          kind: string
           sent_at: string
           telegram_message_id: string
         }
         Insert: {
           chat_id: string
           id?: string
+          kind?: string
           sent_at?: string
           telegram_message_id: string
         }
         Update: {
           chat_id?: string
           id?: string
+          kind?: string
           sent_at?: string
           telegram_message_id?: string
         }
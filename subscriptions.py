@@ -0,0 +1,130 @@
+import logging
+from collections import deque
+from email.utils import parseaddr
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Batas jumlah aturan langganan per user
+MAX_SUBSCRIPTIONS = 20
+MIN_KEYWORD_LENGTH = 3
+
+
+def normalize_rule(rule):
+    """Normalisasi aturan: '@domain.com' / 'domain.com' untuk domain, selain itu kata kunci"""
+    rule = (rule or "").strip().lower()
+    if not rule:
+        return None
+    if rule.startswith('@'):
+        rule = rule[1:]
+        return f"@{rule}" if rule else None
+    if '.' in rule and ' ' not in rule:
+        return f"@{rule}"
+    if len(rule) < MIN_KEYWORD_LENGTH:
+        return None
+    return rule
+
+
+def sender_domain(sender):
+    """Domain alamat pengirim dari header From"""
+    address = parseaddr(sender or "")[1].lower()
+    return address.rpartition('@')[2] if '@' in address else ""
+
+
+class KeywordAutomaton:
+    """Automaton Aho-Corasick: semua kata kunci dicocokkan dalam satu kali jalan atas teks"""
+
+    def __init__(self, keywords):
+        # goto[state] = {char: state}, output[state] = kata kunci yang berakhir di state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+            state = nxt
+        self.output[state].add(keyword)
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] |= self.output[self.fail[nxt]]
+
+    def find(self, text):
+        """Set kata kunci yang muncul di text"""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return found
+
+
+class SubscriptionMatcher:
+    """Index aturan langganan semua user, dikompilasi sekali dari approved_users"""
+
+    def __init__(self, approved_users):
+        # User tanpa aturan menerima semua email (perilaku lama)
+        self.unfiltered = set()
+        self.by_domain = {}
+        self.by_keyword = {}
+        for user_id, user_data in approved_users.items():
+            rules = user_data.get("subscriptions") or []
+            if not rules:
+                self.unfiltered.add(user_id)
+                continue
+            for rule in rules:
+                if rule.startswith('@'):
+                    self.by_domain.setdefault(rule[1:], set()).add(user_id)
+                else:
+                    self.by_keyword.setdefault(rule, set()).add(user_id)
+        self.automaton = KeywordAutomaton(self.by_keyword) if self.by_keyword else None
+        logger.info(
+            f"Subscription matcher: {len(self.by_domain)} domain, {len(self.by_keyword)} kata kunci, "
+            f"{len(self.unfiltered)} user tanpa filter"
+        )
+
+    def match(self, email):
+        """Set user_id yang berlangganan email ini (satu kali jalan, tidak tergantung jumlah aturan)"""
+        recipients = set(self.unfiltered)
+
+        # Cocokkan domain pengirim beserta parent domain-nya (mail.airwallex.com -> airwallex.com)
+        domain = sender_domain(email.get('from'))
+        while domain:
+            users = self.by_domain.get(domain)
+            if users:
+                recipients |= users
+            domain = domain.partition('.')[2]
+
+        if self.automaton is not None:
+            haystack = f"{email.get('from') or ''}\n{email.get('subject') or ''}".lower()
+            for keyword in self.automaton.find(haystack):
+                recipients |= self.by_keyword[keyword]
+
+        return recipients
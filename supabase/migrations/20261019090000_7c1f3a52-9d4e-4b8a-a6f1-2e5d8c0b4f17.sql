@@ -0,0 +1,6 @@
+-- Jenis pesan yang dicatat bot (otp, attachment, notice) agar sweeper hanya menghapus OTP
+ALTER TABLE public.sent_messages
+  ADD COLUMN IF NOT EXISTS kind TEXT NOT NULL DEFAULT 'otp';
+
+-- Index untuk sweeper: cari pesan OTP tertua berdasarkan sent_at
+CREATE INDEX IF NOT EXISTS idx_sent_messages_kind_sent_at ON public.sent_messages(kind, sent_at);
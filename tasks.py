@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+
+# Konfigurasi logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Restart task yang crash: 1, 2, 4, ... detik sampai maksimal 60 detik
+RESTART_BASE = 1
+RESTART_MAX = 60
+# Task yang sudah berjalan selama ini dianggap sehat lagi (backoff di-reset)
+RESTART_RESET = 300
+# Batas waktu menunggu task periodik menyelesaikan run yang sedang berjalan saat shutdown
+STOP_TIMEOUT = 30
+
+
+class PeriodicTask:
+    """Menjalankan coroutine secara berkala tanpa pernah tumpang tindih dengan dirinya sendiri
+
+    interval boleh berupa angka atau callable (misal interval dari settings). Jika fn
+    mengembalikan angka, angka itu dipakai sebagai jeda sampai run berikutnya.
+    """
+
+    def __init__(self, name, fn, interval):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.running = False
+        self.stats = {"runs": 0, "failures": 0, "overruns": 0,
+                      "last_duration": 0.0, "max_duration": 0.0, "last_run": None}
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+
+    def _interval(self):
+        return float(self.interval() if callable(self.interval) else self.interval)
+
+    async def run_forever(self):
+        while not self._stopping:
+            started = time.monotonic()
+            self.running = True
+            next_delay = None
+            try:
+                next_delay = await self.fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Task {self.name} gagal: {str(e)}")
+            finally:
+                self.running = False
+                duration = time.monotonic() - started
+                self.stats["runs"] += 1
+                self.stats["last_run"] = time.time()
+                self.stats["last_duration"] = duration
+                self.stats["max_duration"] = max(self.stats["max_duration"], duration)
+
+            interval = self._interval()
+            if isinstance(next_delay, (int, float)) and not isinstance(next_delay, bool):
+                delay = float(next_delay)
+            else:
+                # Jadwal dihitung dari awal run; run yang kelamaan langsung disusul run berikutnya
+                if duration > interval:
+                    self.stats["overruns"] += 1
+                    logger.warning(f"Task {self.name} berjalan {duration:.1f} detik (interval {interval:.1f} detik)")
+                delay = max(0.0, interval - duration)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def wake(self):
+        """Jalankan run berikutnya sekarang (atau segera setelah run yang sedang berjalan)"""
+        self._wakeup.set()
+
+    def stop(self):
+        """Minta berhenti setelah run yang sedang berjalan selesai"""
+        self._stopping = True
+        self._wakeup.set()
+
+
+class TaskSupervisor:
+    """Menjalankan task latar belakang, me-restart yang crash, dan menghentikannya dengan rapi"""
+
+    def __init__(self):
+        self.tasks = {}
+        self.periodic = {}
+        self.restarts = {}
+        self._stopping = False
+
+    def add_periodic(self, name, fn, interval):
+        task = PeriodicTask(name, fn, interval)
+        self.periodic[name] = task
+        self.spawn(name, task.run_forever)
+        return task
+
+    def spawn(self, name, coro_fn):
+        self.restarts.setdefault(name, 0)
+        self.tasks[name] = asyncio.create_task(self._supervise(name, coro_fn), name=name)
+
+    async def _supervise(self, name, coro_fn):
+        backoff = RESTART_BASE
+        while not self._stopping:
+            started = time.monotonic()
+            try:
+                await coro_fn()
+                if self._stopping:
+                    return
+                logger.warning(f"Task {name} berhenti sendiri, dijalankan ulang")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Task {name} crash: {str(e)} - restart dalam {backoff} detik")
+
+            if time.monotonic() - started > RESTART_RESET:
+                backoff = RESTART_BASE
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_MAX)
+            self.restarts[name] += 1
+
+    async def stop(self, timeout=STOP_TIMEOUT):
+        """Task periodik menyelesaikan run-nya dulu; task lain langsung dibatalkan"""
+        self._stopping = True
+        for name, task in self.tasks.items():
+            if name in self.periodic:
+                self.periodic[name].stop()
+            else:
+                task.cancel()
+
+        tasks = list(self.tasks.values())
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                logger.warning(f"Task {task.get_name()} tidak selesai dalam {timeout} detik, dibatalkan")
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = {}
+
+    def stats(self):
+        return {
+            name: dict(task.stats, running=task.running, restarts=self.restarts.get(name, 0))
+            for name, task in self.periodic.items()
+        }
@@ -1,18 +1,43 @@
 import os
 import time
+import asyncio
+import hashlib
 import logging
 import schedule
-import tempfile
 import json
 import random
 import string
-from datetime import datetime, timedelta
+import secrets
+import signal
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from telegram import Bot, Update
+from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, ConversationHandler, MessageHandler, filters
 from telegram.constants import ParseMode
-from telegram.error import TelegramError
-from email_reader import EmailReader, load_settings, save_settings, SETTINGS_FILE
+from telegram.error import TelegramError, RetryAfter, BadRequest
+from email_reader import EmailReader
+from settings_store import SettingsStore
+from persistence import JsonPersistence, atomic_write_json
+from email_archive import EmailArchive
+from search_index import SearchIndex
+from rate_limit import RateLimiter, retry_after_seconds
+from http_pool import PooledRequest, POOL_SIZE, KEEPALIVE_EXPIRY
+from sent_messages import create_sent_message_store, KIND_OTP, KIND_ATTACHMENT, KIND_NOTICE, KIND_BROADCAST
+from renderer import render_email_batch, render_caption
+from broadcast import BroadcastStore, BroadcastRunner, JOB_RUNNING
+from tasks import TaskSupervisor
+from latency import LatencyTracker
+from poll_scheduler import AdaptivePollScheduler, DEFAULT_MAX_INTERVAL
+from metrics import MetricsServer, METRICS_LISTEN
+from health import (HealthMonitor, HEALTH_PATH, READY_PATH, HEALTH_CHECK_INTERVAL, STALE_MIN, COMPONENT_POLL,
+                    COMPONENT_SEND, COMPONENT_LABELS)
+from profiler import SamplingProfiler, DEFAULT_WINDOW, MAX_WINDOW
+from log_setup import correlation, current_correlation_id, dropped_records, flush_repeats
+import metrics
+from subscriptions import SubscriptionMatcher, normalize_rule, MAX_SUBSCRIPTIONS
+from delivery_queue import (DeliveryQueue, DeliveryDispatcher, PRIORITY_OTP, PRIORITY_ATTACHMENT,
+                            PRIORITY_BROADCAST, PRIORITY_NOTICE, STATE_PENDING, STATE_INFLIGHT, STATE_SENT,
+                            STATE_DEAD, STATE_CANCELLED)
 
 # Konfigurasi logging
 logging.basicConfig(
@@ -27,6 +52,33 @@ APPROVED_USERS_FILE = 'approved_users.json'
 NOTIFIED_USERS_FILE = 'notified_expiry.json'
 # File untuk menyimpan kode redeem
 REDEEM_CODES_FILE = 'redeem_codes.json'
+# File untuk menyimpan id pesan "OTP Terakhir" yang di-pin per chat
+PINNED_MESSAGES_FILE = 'pinned_messages.json'
+# Mode pengiriman per user (disimpan di record approved_users)
+DELIVERY_MODE_MESSAGES = 'messages'
+DELIVERY_MODE_PINNED = 'pinned'
+
+# Sweeper auto-delete: ukuran batch, jeda antar batch, dan laju delete per detik
+SWEEP_BATCH_SIZE = 50
+SWEEP_INTERVAL = 60
+SWEEP_DELETE_RATE = 5
+# Interval pengecekan user yang expired (detik)
+EXPIRY_CHECK_INTERVAL = 60
+# Interval pengecekan retensi arsip email (batas umur ARCHIVE_MAX_DAYS)
+ARCHIVE_RETENTION_INTERVAL = 3600
+# Batas waktu menunggu pengiriman yang sedang berjalan saat shutdown (detik)
+SHUTDOWN_DRAIN_TIMEOUT = 15
+# Catatan pesan terkirim ditulis ke database per batch setiap N detik (bukan per pesan di event loop)
+SENT_FLUSH_INTERVAL = 2
+# Batas catatan yang ditahan di memori jika database sedang tidak bisa ditulis
+SENT_BUFFER_MAX = 10000
+# Batas atas jendela coalescing OTP (ms) supaya latensi tetap terjaga
+MAX_COALESCE_MS = 5000
+# Default server webhook (--webhook); bisa diubah lewat config.env
+WEBHOOK_LISTEN = '0.0.0.0'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = 'telegram'
+
 
 # States untuk conversation handler
 (SET_EMAIL_HOST, SET_EMAIL_USER, SET_EMAIL_PASS, 
@@ -40,16 +92,104 @@ class EmailForwarderBot:
         self.bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.owner_id = os.getenv('TELEGRAM_OWNER_ID')
         
-        # Load settings dari file JSON
-        self.settings = load_settings()
+        # Load settings dari file JSON (di-cache, dibaca ulang hanya jika file berubah)
+        self.settings_store = SettingsStore()
+        self.settings_store.subscribe(self._on_settings_changed)
+        self.settings = self.settings_store.get()
         self.check_interval = int(self.settings.get('check_interval', 2))
+        # check_interval = interval minimum; melambat sampai poll_max_interval saat sepi
+        self.poll_scheduler = AdaptivePollScheduler(
+            self.check_interval, int(self.settings.get('poll_max_interval', DEFAULT_MAX_INTERVAL) or 0)
+        )
         
         # Inisialisasi bot Telegram dan pembaca email
-        self.bot = Bot(token=self.bot_token)
-        self.email_reader = EmailReader()
+        # TELEGRAM_API_BASE_URL opsional (Bot API server lokal atau mock untuk benchmark)
+        self.api_base_url = os.getenv('TELEGRAM_API_BASE_URL') or 'https://api.telegram.org/bot'
+        # Satu Application + satu pool HTTP untuk command handler dan pengiriman email
+        self.http_request = PooledRequest(
+            pool_size=int(os.getenv('TELEGRAM_POOL_SIZE') or POOL_SIZE),
+            http2=os.getenv('TELEGRAM_HTTP2', '').lower() in ('1', 'true', 'yes'),
+            keepalive_expiry=float(os.getenv('TELEGRAM_KEEPALIVE') or KEEPALIVE_EXPIRY)
+        )
+        self.application = self.build_application()
+        self.bot = self.application.bot
+        
+        # Mode webhook: URL publik, alamat listen, dan secret token header
+        self.webhook_url = os.getenv('WEBHOOK_URL') or None
+        self.webhook_listen = os.getenv('WEBHOOK_LISTEN') or WEBHOOK_LISTEN
+        self.webhook_port = int(os.getenv('WEBHOOK_PORT') or WEBHOOK_PORT)
+        self.webhook_path = os.getenv('WEBHOOK_PATH') or WEBHOOK_PATH
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+        self.rate_limiter = RateLimiter()
+        self.email_reader = EmailReader(self.settings_store)
+        
+        # Penyimpanan JSON atomik + debounce untuk semua state bot
+        self.persistence = JsonPersistence()
+        
+        # Arsip lokal email yang sudah diteruskan (untuk /last dan /history)
+        self.email_archive = EmailArchive()
+        
+        # Index pencarian full-text atas arsip (untuk /search)
+        self.search_index = SearchIndex()
+        self.search_index.rebuild_from_archive(self.email_archive)
+        
+        # Catatan pesan terkirim (SQLite lokal atau Postgres via DATABASE_URL) untuk auto-delete OTP
+        self.sent_messages = create_sent_message_store(os.getenv('DATABASE_URL'))
+        # (chat_id, message_id, kind, sent_at) yang belum ditulis, lihat flush_sent_records
+        self._sent_buffer = []
+        
+        # Antrian pengiriman persisten (OTP > lampiran > broadcast > notifikasi)
+        self.delivery_queue = DeliveryQueue()
+        self.dispatcher = DeliveryDispatcher(
+            self.delivery_queue,
+            self.rate_limiter,
+            handlers={"message": self._deliver_message, "document": self._deliver_document,
+                      "pinned": self._deliver_pinned},
+            on_sent=self._on_delivery_sent,
+            on_failed=self._on_delivery_failed
+        )
+        # Broadcast sebagai job latar belakang dengan cursor persisten
+        self.broadcasts = BroadcastRunner(
+            BroadcastStore(),
+            self.delivery_queue,
+            enqueue_fn=self._enqueue_broadcast_chunk,
+            notify_fn=lambda chat_id, text, key: self.enqueue_message([chat_id], text, key)
+        )
+        # Latensi end-to-end per email (INTERNALDATE -> terkirim) untuk /stats
+        self.latency = LatencyTracker()
+        # Task latar belakang (polling email, expiry, cleanup, broadcast)
+        self.supervisor = TaskSupervisor()
+        # Endpoint metrik Prometheus opsional (METRICS_PORT kosong = nonaktif)
+        metrics_port = int(os.getenv('METRICS_PORT') or 0)
+        self.metrics_server = MetricsServer(
+            metrics_port, os.getenv('METRICS_LISTEN') or METRICS_LISTEN
+        ) if metrics_port else None
+        metrics.REGISTRY.add_collector(self.collect_metrics)
+        # Kesehatan poll/pengiriman: GET /health dan /ready di port metrik, dan/atau file status (HEALTH_FILE)
+        self.health = HealthMonitor()
+        self.health_file = os.getenv('HEALTH_FILE') or None
+        if self.metrics_server is not None:
+            self.metrics_server.add_route(HEALTH_PATH, self.health_response)
+            self.metrics_server.add_route(READY_PATH, self.ready_response)
+        # Profiler on-demand dari Telegram (/profile)
+        self.profiler = SamplingProfiler(sizes_fn=self.container_sizes)
+        self._profile_task = None
+        self._profile_chat = None
+        # Sesi IMAP dipakai bergantian oleh task polling dan /testemail
+        self._imap_lock = asyncio.Lock()
+        # Merge index pencarian yang sedang berjalan (referensi disimpan supaya tidak di-GC)
+        self._merge_task = None
+        self._upload_locks = {}
+        # Email yang ditahan selama jendela coalescing
+        self._coalesce_buffer = []
+        self._coalesce_task = None
+        # Chat yang menolak HTML - langsung dikirimi varian plain
+        self.plain_only_chats = set()
         
         # Load approved users
         self.approved_users = self.load_approved_users()
+        # Index langganan dikompilasi ulang hanya setelah approved_users berubah
+        self._subscription_matcher = None
         
         # Load notified users tracking
         self.notified_expiry = self.load_notified_expiry()
@@ -57,6 +197,11 @@ class EmailForwarderBot:
         # Load redeem codes
         self.redeem_codes = self.load_redeem_codes()
         
+        # Pesan "OTP Terakhir" yang di-pin per chat (mode edit-in-place)
+        self.pinned_messages = self.load_pinned_messages()
+        self._pinned_locks = {}
+        self._pinned_versions = {}
+        
         # Pastikan file config.env ada
         if not os.path.exists('config.env'):
             logger.warning("File config.env tidak ditemukan. Menggunakan config.env.example sebagai fallback.")
@@ -65,12 +210,17 @@ class EmailForwarderBot:
             else:
                 logger.error("File konfigurasi tidak ditemukan!")
     
-    def reload_settings(self):
-        """Reload settings dari file"""
-        self.settings = load_settings()
+    def _on_settings_changed(self, changed, settings):
+        """Event dari SettingsStore saat isi settings berubah"""
+        self.settings = settings
         self.check_interval = int(self.settings.get('check_interval', 2))
-        self.email_reader.reload_settings()
-        logger.info("Bot settings reloaded")
+        self.poll_scheduler.configure(
+            self.check_interval, int(self.settings.get('poll_max_interval', DEFAULT_MAX_INTERVAL) or 0)
+        )
+    
+    def reload_settings(self):
+        """Reload settings dari file jika berubah (event dikirim oleh SettingsStore)"""
+        self.settings_store.refresh()
     
     def load_approved_users(self):
         """Memuat daftar approved users dari file JSON"""
@@ -97,14 +247,11 @@ class EmailForwarderBot:
     
     def save_approved_users(self, users=None):
         """Menyimpan daftar approved users ke file JSON"""
-        try:
-            if users is None:
-                users = self.approved_users
-            with open(APPROVED_USERS_FILE, 'w') as f:
-                json.dump(users, f, indent=2)
-            logger.info(f"Saved {len(users)} approved users")
-        except Exception as e:
-            logger.error(f"Error saving approved users: {str(e)}")
+        self._subscription_matcher = None
+        if users is None:
+            self.persistence.save(APPROVED_USERS_FILE, lambda: self.approved_users)
+        else:
+            self.persistence.save(APPROVED_USERS_FILE, lambda: users)
     
     def is_owner(self, user_id):
         """Memeriksa apakah user adalah owner"""
@@ -146,11 +293,37 @@ class EmailForwarderBot:
     
     def save_notified_expiry(self):
         """Menyimpan tracking notifikasi expiry"""
+        self.persistence.save(NOTIFIED_USERS_FILE, lambda: self.notified_expiry)
+    
+    def load_pinned_messages(self):
+        """Memuat id pesan pinned per chat"""
         try:
-            with open(NOTIFIED_USERS_FILE, 'w') as f:
-                json.dump(self.notified_expiry, f, indent=2)
+            if os.path.exists(PINNED_MESSAGES_FILE):
+                with open(PINNED_MESSAGES_FILE, 'r') as f:
+                    return json.load(f)
+            return {}
         except Exception as e:
-            logger.error(f"Error saving notified expiry: {str(e)}")
+            logger.error(f"Error loading pinned messages: {str(e)}")
+            return {}
+    
+    def save_pinned_messages(self):
+        """Menyimpan id pesan pinned per chat"""
+        self.persistence.save(PINNED_MESSAGES_FILE, lambda: self.pinned_messages)
+    
+    def get_delivery_mode(self, user_id):
+        return self.approved_users.get(str(user_id), {}).get("delivery_mode") or DELIVERY_MODE_MESSAGES
+    
+    def set_delivery_mode(self, user_id, mode):
+        """Menyimpan mode pengiriman user di record approved_users"""
+        user_data = self.approved_users.get(str(user_id))
+        if user_data is None:
+            return False
+        if mode == DELIVERY_MODE_PINNED:
+            user_data["delivery_mode"] = mode
+        else:
+            user_data.pop("delivery_mode", None)
+        self.save_approved_users()
+        return True
     
     def load_redeem_codes(self):
         """Memuat daftar kode redeem dari file JSON"""
@@ -167,12 +340,7 @@ class EmailForwarderBot:
     
     def save_redeem_codes(self):
         """Menyimpan daftar kode redeem ke file JSON"""
-        try:
-            with open(REDEEM_CODES_FILE, 'w') as f:
-                json.dump(self.redeem_codes, f, indent=2)
-            logger.info(f"Saved {len(self.redeem_codes)} redeem codes")
-        except Exception as e:
-            logger.error(f"Error saving redeem codes: {str(e)}")
+        self.persistence.save(REDEEM_CODES_FILE, lambda: self.redeem_codes)
     
     def generate_unique_code(self, length=6):
         """Generate kode unik acak (huruf dan angka)"""
@@ -275,11 +443,12 @@ class EmailForwarderBot:
                 f"Hubungi admin untuk memperpanjang akses."
             )
             
+            expiry_key = f"expiry:{user_id}:{self.approved_users.get(user_id, {}).get('expires_at')}"
             try:
-                await self.send_message(user_id, message)
-                logger.info(f"Sent expiry notification to user {user_id}")
+                self.enqueue_message([user_id], message, expiry_key)
+                logger.info(f"Queued expiry notification to user {user_id}")
             except Exception as e:
-                logger.error(f"Failed to send expiry notification to {user_id}: {str(e)}")
+                logger.error(f"Failed to queue expiry notification to {user_id}: {str(e)}")
             
             if user_id in self.approved_users:
                 del self.approved_users[user_id]
@@ -287,7 +456,7 @@ class EmailForwarderBot:
             if self.owner_id:
                 owner_msg = f"📢 User <code>{user_id}</code> akses telah berakhir dan dihapus dari daftar."
                 try:
-                    await self.send_message(self.owner_id, owner_msg)
+                    self.enqueue_message([self.owner_id], owner_msg, f"{expiry_key}:owner")
                 except:
                     pass
         
@@ -304,7 +473,8 @@ class EmailForwarderBot:
         else:
             expires_at = None
         
-        self.approved_users[user_id_str] = {"expires_at": expires_at}
+        # Perpanjang akses tanpa menghapus langganan yang sudah ada
+        self.approved_users.setdefault(user_id_str, {})["expires_at"] = expires_at
         self.save_approved_users()
         logger.info(f"User {user_id} added to approved list (expires: {expires_at})")
         return expires_at
@@ -319,6 +489,27 @@ class EmailForwarderBot:
             return True
         return False
     
+    def get_subscription_matcher(self):
+        """Matcher langganan yang sudah dikompilasi dari approved_users"""
+        if self._subscription_matcher is None:
+            self._subscription_matcher = SubscriptionMatcher(self.approved_users)
+        return self._subscription_matcher
+    
+    def get_user_subscriptions(self, user_id):
+        return list(self.approved_users.get(str(user_id), {}).get("subscriptions") or [])
+    
+    def set_user_subscriptions(self, user_id, rules):
+        """Menyimpan aturan langganan user di record approved_users"""
+        user_data = self.approved_users.get(str(user_id))
+        if user_data is None:
+            return False
+        if rules:
+            user_data["subscriptions"] = rules
+        else:
+            user_data.pop("subscriptions", None)
+        self.save_approved_users()
+        return True
+    
     def get_user_expiry_info(self, user_id):
         """Mendapatkan info expiry user"""
         user_id_str = str(user_id)
@@ -344,176 +535,625 @@ class EmailForwarderBot:
         except:
             return "Unknown"
         
-    async def send_message(self, chat_id, text, parse_mode=ParseMode.HTML):
+    def record_sent(self, rows, kind):
+        """Mencatat id pesan terkirim ke buffer; ditulis ke database oleh flush_sent_records"""
+        sent_at = datetime.now(timezone.utc)
+        self._sent_buffer.extend((chat_id, message_id, kind, sent_at) for chat_id, message_id in rows)
+    
+    async def flush_sent_records(self):
+        """Task periodik: tulis catatan pesan terkirim dalam satu batch di thread terpisah"""
+        rows, self._sent_buffer = self._sent_buffer, []
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self.sent_messages.record_batch, rows)
+        except Exception as e:
+            logger.error(f"Gagal mencatat {len(rows)} pesan terkirim: {str(e)}")
+            # Coba lagi di flush berikutnya; jika terlalu banyak, yang tertua dilepas
+            self._sent_buffer = (rows + self._sent_buffer)[-SENT_BUFFER_MAX:]
+    
+    async def send_message(self, chat_id, text, parse_mode=ParseMode.HTML, kind=KIND_NOTICE):
         """Mengirim pesan ke chat Telegram tertentu"""
         try:
-            await self.bot.send_message(
+            sent = await self.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 parse_mode=parse_mode
             )
+            self.record_sent([(chat_id, sent.message_id)], kind)
             return True
         except TelegramError as e:
             logger.error(f"Gagal mengirim pesan ke {chat_id}: {str(e)}")
             return False
     
-    async def send_to_all_approved(self, text, parse_mode=ParseMode.HTML):
-        """Mengirim pesan ke semua approved users yang aktif"""
-        success_count = 0
-        active_users, _ = self.get_active_approved_users()
-        
-        for user_id in active_users:
+    def enqueue_message(self, chat_ids, text, key, kind=KIND_NOTICE, priority=PRIORITY_NOTICE,
+                        parse_mode=ParseMode.HTML, fallback_text=None, group_key=None, trace=None):
+        """Memasukkan pesan teks ke antrian untuk banyak chat (idempotent per key + chat)"""
+        payload = {"type": "message", "text": text, "parse_mode": parse_mode}
+        if fallback_text:
+            payload["fallback_text"] = fallback_text
+        if trace:
+            # Kunci email yang diukur latensinya saat pesan ini terkirim
+            payload["trace"] = trace
+        if current_correlation_id():
+            payload["cid"] = current_correlation_id()
+        added = self.delivery_queue.enqueue_many([
+            {
+                "idem_key": f"{key}:{chat_id}",
+                "chat_id": chat_id,
+                "kind": kind,
+                "priority": priority,
+                "payload": payload,
+                "group_key": group_key
+            }
+            for chat_id in chat_ids
+        ])
+        self.dispatcher.notify()
+        return added
+    
+    def enqueue_document(self, chat_ids, document_data, filename, key, caption=None, group_key=None):
+        """Memasukkan lampiran ke antrian - data disimpan sekali, dikirim ulang dengan file_id"""
+        self.delivery_queue.put_blob(key, document_data)
+        payload = {"type": "document", "filename": filename, "caption": caption}
+        if current_correlation_id():
+            payload["cid"] = current_correlation_id()
+        added = self.delivery_queue.enqueue_many([
+            {
+                "idem_key": f"{key}:{chat_id}",
+                "chat_id": chat_id,
+                "kind": KIND_ATTACHMENT,
+                "priority": PRIORITY_ATTACHMENT,
+                "payload": payload,
+                "blob_key": key,
+                "group_key": group_key
+            }
+            for chat_id in chat_ids
+        ])
+        self.dispatcher.notify()
+        return added
+    
+    def enqueue_pinned(self, chat_ids, text, key, fallback_text=None, trace=None):
+        """Update pesan pinned per chat; update lama yang belum terkirim dibatalkan (hanya OTP terbaru)"""
+        version = time.time()
+        items = []
+        for chat_id in chat_ids:
+            group_key = f"pinned:{chat_id}"
+            for replaced in self.delivery_queue.cancel_group_payloads(group_key):
+                for email_key in replaced.get("trace") or []:
+                    self.latency.dropped(email_key)
+            items.append({
+                "idem_key": f"{key}:pin:{chat_id}",
+                "chat_id": chat_id,
+                "kind": KIND_OTP,
+                "priority": PRIORITY_OTP,
+                "payload": {"type": "pinned", "text": text, "parse_mode": ParseMode.HTML,
+                            "fallback_text": fallback_text, "version": version, "trace": trace,
+                            "cid": current_correlation_id()},
+                "group_key": group_key
+            })
+        added = self.delivery_queue.enqueue_many(items)
+        self.dispatcher.notify()
+        return added
+    
+    def _enqueue_broadcast_chunk(self, chat_ids, text, key, group_key):
+        """Satu chunk job broadcast ke antrian (prioritas di bawah OTP dan lampiran)"""
+        return self.enqueue_message(
+            chat_ids, text, key, kind=KIND_BROADCAST, priority=PRIORITY_BROADCAST, group_key=group_key
+        )
+    
+    async def _deliver_pinned(self, item):
+        """Handler antrian mode pinned: edit pesan 'OTP Terakhir', kirim + pin baru jika belum ada"""
+        payload = item["payload"]
+        chat_id = str(item["chat_id"])
+        lock = self._pinned_locks.setdefault(chat_id, asyncio.Lock())
+        
+        async with lock:
+            message_id = self.pinned_messages.get(chat_id)
+            # Update yang lebih lama dari yang sudah tampil tidak perlu dikirim
+            if payload.get("version", 0) < self._pinned_versions.get(chat_id, 0) and message_id:
+                # Bukan pengiriman: trace email ini dilepas di _on_delivery_sent
+                payload["superseded"] = True
+                return message_id
+            
+            use_plain = payload.get("fallback_text") and chat_id in self.plain_only_chats
+            text = payload["fallback_text"] if use_plain else payload["text"]
+            parse_mode = None if use_plain else payload.get("parse_mode")
+            
+            if message_id:
+                try:
+                    await self.bot.edit_message_text(
+                        chat_id=chat_id, message_id=message_id, text=text, parse_mode=parse_mode
+                    )
+                    self._pinned_versions[chat_id] = payload.get("version", 0)
+                    return message_id
+                except BadRequest as e:
+                    error = str(e).lower()
+                    if "not modified" in error:
+                        return message_id
+                    if "parse" in error and payload.get("fallback_text"):
+                        self.plain_only_chats.add(chat_id)
+                        await self.bot.edit_message_text(
+                            chat_id=chat_id, message_id=message_id, text=payload["fallback_text"]
+                        )
+                        return message_id
+                    # Pesan sudah dihapus/terlalu lama - buat pesan pinned baru
+                    logger.info(f"Pesan pinned {message_id} di {chat_id} tidak bisa diedit: {str(e)}")
+            
+            new_id = await self._deliver_message(item)
             try:
-                await self.bot.send_message(
-                    chat_id=user_id,
-                    text=text,
-                    parse_mode=parse_mode
-                )
-                success_count += 1
+                await self.bot.pin_chat_message(chat_id=chat_id, message_id=new_id, disable_notification=True)
             except TelegramError as e:
-                logger.error(f"Gagal mengirim pesan ke {user_id}: {str(e)}")
-        return success_count
+                logger.warning(f"Gagal pin pesan di {chat_id}: {str(e)}")
+            
+            self.pinned_messages[chat_id] = new_id
+            self._pinned_versions[chat_id] = payload.get("version", 0)
+            self.save_pinned_messages()
+            return new_id
     
-    async def send_document(self, chat_id, document_data, filename, caption=None):
+    async def _deliver_message(self, item):
+        """Handler antrian untuk pesan teks; jatuh ke teks biasa per penerima jika HTML ditolak"""
+        payload = item["payload"]
+        chat_id = item["chat_id"]
+        fallback_text = payload.get("fallback_text")
+        
+        if fallback_text and chat_id in self.plain_only_chats:
+            sent = await self.bot.send_message(chat_id=chat_id, text=fallback_text)
+            return sent.message_id
+        
+        try:
+            sent = await self.bot.send_message(
+                chat_id=chat_id,
+                text=payload["text"],
+                parse_mode=payload.get("parse_mode")
+            )
+        except BadRequest as e:
+            # Hanya error parse entity yang bisa diatasi teks biasa; sisanya biar masuk dead-letter
+            if not fallback_text or "parse" not in str(e).lower():
+                raise
+            logger.info(f"HTML ditolak untuk {chat_id}, kirim tanpa format: {str(e)}")
+            self.plain_only_chats.add(chat_id)
+            sent = await self.bot.send_message(chat_id=chat_id, text=fallback_text)
+        return sent.message_id
+    
+    async def _deliver_document(self, item):
+        """Handler antrian untuk lampiran: upload sekali per blob, sisanya memakai file_id"""
+        payload = item["payload"]
+        blob_key = item["blob_key"]
+        data, file_id = await asyncio.to_thread(self.delivery_queue.get_blob, blob_key)
+        if data is None:
+            raise BadRequest("Data lampiran tidak ditemukan")
+        
+        rejected = None
+        if file_id:
+            try:
+                sent = await self._send_document(item["chat_id"], file_id, payload["filename"], payload.get("caption"))
+                return sent.message_id
+            except BadRequest as e:
+                logger.warning(f"file_id ditolak untuk {item['chat_id']}, upload ulang: {str(e)}")
+                rejected = file_id
+        
+        lock = self._upload_locks.setdefault(blob_key, asyncio.Lock())
+        async with lock:
+            # Penerima lain mungkin sudah mengupload selama kita menunggu lock
+            # (file_id yang barusan ditolak tidak dipakai lagi)
+            _, file_id = await asyncio.to_thread(self.delivery_queue.get_blob, blob_key)
+            if file_id and file_id != rejected:
+                sent = await self._send_document(item["chat_id"], file_id, payload["filename"], payload.get("caption"))
+            else:
+                sent = await self._send_document(item["chat_id"], data, payload["filename"], payload.get("caption"))
+                await asyncio.to_thread(self.delivery_queue.set_file_id, blob_key, sent.document.file_id)
+        return sent.message_id
+    
+    def _on_delivery_sent(self, item, message_id):
+        """Callback dispatcher setelah pesan antrian terkirim"""
+        self.health.succeeded(COMPONENT_SEND)
+        for email_key in item["payload"].get("trace") or []:
+            if item["payload"].get("superseded"):
+                self.latency.dropped(email_key)
+            else:
+                self.latency.delivered(email_key)
+        # Pesan pinned diedit berulang kali - tidak dicatat untuk auto-delete
+        if item["payload"].get("type") == "pinned":
+            return
+        self.record_sent([(item["chat_id"], message_id)], item["kind"])
+    
+    def _on_delivery_failed(self, item, error):
+        """Callback dispatcher saat pengiriman gagal karena error jaringan/server Telegram"""
+        self.health.failed(COMPONENT_SEND, error)
+    
+    async def _send_document(self, chat_id, document, filename, caption=None):
+        """Mengirim dokumen tanpa menangkap error
+        
+        document bisa berupa bytes (diupload langsung dari memori) atau file_id Telegram.
+        """
+        return await self.bot.send_document(
+            chat_id=chat_id,
+            document=document,
+            filename=filename if isinstance(document, bytes) else None,
+            caption=render_caption(caption) if caption else None,
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def send_document(self, chat_id, document_data, filename, caption=None, kind=KIND_ATTACHMENT):
         """Mengirim dokumen ke chat Telegram tertentu"""
         try:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(document_data)
-                temp_file_path = temp_file.name
-            
-            if caption:
-                caption = self.escape_html(caption)
-            
-            with open(temp_file_path, 'rb') as document:
-                await self.bot.send_document(
-                    chat_id=chat_id,
-                    document=document,
-                    filename=filename,
-                    caption=caption
-                )
-            
-            os.unlink(temp_file_path)
+            sent = await self._send_document(chat_id, document_data, filename, caption)
+            self.record_sent([(chat_id, sent.message_id)], kind)
             return True
         except Exception as e:
             logger.error(f"Gagal mengirim dokumen ke {chat_id}: {str(e)}")
             return False
     
-    async def send_document_to_all_approved(self, document_data, filename, caption=None):
-        """Mengirim dokumen ke semua approved users yang aktif"""
-        success_count = 0
-        active_users, _ = self.get_active_approved_users()
-        
-        for user_id in active_users:
-            try:
-                await self.send_document(user_id, document_data, filename, caption)
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Gagal mengirim dokumen ke {user_id}: {str(e)}")
-        return success_count
-    
     def escape_html(self, text):
         """Escape karakter HTML khusus dalam teks"""
         if not text:
             return ""
         return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
     
-    async def format_email_message(self, email):
-        """Format email menjadi pesan Telegram"""
-        message = f"<b>📧 Email Baru</b>\n\n"
-        
-        from_email = self.escape_html(email['from'])
-        subject = self.escape_html(email['subject'])
-        
-        message += f"<b>Dari:</b> {from_email}\n"
-        message += f"<b>Subjek:</b> {subject}\n"
-        message += f"<b>Tanggal:</b> {email['date'].strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        
-        if 'otp_code' in email and email['otp_code']:
-            message += f"<b>🔑 OTP CODE:</b> <code>{email['otp_code']}</code>\n\n"
-        
-        if 'full_content' in email and email['full_content']:
-            full_content = email['full_content']
-            if len(full_content) > 3800:
-                full_content = full_content[:3800] + "...\n[Pesan terpotong karena terlalu panjang]"
-            
-            full_content = self.escape_html(full_content)
-            message += f"<b>Isi Email Lengkap:</b>\n\n{full_content}\n\n"
-        elif email['body_text']:
-            body_text = email['body_text']
-            if len(body_text) > 3800:
-                body_text = body_text[:3800] + "...\n[Pesan terpotong karena terlalu panjang]"
-            
-            body_text = self.escape_html(body_text)
-            message += f"<b>Isi Email:</b>\n\n{body_text}\n\n"
-        
-        if email['attachments']:
-            message += f"<b>Lampiran:</b> {len(email['attachments'])} file\n"
-        
-        return message
+    def email_key(self, email):
+        """Kunci stabil per email untuk idempotensi antrian (Message-ID jika ada)"""
+        message_id = email.get('message_id')
+        if not message_id:
+            raw = f"{email.get('from')}|{email.get('subject')}|{email.get('date')}|{email.get('otp_code')}"
+            message_id = hashlib.sha1(raw.encode('utf-8', 'replace')).hexdigest()
+        return "email:" + hashlib.sha1(message_id.encode('utf-8', 'replace')).hexdigest()[:20]
+    
+    def archive_emails(self, emails):
+        """Arsipkan dan index satu batch email (dijalankan di thread); return True jika index perlu di-merge"""
+        needs_merge = False
+        for email in emails:
+            try:
+                email['archive_seq'] = self.email_archive.append(email)
+                if self.search_index.add_email(email['archive_seq'], email):
+                    needs_merge = True
+            except Exception as e:
+                logger.error(f"Gagal mengarsipkan email: {str(e)}")
+        return needs_merge
+    
+    def schedule_index_merge(self):
+        """Gabungkan index pencarian di thread terpisah agar ingest tidak terblokir"""
+        # Satu merge sekaligus; delta yang masuk selama merge ikut di merge berikutnya
+        if self._merge_task is not None and not self._merge_task.done():
+            return
+        entries = self.email_archive.entries
+        min_seq = entries[0].seq if entries else 0
+        self._merge_task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(self.search_index.merge, min_seq)
+        )
+        self._merge_task.add_done_callback(self._log_task_error)
+    
+    def _log_task_error(self, task):
+        """Callback untuk mencatat error dari background task"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task gagal: {str(task.exception())}")
     
     async def process_new_emails(self):
-        """Memproses email baru dan mengirimkannya ke semua approved users"""
-        logger.info("Memeriksa email baru...")
+        """Memproses email baru dan mengirimkannya ke semua approved users; return jumlah email"""
+        logger.debug("Memeriksa email baru...")
         
         # Cek apakah email sudah dikonfigurasi
         if not self.email_reader.is_configured():
             logger.warning("Email belum dikonfigurasi. Skip pengecekan.")
-            return
+            return None
         
-        emails = self.email_reader.get_new_emails()
+        # IMAP bersifat blocking - jalankan di thread supaya command handler tetap responsif
+        async with self._imap_lock:
+            emails = await asyncio.to_thread(self.email_reader.get_new_emails)
+            error = self.email_reader.last_error
+        # get_new_emails tidak pernah raise; error hanya terlihat dari last_error
+        if error:
+            self.health.failed(COMPONENT_POLL, error)
+        else:
+            self.health.succeeded(COMPONENT_POLL)
         
         if not emails:
-            logger.info("Tidak ada email baru")
-            return
+            logger.debug("Tidak ada email baru")
+            return 0
         
         logger.info(f"Ditemukan {len(emails)} email baru")
         
+        # Kompresi, tulis file arsip, dan tokenisasi index di thread - satu kali per batch poll
+        if await asyncio.to_thread(self.archive_emails, emails):
+            self.schedule_index_merge()
+        
+        window = self.coalesce_window()
+        if window <= 0:
+            self.forward_emails(emails)
+            return len(emails)
+        
+        # Tahan email selama jendela coalescing (dihitung dari email pertama), lalu kirim sekaligus
+        self._coalesce_buffer.extend(emails)
+        if self._coalesce_task is None:
+            self._coalesce_task = asyncio.create_task(self._flush_coalesced_after(window))
+            self._coalesce_task.add_done_callback(self._log_task_error)
+        return len(emails)
+    
+    def coalesce_window(self):
+        """Jendela coalescing OTP dalam detik (0 = mati)"""
+        return int(self.settings.get('coalesce_ms', 0) or 0) / 1000
+    
+    async def _flush_coalesced_after(self, delay):
+        await asyncio.sleep(delay)
+        self.flush_coalesced()
+    
+    def flush_coalesced(self):
+        """Kirim semua email yang sedang ditahan sebagai satu pesan per penerima"""
+        emails, self._coalesce_buffer = self._coalesce_buffer, []
+        self._coalesce_task = None
+        if emails:
+            self.forward_emails(emails, coalesce=True)
+    
+    def forward_emails(self, emails, coalesce=False):
+        """Menjadwalkan email ke pelanggan aktif; coalesce=True menggabungkan email per penerima"""
         active_users, _ = self.get_active_approved_users()
         if not active_users:
             logger.warning("Tidak ada approved users aktif untuk menerima notifikasi")
             return
         
+        matcher = self.get_subscription_matcher()
+        
+        # Satu kali evaluasi matcher per email, lalu disaring ke user aktif
+        recipients_by_email = []
         for email in emails:
-            try:
-                message = await self.format_email_message(email)
-                success = await self.send_to_all_approved(message)
-                
-                if success == 0:
-                    logger.info("Mencoba mengirim pesan tanpa format HTML...")
-                    plain_message = f"📧 Email Baru\n\n"
-                    plain_message += f"Dari: {email['from']}\n"
-                    plain_message += f"Subjek: {email['subject']}\n"
-                    plain_message += f"Tanggal: {email['date'].strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                    
-                    if 'otp_code' in email and email['otp_code']:
-                        plain_message += f"🔑 OTP CODE: {email['otp_code']}\n\n"
-                    
-                    if 'full_content' in email and email['full_content']:
-                        full_content = email['full_content']
-                        if len(full_content) > 3800:
-                            full_content = full_content[:3800] + "...\n[Pesan terpotong karena terlalu panjang]"
-                        plain_message += f"Isi Email Lengkap:\n\n{full_content}\n\n"
-                    elif email['body_text']:
-                        body_text = email['body_text']
-                        if len(body_text) > 3800:
-                            body_text = body_text[:3800] + "...\n[Pesan terpotong karena terlalu panjang]"
-                        plain_message += f"Isi Email:\n\n{body_text}\n\n"
+            subscribers = matcher.match(email)
+            recipients_by_email.append([uid for uid in active_users if uid in subscribers])
+        
+        for email, recipients in zip(emails, recipients_by_email):
+            self.latency.start(self.email_key(email), email.get('timings'), len(recipients))
+        
+        if coalesce and len(emails) > 1:
+            # Penerima dengan kumpulan email yang sama berbagi satu render
+            groups = {}
+            recipient_sets = [set(recipients) for recipients in recipients_by_email]
+            for uid in active_users:
+                indexes = tuple(i for i, recipients in enumerate(recipient_sets) if uid in recipients)
+                if indexes:
+                    groups.setdefault(indexes, []).append(uid)
+        else:
+            groups = {(i,): recipients for i, recipients in enumerate(recipients_by_email) if recipients}
+        
+        for indexes, recipients in groups.items():
+            group_emails = [emails[i] for i in indexes]
+            # Satu pesan gabungan membawa correlation id semua email di dalamnya
+            cids = [email["cid"] for email in group_emails if email.get("cid")]
+            with correlation(",".join(cids) or None):
+                try:
+                    # Render sekali per kelompok; varian dipilih per penerima saat dikirim
+                    rendered = render_email_batch(group_emails)
+                    keys = [self.email_key(email) for email in group_emails]
+                    key = keys[0] if len(keys) == 1 else \
+                        "batch:" + hashlib.sha1("|".join(keys).encode()).hexdigest()[:20]
                     
-                    if email['attachments']:
-                        plain_message += f"Lampiran: {len(email['attachments'])} file\n"
+                    pinned = [uid for uid in recipients if self.get_delivery_mode(uid) == DELIVERY_MODE_PINNED]
+                    regular = [uid for uid in recipients if self.get_delivery_mode(uid) != DELIVERY_MODE_PINNED]
                     
-                    await self.send_to_all_approved(plain_message, parse_mode=None)
-                
-                for attachment in email['attachments']:
-                    await self.send_document_to_all_approved(
-                        attachment['data'],
-                        attachment['filename'],
-                        f"Lampiran dari email: {email['subject']}"
-                    )
-                
-                logger.info(f"Email dengan subjek '{email['subject']}' berhasil diteruskan ke {len(self.approved_users)} users")
-            except Exception as e:
-                logger.error(f"Gagal memproses email: {str(e)}")
+                    if regular:
+                        self.enqueue_message(
+                            regular, rendered.html, key,
+                            kind=KIND_OTP, priority=PRIORITY_OTP,
+                            fallback_text=rendered.plain, trace=keys
+                        )
+                    if pinned:
+                        self.enqueue_pinned(pinned, rendered.html, key, fallback_text=rendered.plain, trace=keys)
+                    logger.info("Email dijadwalkan", extra={"emails": len(group_emails), "recipients": len(recipients)})
+                except Exception as e:
+                    logger.error(f"Gagal memproses email: {str(e)}")
+        
+        # Lampiran tetap dikirim per email
+        for email, recipients in zip(emails, recipients_by_email):
+            with correlation(email.get("cid")):
+                if not recipients:
+                    logger.info("Tidak ada pelanggan untuk email", extra={"subject": email['subject']})
+                    continue
+                try:
+                    key = self.email_key(email)
+                    for index, attachment in enumerate(email['attachments']):
+                        self.enqueue_document(
+                            recipients,
+                            attachment['data'],
+                            attachment['filename'],
+                            f"{key}:att{index}",
+                            caption=f"Lampiran dari email: {email['subject']}"
+                        )
+                except Exception as e:
+                    logger.error(f"Gagal menjadwalkan lampiran: {str(e)}")
+    
+    async def sweep_expired_messages(self):
+        """Menghapus pesan OTP yang lebih lama dari TTL dalam batch yang dibatasi lajunya"""
+        ttl_minutes = int(self.settings.get('otp_ttl_minutes', 0) or 0)
+        if ttl_minutes <= 0:
+            return 0
+        
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=ttl_minutes)
+        rows = await asyncio.to_thread(self.sent_messages.expired, cutoff, KIND_OTP, SWEEP_BATCH_SIZE)
+        
+        done_ids = []
+        try:
+            for row_id, chat_id, message_id in rows:
+                # Jangan bersaing dengan pengiriman OTP yang sedang berjalan
+                if await self.dispatcher.busy() or not self.rate_limiter.try_acquire_background(chat_id):
+                    break
+                try:
+                    await self.bot.delete_message(chat_id=chat_id, message_id=int(message_id))
+                except RetryAfter as e:
+                    delay = retry_after_seconds(e)
+                    logger.warning(f"Sweeper kena rate limit, lanjut setelah {delay} detik")
+                    await asyncio.sleep(delay)
+                    break
+                except TelegramError as e:
+                    # Pesan sudah dihapus atau lebih dari 48 jam - tidak bisa dihapus lagi
+                    logger.debug(f"Tidak dapat menghapus pesan {message_id} di {chat_id}: {str(e)}")
+                done_ids.append(row_id)
+                await asyncio.sleep(1 / SWEEP_DELETE_RATE)
+        finally:
+            if done_ids:
+                await asyncio.to_thread(self.sent_messages.delete, done_ids)
+                logger.info(f"Sweeper: {len(done_ids)} pesan OTP lama dihapus")
+        return len(done_ids)
+    
+    async def poll_email(self):
+        """Task periodik: reload settings, cek email baru, lalu tentukan jeda poll berikutnya"""
+        self.reload_settings()
+        started = time.monotonic()
+        try:
+            found = await self.process_new_emails()
+        except Exception as e:
+            self.health.failed(COMPONENT_POLL, e)
+            raise
+        if found is None:
+            return None
+        account = f"{self.email_reader.username}@{self.email_reader.host}"
+        return self.poll_scheduler.record(account, found, time.monotonic() - started)
+    
+    def request_fast_poll(self, reason):
+        """User sedang menunggu OTP: poll sekarang dan tetap cepat selama beberapa saat"""
+        self.poll_scheduler.kick(reason)
+        task = self.supervisor.periodic.get("email_poll")
+        if task is not None:
+            task.wake()
+    
+    async def run_cleanup(self):
+        """Task periodik: hapus OTP kedaluwarsa, bersihkan antrian, tulis trace latensi dan ringkasan log berulang"""
+        deleted = await self.sweep_expired_messages()
+        await asyncio.to_thread(self.delivery_queue.purge)
+        self.latency.expire()
+        await asyncio.to_thread(self.latency.write_finished)
+        flush_repeats()
+        # Jika batch penuh, lanjut segera; jika tidak, tunggu interval berikutnya
+        return 1 if deleted >= SWEEP_BATCH_SIZE else None
+    
+    async def run_archive_retention(self):
+        """Task periodik: hapus segment arsip yang melewati batas umur walau tidak ada email baru"""
+        await asyncio.to_thread(self.email_archive.enforce_retention)
+
+    def collect_metrics(self):
+        """Isi gauge/counter metrik yang cukup dibaca saat scrape"""
+        depth = self.delivery_queue.depth()
+        for state in (STATE_PENDING, STATE_INFLIGHT, STATE_SENT, STATE_DEAD, STATE_CANCELLED):
+            metrics.QUEUE_DEPTH.set(depth.get(state, 0), state=state)
+        metrics.ACTIVE_USERS.set(sum(1 for user_id in list(self.approved_users) if self.is_approved(user_id)))
+        metrics.JSON_WRITES.set_total(self.persistence.metrics["writes"])
+        metrics.LOG_RECORDS_DROPPED.set_total(dropped_records())
+        stores = {
+            "outbox": self.delivery_queue.conn,
+            "broadcast": self.broadcasts.store.conn,
+            "latency": self.latency.conn,
+            "sent_messages": self.sent_messages.conn,
+        }
+        for store, conn in stores.items():
+            # total_changes hanya ada di SQLite; store Postgres dilewati
+            changes = getattr(conn, "total_changes", None)
+            if changes is not None:
+                metrics.DB_ROWS_WRITTEN.set_total(changes, store=store)
+    
+    def health_status(self):
+        """Snapshot kesehatan untuk /health, /ready, /status, dan file status"""
+        depth = self.delivery_queue.depth()
+        # Poll macet diukur terhadap interval terlama (poll melambat saat sepi)
+        configured = self.email_reader.is_configured()
+        poll_interval = self.poll_scheduler.ceiling() if configured else None
+        problems = self.health.problems(poll_interval, self.delivery_queue.overdue_count(STALE_MIN))
+        return self.health.snapshot(problems, depth, email_configured=configured)
+    
+    def health_response(self):
+        """GET /health: 200 jika sehat, 503 jika poll/pengiriman gagal beruntun atau macet"""
+        status = self.health_status()
+        code = '200 OK' if status["status"] == "ok" else '503 Service Unavailable'
+        return code, 'application/json', json.dumps(status).encode('utf-8')
+    
+    def ready_response(self):
+        """GET /ready: 200 setelah bot start dan poll pertama sukses (langsung jika email belum dikonfigurasi)"""
+        status = self.health_status()
+        code = '200 OK' if status["ready"] else '503 Service Unavailable'
+        return code, 'application/json', json.dumps(status).encode('utf-8')
+    
+    async def check_health(self):
+        """Task periodik: alert owner saat poll/pengiriman bermasalah atau pulih, lalu tulis file status"""
+        status = self.health_status()
+        new, recovered = self.health.transitions(status["problems"])
+        for name, reason in new.items():
+            logger.error(f"Health check: {COMPONENT_LABELS[name]} bermasalah - {reason}")
+            if self.owner_id:
+                # Lewat antrian: jika Telegram yang bermasalah, alert terkirim begitu pulih
+                self.enqueue_message(
+                    [self.owner_id],
+                    f"🚨 <b>{COMPONENT_LABELS[name]} bermasalah</b>\n\n{self.escape_html(reason)}",
+                    f"health:{name}:{int(time.time())}"
+                )
+        for name in recovered:
+            logger.info(f"Health check: {COMPONENT_LABELS[name]} pulih")
+            if self.owner_id:
+                self.enqueue_message(
+                    [self.owner_id], f"✅ <b>{COMPONENT_LABELS[name]} pulih</b>",
+                    f"health:{name}:ok:{int(time.time())}"
+                )
+        if self.health_file:
+            try:
+                await asyncio.to_thread(atomic_write_json, self.health_file, status)
+            except OSError as e:
+                logger.error(f"Gagal menulis file status {self.health_file}: {str(e)}")
+    
+    def container_sizes(self):
+        """Ukuran state in-memory yang tumbuh seiring waktu (untuk laporan /profile)"""
+        return {
+            "email_reader.processed_emails": len(self.email_reader.processed_emails),
+            "approved_users": len(self.approved_users),
+            "pinned_messages": len(self.pinned_messages),
+            "plain_only_chats": len(self.plain_only_chats),
+            "upload_locks": len(self._upload_locks),
+            "pinned_locks": len(self._pinned_locks),
+            "latency.pending": len(self.latency.pending),
+            "coalesce_buffer": len(self._coalesce_buffer),
+        }
+    
+    def start_background_tasks(self):
+        """Polling, expiry, dan cleanup sebagai task terpisah yang tidak saling menunggu"""
+        self.supervisor.add_periodic("email_poll", self.poll_email, lambda: self.check_interval)
+        self.supervisor.add_periodic("expiry", self.check_and_notify_expiring_users, EXPIRY_CHECK_INTERVAL)
+        self.supervisor.add_periodic("cleanup", self.run_cleanup, SWEEP_INTERVAL)
+        self.supervisor.add_periodic("sent_records", self.flush_sent_records, SENT_FLUSH_INTERVAL)
+        self.supervisor.add_periodic("archive_retention", self.run_archive_retention, ARCHIVE_RETENTION_INTERVAL)
+        self.supervisor.add_periodic("health", self.check_health, HEALTH_CHECK_INTERVAL)
+        # Job broadcast (dilanjutkan dari cursor jika bot sempat mati)
+        self.supervisor.spawn("broadcast", self.broadcasts.run)
+    
+    async def shutdown(self, application):
+        """Shutdown bertahap: berhenti menerima update, selesaikan task, kuras pengiriman, simpan state"""
+        logger.info("Menghentikan bot...")
+        self.health.ready = False
+        if application.updater.running:
+            await application.updater.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self._profile_task is not None:
+            self._profile_task.cancel()
+        self.profiler.stop()
+        
+        # Poll yang sedang berjalan dibiarkan selesai supaya email yang sudah diambil tidak hilang
+        await self.supervisor.stop()
+        
+        # Email yang masih ditahan tetap masuk antrian persisten
+        if self._coalesce_task is not None:
+            self._coalesce_task.cancel()
+        self.flush_coalesced()
+        
+        # Tunggu pengiriman yang sedang berjalan; sisanya tetap di antrian untuk start berikutnya
+        await self.dispatcher.stop(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        await self.flush_sent_records()
+        
+        # Pastikan semua perubahan JSON yang tertunda tertulis sebelum keluar
+        await self.persistence.flush()
+        await asyncio.to_thread(self.latency.flush)
+        if self._merge_task is not None:
+            await asyncio.gather(self._merge_task, return_exceptions=True)
+        entries = self.email_archive.entries
+        await asyncio.to_thread(self.search_index.merge, entries[0].seq if entries else 0)
+        
+        # Tutup application dan pool HTTP dengan benar
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        logger.info("Bot berhenti")
     
     # ==================== COMMAND HANDLERS ====================
     
@@ -563,7 +1203,13 @@ class EmailForwarderBot:
             "/myid - Lihat ID Telegram Anda\n"
             "/status - Lihat status bot\n"
             "/help - Tampilkan bantuan ini\n"
-            "/redeem &lt;kode&gt; - Gunakan kode akses\n\n"
+            "/redeem &lt;kode&gt; - Gunakan kode akses\n"
+            "/last - Lihat OTP terakhir\n"
+            "/history &lt;n&gt; - Lihat n email terakhir\n"
+            "/search &lt;kata&gt; - Cari email di arsip\n"
+            "/subscribe &lt;kata|@domain&gt; - Hanya terima email tertentu\n"
+            "/unsubscribe &lt;aturan|all&gt; - Hapus langganan\n"
+            "/pinmode &lt;on|off&gt; - Satu pesan OTP pinned yang diperbarui\n\n"
         )
         
         if self.is_owner(user_id):
@@ -577,7 +1223,11 @@ class EmailForwarderBot:
                 "/addakses &lt;id&gt; &lt;hari&gt; - Tambah akses sementara\n"
                 "/removeuser &lt;id&gt; - Hapus user\n"
                 "/listusers - Daftar user\n"
-                "/broadcast &lt;pesan&gt; - Kirim pesan ke semua\n\n"
+                "/stats - Latensi email sampai terkirim\n"
+                "/profile &lt;start|stop&gt; - Profil CPU/memori bot\n"
+                "/broadcast &lt;pesan&gt; - Kirim pesan ke semua\n"
+                "/broadcast_status [id] - Progres broadcast\n"
+                "/broadcast_cancel &lt;id&gt; - Batalkan broadcast\n\n"
                 "<b>🎫 Kode Redeem (Owner):</b>\n"
                 "/kodeunik &lt;hari&gt; - Buat kode redeem\n"
                 "/listkode - Daftar kode\n"
@@ -608,7 +1258,10 @@ class EmailForwarderBot:
                 "<code>/set subject &lt;text&gt;</code> - Filter subjek\n"
                 "<code>/set nofilter</code> - Hapus semua filter\n\n"
                 "<b>⏱ Interval:</b>\n"
-                "<code>/set interval &lt;detik&gt;</code> - Interval cek email\n\n"
+                "<code>/set interval &lt;detik&gt;</code> - Interval cek minimum\n"
+                "<code>/set maxinterval &lt;detik&gt;</code> - Interval maksimum saat sepi\n"
+                "<code>/set ttl &lt;menit&gt;</code> - Auto-delete pesan OTP\n"
+                "<code>/set coalesce &lt;ms&gt;</code> - Gabungkan burst OTP\n\n"
                 "<b>📋 Lihat Pengaturan:</b>\n"
                 "<code>/settings</code> - Lihat semua pengaturan",
                 parse_mode=ParseMode.HTML
@@ -642,9 +1295,7 @@ class EmailForwarderBot:
                 return
             
             new_host = context.args[1]
-            self.settings['email_host'] = new_host
-            save_settings(self.settings)
-            self.email_reader.reload_settings()
+            self.settings_store.update(email_host=new_host)
             
             await update.message.reply_text(
                 f"✅ Email host berhasil diubah ke:\n<code>{new_host}</code>",
@@ -661,9 +1312,7 @@ class EmailForwarderBot:
                 return
             
             new_user = context.args[1]
-            self.settings['email_username'] = new_user
-            save_settings(self.settings)
-            self.email_reader.reload_settings()
+            self.settings_store.update(email_username=new_user)
             
             await update.message.reply_text(
                 f"✅ Email username berhasil diubah ke:\n<code>{new_user}</code>",
@@ -683,9 +1332,7 @@ class EmailForwarderBot:
             
             # Gabungkan semua args setelah 'pass' (untuk password dengan spasi)
             new_pass = ' '.join(context.args[1:])
-            self.settings['email_password'] = new_pass
-            save_settings(self.settings)
-            self.email_reader.reload_settings()
+            self.settings_store.update(email_password=new_pass)
             
             await update.message.reply_text(
                 f"✅ Email password berhasil diubah.\n\n"
@@ -705,9 +1352,7 @@ class EmailForwarderBot:
                 return
             
             new_sender = context.args[1] if context.args[1].lower() != 'none' else ''
-            self.settings['filter_sender'] = new_sender
-            save_settings(self.settings)
-            self.email_reader.reload_settings()
+            self.settings_store.update(filter_sender=new_sender)
             
             if new_sender:
                 await update.message.reply_text(
@@ -729,9 +1374,7 @@ class EmailForwarderBot:
                 return
             
             new_subject = ' '.join(context.args[1:]) if context.args[1].lower() != 'none' else ''
-            self.settings['filter_subject'] = new_subject
-            save_settings(self.settings)
-            self.email_reader.reload_settings()
+            self.settings_store.update(filter_subject=new_subject)
             
             if new_subject:
                 await update.message.reply_text(
@@ -742,10 +1385,7 @@ class EmailForwarderBot:
                 await update.message.reply_text("✅ Filter subject dihapus. Menerima semua subjek.")
         
         elif action == "nofilter":
-            self.settings['filter_sender'] = ''
-            self.settings['filter_subject'] = ''
-            save_settings(self.settings)
-            self.email_reader.reload_settings()
+            self.settings_store.update(filter_sender='', filter_subject='')
             
             await update.message.reply_text(
                 "✅ Semua filter dihapus.\n\n"
@@ -771,9 +1411,7 @@ class EmailForwarderBot:
                     await update.message.reply_text("⚠️ Interval minimal 1 detik.")
                     return
                 
-                self.settings['check_interval'] = new_interval
-                save_settings(self.settings)
-                self.check_interval = new_interval
+                self.settings_store.update(check_interval=new_interval)
                 
                 await update.message.reply_text(
                     f"✅ Interval cek email diubah ke:\n<b>{new_interval} detik</b>",
@@ -782,6 +1420,99 @@ class EmailForwarderBot:
             except ValueError:
                 await update.message.reply_text("⚠️ Interval harus berupa angka.")
         
+        elif action == "maxinterval":
+            if len(context.args) < 2:
+                await update.message.reply_text(
+                    "📝 <b>Format:</b> <code>/set maxinterval &lt;detik&gt;</code>\n\n"
+                    "Saat tidak ada email, interval cek melambat bertahap sampai batas ini. "
+                    "Setelah email masuk, bot kembali ke interval minimum.\n\n"
+                    "Contoh:\n"
+                    "• <code>/set maxinterval 60</code> → Maksimal 1 menit saat sepi\n"
+                    "• <code>/set maxinterval 0</code> → Interval tetap (tidak adaptif)",
+                    parse_mode=ParseMode.HTML
+                )
+                return
+            
+            try:
+                new_max = int(context.args[1])
+                if new_max < 0:
+                    await update.message.reply_text("⚠️ Interval tidak boleh negatif.")
+                    return
+                
+                self.settings_store.update(poll_max_interval=new_max)
+                
+                if new_max:
+                    await update.message.reply_text(
+                        f"✅ Interval cek adaptif: {self.check_interval} - <b>{max(new_max, self.check_interval)} detik</b>.",
+                        parse_mode=ParseMode.HTML
+                    )
+                else:
+                    await update.message.reply_text(
+                        f"✅ Interval cek tetap {self.check_interval} detik."
+                    )
+            except ValueError:
+                await update.message.reply_text("⚠️ Interval harus berupa angka.")
+        
+        elif action == "ttl":
+            if len(context.args) < 2:
+                await update.message.reply_text(
+                    "📝 <b>Format:</b> <code>/set ttl &lt;menit&gt;</code>\n\n"
+                    "Pesan OTP akan dihapus otomatis setelah waktu ini.\n\n"
+                    "Contoh:\n"
+                    "• <code>/set ttl 10</code> → Hapus setelah 10 menit\n"
+                    "• <code>/set ttl 0</code> → Jangan hapus otomatis",
+                    parse_mode=ParseMode.HTML
+                )
+                return
+            
+            try:
+                new_ttl = int(context.args[1])
+                if new_ttl < 0:
+                    await update.message.reply_text("⚠️ TTL tidak boleh negatif.")
+                    return
+                
+                self.settings_store.update(otp_ttl_minutes=new_ttl)
+                
+                if new_ttl:
+                    await update.message.reply_text(
+                        f"✅ Pesan OTP akan dihapus otomatis setelah <b>{new_ttl} menit</b>.",
+                        parse_mode=ParseMode.HTML
+                    )
+                else:
+                    await update.message.reply_text("✅ Auto-delete pesan OTP dimatikan.")
+            except ValueError:
+                await update.message.reply_text("⚠️ TTL harus berupa angka.")
+        
+        elif action == "coalesce":
+            if len(context.args) < 2:
+                await update.message.reply_text(
+                    "📝 <b>Format:</b> <code>/set coalesce &lt;ms&gt;</code>\n\n"
+                    "Email yang masuk dalam jendela ini digabung menjadi satu pesan per user.\n\n"
+                    "Contoh:\n"
+                    "• <code>/set coalesce 500</code> → Gabungkan email dalam 500 ms\n"
+                    "• <code>/set coalesce 0</code> → Kirim setiap email terpisah",
+                    parse_mode=ParseMode.HTML
+                )
+                return
+            
+            try:
+                new_window = int(context.args[1])
+                if new_window < 0 or new_window > MAX_COALESCE_MS:
+                    await update.message.reply_text(f"⚠️ Jendela harus antara 0 dan {MAX_COALESCE_MS} ms.")
+                    return
+                
+                self.settings_store.update(coalesce_ms=new_window)
+                
+                if new_window:
+                    await update.message.reply_text(
+                        f"✅ Email dalam <b>{new_window} ms</b> akan digabung menjadi satu pesan.",
+                        parse_mode=ParseMode.HTML
+                    )
+                else:
+                    await update.message.reply_text("✅ Penggabungan pesan dimatikan.")
+            except ValueError:
+                await update.message.reply_text("⚠️ Jendela harus berupa angka (ms).")
+        
         else:
             await update.message.reply_text(
                 f"⚠️ Perintah tidak dikenal: <code>{action}</code>\n\n"
@@ -797,7 +1528,7 @@ class EmailForwarderBot:
             await update.message.reply_text("❌ Hanya owner yang dapat melihat pengaturan.")
             return
         
-        settings = load_settings()
+        settings = self.settings_store.get()
         
         # Mask password
         password_display = "****" if settings.get('email_password') else "(belum diatur)"
@@ -818,7 +1549,10 @@ class EmailForwarderBot:
             f"<b>🔍 Filter:</b>\n"
             f"• Sender: <code>{settings.get('filter_sender') or '(semua)'}</code>\n"
             f"• Subject: <code>{settings.get('filter_subject') or '(semua)'}</code>\n\n"
-            f"<b>⏱ Interval:</b> {settings.get('check_interval', 2)} detik\n\n"
+            f"<b>⏱ Interval:</b> {settings.get('check_interval', 2)} detik"
+            f"{' - ' + str(settings.get('poll_max_interval')) + ' detik (adaptif)' if settings.get('poll_max_interval') else ' (tetap)'}\n"
+            f"<b>🗑 Auto-delete OTP:</b> {str(settings.get('otp_ttl_minutes')) + ' menit' if settings.get('otp_ttl_minutes') else 'mati'}\n"
+            f"<b>📦 Coalescing:</b> {str(settings.get('coalesce_ms')) + ' ms' if settings.get('coalesce_ms') else 'mati'}\n\n"
             f"<b>Status:</b> {status_emoji} {'Terkonfigurasi' if email_configured else 'Belum lengkap'}",
             parse_mode=ParseMode.HTML
         )
@@ -847,8 +1581,11 @@ class EmailForwarderBot:
             return
         
         try:
-            if self.email_reader.connect():
-                self.email_reader.disconnect()
+            async with self._imap_lock:
+                connected = await asyncio.to_thread(self.email_reader.connect)
+                if connected:
+                    self.email_reader.disconnect()
+            if connected:
                 await update.message.reply_text(
                     "✅ <b>Koneksi Berhasil!</b>\n\n"
                     f"📧 Host: {self.email_reader.host}\n"
@@ -1022,21 +1759,89 @@ class EmailForwarderBot:
         
         message_text = " ".join(context.args)
         
-        await update.message.reply_text("📤 Mengirim broadcast...")
-        
         broadcast_message = (
             f"📢 <b>BROADCAST dari Admin</b>\n\n"
             f"{self.escape_html(message_text)}"
         )
         
-        success_count = await self.send_to_all_approved(broadcast_message)
         active_users, _ = self.get_active_approved_users()
+        job_id = self.broadcasts.start_job(user_id, broadcast_message, active_users)
+        
+        await update.message.reply_text(
+            f"📤 Broadcast <b>#{job_id}</b> dimulai ke {len(active_users)} users.\n"
+            f"Pesan OTP tetap dikirim lebih dulu.\n\n"
+            f"Cek progres: <code>/broadcast_status {job_id}</code>\n"
+            f"Batalkan: <code>/broadcast_cancel {job_id}</code>",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_broadcast_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /broadcast_status [id] - progres job broadcast"""
+        user_id = update.effective_user.id
+        
+        if not self.is_owner(user_id):
+            await update.message.reply_text("❌ Hanya owner yang dapat melihat status broadcast.")
+            return
+        
+        if context.args:
+            try:
+                job = self.broadcasts.store.get(int(context.args[0]))
+            except ValueError:
+                await update.message.reply_text("⚠️ ID broadcast harus berupa angka.")
+                return
+            jobs = [job] if job else []
+        else:
+            jobs = self.broadcasts.store.recent()
+        
+        if not jobs:
+            await update.message.reply_text("📭 Belum ada broadcast.")
+            return
+        
+        state_labels = {JOB_RUNNING: "⏳ berjalan", "done": "✅ selesai", "cancelled": "🛑 dibatalkan"}
+        lines = []
+        for job in jobs:
+            progress = self.broadcasts.progress(job)
+            created = datetime.fromtimestamp(job["created_at"]).strftime('%d-%m %H:%M')
+            lines.append(
+                f"<b>#{job['id']}</b> {state_labels.get(job['state'], job['state'])} ({created})\n"
+                f"Terkirim {progress['sent']}/{job['total']}, gagal {progress['failed']}, "
+                f"menunggu {progress['waiting']}"
+            )
         
         await update.message.reply_text(
-            f"✅ Broadcast terkirim ke {success_count}/{len(active_users)} users.",
+            "📢 <b>Status Broadcast</b>\n\n" + "\n\n".join(lines),
             parse_mode=ParseMode.HTML
         )
     
+    async def cmd_broadcast_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /broadcast_cancel <id> - hentikan job broadcast"""
+        user_id = update.effective_user.id
+        
+        if not self.is_owner(user_id):
+            await update.message.reply_text("❌ Hanya owner yang dapat membatalkan broadcast.")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "📝 <b>Cara penggunaan:</b>\n"
+                "<code>/broadcast_cancel &lt;id&gt;</code>",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        try:
+            job_id = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("⚠️ ID broadcast harus berupa angka.")
+            return
+        
+        skipped = self.broadcasts.cancel(job_id)
+        if skipped is None:
+            await update.message.reply_text(f"⚠️ Broadcast #{job_id} tidak ditemukan atau sudah selesai.")
+            return
+        
+        await update.message.reply_text(f"🛑 Broadcast #{job_id} dibatalkan. {skipped} penerima dilewati.")
+    
     async def cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler untuk command /status"""
         user_id = update.effective_user.id
@@ -1050,14 +1855,405 @@ class EmailForwarderBot:
         status_msg = (
             f"📊 <b>Status Bot</b>\n\n"
             f"{'✅' if email_configured else '⚠️'} Bot {'aktif' if email_configured else 'belum dikonfigurasi'}\n"
-            f"⏱ Interval cek: {self.check_interval} detik\n"
+            f"⏱ Interval cek: {self.poll_scheduler.interval:.0f} detik "
+            f"(min {self.check_interval}, maks {self.poll_scheduler.ceiling():.0f})\n"
             f"👥 Approved users: {len(self.approved_users)}\n"
             f"📧 Email host: {self.email_reader.host or '(belum diatur)'}\n"
             f"📬 Folder: {self.email_reader.folder}"
         )
         
+        if self.is_owner(user_id):
+            depth = self.delivery_queue.depth()
+            status_msg += (
+                f"\n📮 Antrian: {depth.get('pending', 0)} pending, "
+                f"{depth.get('inflight', 0)} dikirim, {depth.get('dead', 0)} gagal"
+            )
+            pool_stats = self.http_request.snapshot()
+            status_msg += (
+                f"\n🌐 HTTP: {pool_stats['requests']} request, "
+                f"{pool_stats['open_connections']}/{self.http_request.pool_size} koneksi terbuka, "
+                f"{pool_stats['connections_opened']} koneksi baru, "
+                f"puncak {pool_stats['peak_in_flight']} paralel"
+            )
+            for account, poll_stats in self.poll_scheduler.stats().items():
+                status_msg += (
+                    f"\n📥 {self.escape_html(account)}: {poll_stats['polls']} poll, "
+                    f"{poll_stats['found']} email, kosong beruntun {poll_stats['empty_streak']}, "
+                    f"rata-rata {poll_stats['avg_duration']:.1f} dtk"
+                    f"{', mode cepat' if poll_stats['hot'] else ''}"
+                )
+            for name, task_stats in self.supervisor.stats().items():
+                status_msg += (
+                    f"\n⚙️ {name}: {task_stats['runs']} run, terakhir {task_stats['last_duration']:.1f} dtk, "
+                    f"overrun {task_stats['overruns']}, gagal {task_stats['failures']}"
+                )
+            for name, state in self.health_status()["components"].items():
+                if state.get("configured") is False:
+                    status_msg += f"\n⏸️ {COMPONENT_LABELS[name]}: email belum dikonfigurasi (/set)"
+                    continue
+                last_ok = f"{state['age']:.0f} dtk lalu" if state["age"] is not None else "belum pernah"
+                status_msg += (
+                    f"\n{'🩺' if state['ok'] else '🚨'} {COMPONENT_LABELS[name]}: sukses terakhir {last_ok}, "
+                    f"gagal beruntun {state['failures']}"
+                )
+            write_stats = self.persistence.stats()
+            status_msg += (
+                f"\n💾 JSON writes: {write_stats['writes']} "
+                f"(digabung: {write_stats['coalesced']}, "
+                f"rata-rata {write_stats['avg_latency'] * 1000:.1f} ms, "
+                f"maks {write_stats['max_latency'] * 1000:.1f} ms)"
+            )
+        
         await update.message.reply_text(status_msg, parse_mode=ParseMode.HTML)
     
+    async def cmd_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /stats - latensi email sampai terkirim (p50/p95/p99)"""
+        user_id = update.effective_user.id
+        
+        if not self.is_owner(user_id):
+            await update.message.reply_text("❌ Hanya owner yang dapat melihat statistik.")
+            return
+        
+        summary = await asyncio.to_thread(self.latency.summary)
+        labels = [
+            ("arrival_to_first", "Tiba → penerima pertama"),
+            ("arrival_to_last", "Tiba → penerima terakhir"),
+            ("arrival_to_poll", "Tiba → poll"),
+            ("poll_to_fetch", "Poll → fetch"),
+            ("fetch_to_parse", "Fetch → parse"),
+            ("parse_to_queue", "Parse → antrian"),
+            ("queue_to_first", "Antrian → terkirim"),
+        ]
+        
+        def fmt(value):
+            return "-" if value is None else f"{value:.1f}s"
+        
+        if not summary["arrival_to_first"]["count"]:
+            await update.message.reply_text("📭 Belum ada data latensi. Tunggu email berikutnya diteruskan.")
+            return
+        
+        lines = []
+        for name, label in labels:
+            metric = summary[name]
+            lines.append(
+                f"<b>{label}</b> ({metric['count']})\n"
+                f"p50 {fmt(metric['p50'])} · p95 {fmt(metric['p95'])} · "
+                f"p99 {fmt(metric['p99'])} · maks {fmt(metric['max'])}"
+            )
+        
+        buckets = summary["arrival_to_first"]["histogram"]
+        total = sum(count for _, count in buckets) or 1
+        histogram_lines = []
+        for bound, count in buckets:
+            label = f"≤{bound}s" if bound is not None else "lebih"
+            bar = "█" * round(count / total * 20)
+            histogram_lines.append(f"{label:>6} {bar} {count}")
+        
+        await update.message.reply_text(
+            "⏱ <b>Latensi Email → Telegram</b>\n\n" + "\n\n".join(lines) +
+            "\n\n<b>Histogram tiba → penerima pertama:</b>\n<pre>" + "\n".join(histogram_lines) + "</pre>",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /profile start [detik] [mem] | stop - profil hotspot bot"""
+        user_id = update.effective_user.id
+        
+        if not self.is_owner(user_id):
+            await update.message.reply_text("❌ Hanya owner yang dapat menjalankan profiler.")
+            return
+        
+        action = context.args[0].lower() if context.args else ""
+        
+        if action == "start":
+            if self.profiler.running:
+                await update.message.reply_text(
+                    f"⚠️ Profiler sudah berjalan ({self.profiler.elapsed():.0f} detik). Gunakan /profile stop."
+                )
+                return
+            
+            window = DEFAULT_WINDOW
+            trace_memory = False
+            for arg in context.args[1:]:
+                if arg.lower() in ("mem", "memory", "memori"):
+                    trace_memory = True
+                    continue
+                try:
+                    window = int(arg)
+                except ValueError:
+                    await update.message.reply_text("⚠️ Durasi harus berupa angka (detik).")
+                    return
+                if window < 1 or window > MAX_WINDOW:
+                    await update.message.reply_text(f"⚠️ Durasi harus antara 1 dan {MAX_WINDOW} detik.")
+                    return
+            
+            self.profiler.start(trace_memory=trace_memory)
+            self._profile_chat = update.effective_chat.id
+            self._profile_task = asyncio.create_task(self._finish_profile_after(window))
+            await update.message.reply_text(
+                f"🔬 Profiler aktif selama {window} detik"
+                f"{' (dengan diff memori tracemalloc)' if trace_memory else ''}.\n"
+                f"Laporan dikirim otomatis, atau gunakan /profile stop."
+            )
+            return
+        
+        if action == "stop":
+            if not self.profiler.running:
+                await update.message.reply_text("⚠️ Profiler tidak sedang berjalan.")
+                return
+            if self._profile_task is not None:
+                self._profile_task.cancel()
+                self._profile_task = None
+            await self.send_profile_report()
+            return
+        
+        status = (
+            f"berjalan {self.profiler.elapsed():.0f} detik" if self.profiler.running else "tidak aktif"
+        )
+        await update.message.reply_text(
+            "📝 <b>Cara penggunaan:</b>\n"
+            f"<code>/profile start [detik] [mem]</code> - maks {MAX_WINDOW} detik, default {DEFAULT_WINDOW}\n"
+            "<code>/profile stop</code> - hentikan dan kirim laporan\n\n"
+            f"Status: {status}",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def _finish_profile_after(self, window):
+        await asyncio.sleep(window)
+        self._profile_task = None
+        await self.send_profile_report()
+    
+    async def send_profile_report(self):
+        """Hentikan profiler dan kirim hotspot sebagai dokumen teks ke chat yang memulainya"""
+        # join thread sampler + diff tracemalloc bisa memakan waktu - jangan di event loop
+        report = await asyncio.to_thread(self.profiler.stop)
+        if report is None:
+            return
+        filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+        try:
+            await self._send_document(
+                self._profile_chat, report.encode('utf-8'), filename, "🔬 Laporan profiler"
+            )
+        except TelegramError as e:
+            logger.error(f"Gagal mengirim laporan profiler: {str(e)}")
+    
+    def format_archived_email(self, record, include_text=False):
+        """Format record arsip email menjadi ringkasan pesan Telegram"""
+        try:
+            date_display = datetime.fromisoformat(record['date']).strftime('%Y-%m-%d %H:%M:%S')
+        except (ValueError, TypeError):
+            date_display = record.get('date') or '-'
+        
+        message = (
+            f"<b>Dari:</b> {self.escape_html(record.get('from'))}\n"
+            f"<b>Subjek:</b> {self.escape_html(record.get('subject'))}\n"
+            f"<b>Tanggal:</b> {date_display}\n"
+        )
+        if record.get('otp'):
+            message += f"<b>🔑 OTP:</b> <code>{record['otp']}</code>\n"
+        if include_text and record.get('text'):
+            message += f"\n{self.escape_html(record['text'])}\n"
+        return message
+    
+    async def cmd_last(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /last - OTP terakhir dari arsip lokal"""
+        user_id = update.effective_user.id
+        
+        if not self.is_approved(user_id):
+            await update.message.reply_text("❌ Anda tidak memiliki akses ke perintah ini.")
+            return
+        
+        self.request_fast_poll("/last")
+        
+        records = self.email_archive.latest(1, otp_only=True)
+        if not records:
+            records = self.email_archive.latest(1)
+        
+        if not records:
+            await update.message.reply_text("📭 Belum ada email di arsip.")
+            return
+        
+        await update.message.reply_text(
+            f"📧 <b>Email Terakhir</b>\n\n{self.format_archived_email(records[0], include_text=True)}",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /history <n> - n email terakhir dari arsip lokal"""
+        user_id = update.effective_user.id
+        
+        if not self.is_approved(user_id):
+            await update.message.reply_text("❌ Anda tidak memiliki akses ke perintah ini.")
+            return
+        
+        try:
+            count = int(context.args[0]) if context.args else 5
+        except ValueError:
+            await update.message.reply_text("⚠️ Jumlah email harus berupa angka.")
+            return
+        count = max(1, min(count, 20))
+        
+        records = self.email_archive.latest(count)
+        if not records:
+            await update.message.reply_text("📭 Belum ada email di arsip.")
+            return
+        
+        blocks = [self.format_archived_email(record) for record in records]
+        await update.message.reply_text(
+            f"📚 <b>{len(records)} Email Terakhir</b>\n\n" + "\n".join(blocks),
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /search <kata> - cari email di arsip lokal"""
+        user_id = update.effective_user.id
+        
+        if not self.is_approved(user_id):
+            await update.message.reply_text("❌ Anda tidak memiliki akses ke perintah ini.")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "📝 <b>Cara penggunaan:</b>\n"
+                "<code>/search &lt;kata&gt;</code>\n\n"
+                "Contoh: <code>/search airwallex</code>",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        query = " ".join(context.args)
+        records = []
+        for seq in self.search_index.search(query, limit=10):
+            record = self.email_archive.get(seq)
+            if record:
+                records.append(record)
+        
+        if not records:
+            await update.message.reply_text(
+                f"🔍 Tidak ada email yang cocok dengan <code>{self.escape_html(query)}</code>.",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        blocks = [self.format_archived_email(record) for record in records]
+        await update.message.reply_text(
+            f"🔍 <b>{len(records)} hasil untuk</b> <code>{self.escape_html(query)}</code>\n\n" + "\n".join(blocks),
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /subscribe <kata|@domain> - hanya terima email yang cocok"""
+        user_id = update.effective_user.id
+        
+        if not self.is_approved(user_id):
+            await update.message.reply_text("❌ Anda tidak memiliki akses ke perintah ini.")
+            return
+        
+        rules = self.get_user_subscriptions(user_id)
+        
+        if not context.args:
+            current = "\n".join(f"• <code>{self.escape_html(rule)}</code>" for rule in rules) or "Semua email (tanpa filter)"
+            await update.message.reply_text(
+                f"🔔 <b>Langganan Anda:</b>\n{current}\n\n"
+                "📝 <b>Cara penggunaan:</b>\n"
+                "<code>/subscribe &lt;kata&gt;</code> - kata di pengirim/subjek\n"
+                "<code>/subscribe @domain.com</code> - domain pengirim\n"
+                "<code>/unsubscribe &lt;aturan|all&gt;</code> - hapus langganan\n\n"
+                "Contoh: <code>/subscribe airwallex</code>",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        rule = normalize_rule(" ".join(context.args))
+        if rule is None:
+            await update.message.reply_text("⚠️ Aturan tidak valid. Kata kunci minimal 3 karakter.")
+            return
+        
+        if rule in rules:
+            await update.message.reply_text(
+                f"ℹ️ Anda sudah berlangganan <code>{self.escape_html(rule)}</code>.",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        if len(rules) >= MAX_SUBSCRIPTIONS:
+            await update.message.reply_text(f"⚠️ Maksimal {MAX_SUBSCRIPTIONS} langganan per user.")
+            return
+        
+        rules.append(rule)
+        self.set_user_subscriptions(user_id, rules)
+        await update.message.reply_text(
+            f"✅ Berlangganan <code>{self.escape_html(rule)}</code>.\n"
+            f"Anda sekarang hanya menerima email yang cocok dengan {len(rules)} aturan.",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /unsubscribe <aturan|all> - hapus langganan"""
+        user_id = update.effective_user.id
+        
+        if not self.is_approved(user_id):
+            await update.message.reply_text("❌ Anda tidak memiliki akses ke perintah ini.")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "📝 <b>Cara penggunaan:</b>\n"
+                "<code>/unsubscribe &lt;aturan&gt;</code>\n"
+                "<code>/unsubscribe all</code> - terima semua email lagi",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        if context.args[0].lower() == "all":
+            self.set_user_subscriptions(user_id, [])
+            await update.message.reply_text("✅ Semua langganan dihapus. Anda menerima semua email.")
+            return
+        
+        rule = normalize_rule(" ".join(context.args))
+        rules = self.get_user_subscriptions(user_id)
+        if rule not in rules:
+            await update.message.reply_text("⚠️ Aturan tersebut tidak ada di langganan Anda.")
+            return
+        
+        rules.remove(rule)
+        self.set_user_subscriptions(user_id, rules)
+        remaining = f"{len(rules)} aturan tersisa." if rules else "Anda menerima semua email."
+        await update.message.reply_text(
+            f"✅ Langganan <code>{self.escape_html(rule)}</code> dihapus. {remaining}",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def cmd_pinmode(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler untuk command /pinmode <on|off> - satu pesan pinned yang selalu diperbarui"""
+        user_id = update.effective_user.id
+        
+        if not self.is_approved(user_id):
+            await update.message.reply_text("❌ Anda tidak memiliki akses ke perintah ini.")
+            return
+        
+        current = self.get_delivery_mode(user_id) == DELIVERY_MODE_PINNED
+        
+        if not context.args or context.args[0].lower() not in ("on", "off"):
+            await update.message.reply_text(
+                f"📌 <b>Mode Pinned:</b> {'aktif' if current else 'mati'}\n\n"
+                "Saat aktif, bot memperbarui satu pesan <b>OTP Terakhir</b> yang di-pin "
+                "alih-alih mengirim pesan baru untuk setiap email.\n"
+                "Catatan: pesan yang diedit tidak memunculkan notifikasi.\n\n"
+                "📝 <b>Cara penggunaan:</b>\n"
+                "<code>/pinmode on</code> atau <code>/pinmode off</code>",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        enabled = context.args[0].lower() == "on"
+        self.set_delivery_mode(user_id, DELIVERY_MODE_PINNED if enabled else DELIVERY_MODE_MESSAGES)
+        
+        if enabled:
+            await update.message.reply_text("✅ Mode pinned aktif. Email berikutnya akan memperbarui pesan pinned.")
+        else:
+            await update.message.reply_text("✅ Mode pinned dimatikan. Setiap email dikirim sebagai pesan baru.")
+    
     async def cmd_kodeunik(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler untuk command /kodeunik <hari> - hanya owner, generate kode redeem"""
         user_id = update.effective_user.id
@@ -1215,13 +2411,54 @@ class EmailForwarderBot:
             except:
                 pass
     
+    def build_application(self):
+        """Application dengan pool request bersama; getUpdates memakai koneksi terpisah"""
+        return (
+            Application.builder()
+            .token(self.bot_token)
+            .base_url(self.api_base_url)
+            .request(self.http_request)
+            .get_updates_request(PooledRequest(pool_size=1, read_timeout=30))
+            .build()
+        )
+    
     def start_polling(self):
-        """Memulai bot dengan polling"""
+        """Memulai bot dengan long polling"""
+        self.run(webhook=False)
+    
+    def start_webhook(self, listen=None, port=None):
+        """Memulai bot dengan server webhook bawaan PTB"""
+        if not self.webhook_url:
+            raise ValueError("WEBHOOK_URL wajib diisi untuk mode webhook")
+        if listen:
+            self.webhook_listen = listen
+        if port:
+            self.webhook_port = int(port)
+        self.run(webhook=True)
+    
+    async def start_updates(self, application, webhook=False):
+        """Mulai menerima update lewat polling atau webhook"""
+        if not webhook:
+            await application.updater.start_polling(drop_pending_updates=True)
+            return
+        
+        # Update yang tertunda selama restart tetap diproses (tidak di-drop)
+        await application.updater.start_webhook(
+            listen=self.webhook_listen,
+            port=self.webhook_port,
+            url_path=self.webhook_path,
+            webhook_url=self.webhook_url,
+            secret_token=self.webhook_secret,
+            drop_pending_updates=False
+        )
+        logger.info(f"Webhook aktif di {self.webhook_listen}:{self.webhook_port}/{self.webhook_path}")
+    
+    def run(self, webhook=False):
+        """Menjalankan bot (polling atau webhook) beserta loop pengecekan email"""
         import asyncio
         
         async def run_bot():
-            # Buat application
-            application = Application.builder().token(self.bot_token).build()
+            application = self.application
             
             # Daftarkan command handlers
             application.add_handler(CommandHandler("start", self.cmd_start))
@@ -1235,16 +2472,26 @@ class EmailForwarderBot:
             application.add_handler(CommandHandler("removeuser", self.cmd_removeuser))
             application.add_handler(CommandHandler("listusers", self.cmd_listusers))
             application.add_handler(CommandHandler("broadcast", self.cmd_broadcast))
+            application.add_handler(CommandHandler("broadcast_status", self.cmd_broadcast_status))
+            application.add_handler(CommandHandler("broadcast_cancel", self.cmd_broadcast_cancel))
             application.add_handler(CommandHandler("status", self.cmd_status))
+            application.add_handler(CommandHandler("stats", self.cmd_stats))
+            application.add_handler(CommandHandler("profile", self.cmd_profile))
             application.add_handler(CommandHandler("kodeunik", self.cmd_kodeunik))
             application.add_handler(CommandHandler("listkode", self.cmd_listkode))
             application.add_handler(CommandHandler("hapuskode", self.cmd_hapuskode))
             application.add_handler(CommandHandler("redeem", self.cmd_redeem))
+            application.add_handler(CommandHandler("last", self.cmd_last))
+            application.add_handler(CommandHandler("history", self.cmd_history))
+            application.add_handler(CommandHandler("search", self.cmd_search))
+            application.add_handler(CommandHandler("subscribe", self.cmd_subscribe))
+            application.add_handler(CommandHandler("unsubscribe", self.cmd_unsubscribe))
+            application.add_handler(CommandHandler("pinmode", self.cmd_pinmode))
             
-            # Mulai polling
+            # Mulai menerima update
             await application.initialize()
             await application.start()
-            await application.updater.start_polling(drop_pending_updates=True)
+            await self.start_updates(application, webhook)
             
             logger.info("Bot started! Listening for commands...")
             
@@ -1264,23 +2511,30 @@ class EmailForwarderBot:
                 except:
                     pass
             
-            # Loop utama untuk cek email dan expiry
-            while True:
+            # Worker antrian pengiriman
+            self.dispatcher.start()
+            self.start_background_tasks()
+            self.health.ready = True
+            if self.metrics_server is not None:
                 try:
-                    # Reload settings untuk mendapatkan interval terbaru
-                    self.reload_settings()
-                    
-                    # Cek email baru
-                    await self.process_new_emails()
-                    
-                    # Cek dan notifikasi user yang expired
-                    await self.check_and_notify_expiring_users()
-                    
-                except Exception as e:
-                    logger.error(f"Error in main loop: {str(e)}")
-                
-                # Tunggu sesuai interval
-                await asyncio.sleep(self.check_interval)
+                    await self.metrics_server.start()
+                except OSError as e:
+                    logger.error(f"Endpoint metrik gagal dijalankan: {str(e)}")
+                    self.metrics_server = None
+            
+            # Tunggu sinyal berhenti (Ctrl+C / SIGTERM dari PM2)
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop_event.set)
+                except NotImplementedError:
+                    pass
+            
+            try:
+                await stop_event.wait()
+            finally:
+                await self.shutdown(application)
         
         # Jalankan bot
         asyncio.run(run_bot())